@@ -0,0 +1,328 @@
+import json
+import logging
+import socket
+import threading
+import time
+from datetime import datetime
+import requests
+import metrics
+from fleets import FLEET_INDEX
+
+logger = logging.getLogger(__name__)
+
+# State vectors from a local ADS-B receiver instead of OpenSky: the
+# SBS-1/BaseStation text stream (dump1090 and readsb serve it on port 30003)
+# over TCP or replayed from a file, or dump1090's aircraft.json over HTTP or
+# from disk. Messages are decoded as they arrive into one table of the
+# latest state per aircraft; fetch_aircraft_flights returns the fleet's rows
+# from it in the OpenSky /states/all shape, so the rest of the bot is unchanged.
+
+FEET_TO_M = 0.3048
+KNOTS_TO_MS = 0.514444
+FPM_TO_MS = 0.00508
+STATE_TTL = 300  # seconds without a message before an aircraft is dropped
+MAX_AGE = 60  # seconds; older states are not returned to the bot
+RECONNECT_BASE = 1  # seconds, doubled after every failed connection
+RECONNECT_CAP = 60
+READ_SIZE = 64 * 1024
+POSITION_SOURCE_ADSB = 0
+# Same field order as an OpenSky state vector
+ICAO24, CALLSIGN, ORIGIN_COUNTRY, TIME_POSITION, LAST_CONTACT, LONGITUDE, LATITUDE, BARO_ALTITUDE, \
+    ON_GROUND, VELOCITY, TRUE_TRACK, VERTICAL_RATE, SENSORS, GEO_ALTITUDE, SQUAWK, SPI, POSITION_SOURCE = range(17)
+
+MESSAGES = metrics.counter('adsb_messages', "Receiver messages decoded", ('format',))
+DECODE_ERRORS = metrics.counter('adsb_decode_errors', "Receiver messages that could not be decoded", ('format',))
+CONNECTS = metrics.counter('adsb_connects', "Connections made to the receiver")
+AIRCRAFT = metrics.gauge('adsb_aircraft', "Aircraft currently held from the receiver feed")
+
+
+def _number(text, scale=1.0):
+    return float(text) * scale if text not in (None, '') else None
+
+
+def _flag(text):
+    # SBS flags are -1 (set) or 0; some feeders write 1
+    text = (text or '').strip()
+    return text != '0' if text else None
+
+
+class AircraftTable:
+
+    def __init__(self, ttl=STATE_TTL):
+        self.ttl = ttl
+        self._states = {}
+        self._lock = threading.Lock()
+        AIRCRAFT.set_function(lambda: len(self._states))
+
+    def __len__(self):
+        return len(self._states)
+
+    def update(self, icao24, now, values, position=False):
+        # values: state vector index -> value; None values keep the last known one
+        icao24 = icao24.strip().lower()
+        if not icao24:
+            return
+        with self._lock:
+            state = self._states.get(icao24)
+            if state is None:
+                state = self._states[icao24] = [icao24] + [None] * 16
+                state[POSITION_SOURCE] = POSITION_SOURCE_ADSB
+            for index, value in values.items():
+                if value is not None:
+                    state[index] = value
+            state[LAST_CONTACT] = int(now)
+            if position:
+                state[TIME_POSITION] = int(now)
+
+    def states(self, icao24_set=None, max_age=MAX_AGE, now=None):
+        # Copies of the recent states with a position, for icao24_set or all
+        now = now or time.time()
+        with self._lock:
+            expired = [icao24 for icao24, state in self._states.items() if now - state[LAST_CONTACT] > self.ttl]
+            for icao24 in expired:
+                del self._states[icao24]
+            icao24s = self._states if icao24_set is None else (icao24 for icao24 in icao24_set if icao24 in self._states)
+            result = []
+            for icao24 in icao24s:
+                state = self._states[icao24]
+                if state[TIME_POSITION] is not None and now - state[LAST_CONTACT] <= max_age:
+                    result.append(list(state))
+            return result
+
+
+class SbsDecoder:
+    # Incremental decoder for SBS-1 BaseStation lines, e.g.
+    # MSG,3,1,1,4CA2D6,1,2024/05/01,12:00:00.000,2024/05/01,12:00:00.000,,37000,,,51.5,-0.4,,,0,0,0,0
+    # Bytes can be fed in arbitrary chunks; partial lines wait for the rest.
+
+    def __init__(self, table, clock=time.time):
+        self.table = table
+        self.clock = clock
+        self._partial = b''
+
+    def feed(self, data):
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.decode_line(line.decode('ascii', 'replace').strip())
+
+    def decode_line(self, line):
+        if not line.startswith('MSG,'):
+            return False
+        fields = line.split(',')
+        if len(fields) < 22:
+            DECODE_ERRORS.labels('sbs').inc()
+            return False
+        try:
+            latitude, longitude = _number(fields[14]), _number(fields[15])
+            altitude = _number(fields[11], FEET_TO_M)
+            self.table.update(fields[4], self.clock(), {
+                CALLSIGN: fields[10].strip() or None,
+                BARO_ALTITUDE: altitude,
+                VELOCITY: _number(fields[12], KNOTS_TO_MS),
+                TRUE_TRACK: _number(fields[13]),
+                LATITUDE: latitude,
+                LONGITUDE: longitude,
+                VERTICAL_RATE: _number(fields[16], FPM_TO_MS),
+                SQUAWK: fields[17].strip() or None,
+                SPI: _flag(fields[20]),
+                ON_GROUND: _flag(fields[21]),
+            }, position=latitude is not None and longitude is not None)
+        except ValueError:
+            DECODE_ERRORS.labels('sbs').inc()
+            return False
+        MESSAGES.labels('sbs').inc()
+        return True
+
+
+def apply_aircraft_json(table, document, clock=time.time):
+    # dump1090/readsb aircraft.json: {"now": ..., "aircraft": [{"hex": ..., ...}]}
+    now = clock()
+    for aircraft in document.get('aircraft', []):
+        if aircraft.get('hex', '').startswith('~'):
+            continue  # TIS-B addresses are not ICAO addresses
+        altitude = aircraft.get('alt_baro', aircraft.get('altitude'))
+        on_ground = altitude == 'ground'
+        position_age = aircraft.get('seen_pos')
+        try:
+            table.update(aircraft.get('hex', ''), now - (aircraft.get('seen') or 0), {
+                CALLSIGN: (aircraft.get('flight') or '').strip() or None,
+                BARO_ALTITUDE: 0.0 if on_ground else _number(altitude, FEET_TO_M),
+                GEO_ALTITUDE: _number(aircraft.get('alt_geom'), FEET_TO_M),
+                ON_GROUND: on_ground,
+                VELOCITY: _number(aircraft.get('gs', aircraft.get('speed')), KNOTS_TO_MS),
+                TRUE_TRACK: _number(aircraft.get('track')),
+                VERTICAL_RATE: _number(aircraft.get('baro_rate', aircraft.get('vert_rate')), FPM_TO_MS),
+                LATITUDE: aircraft.get('lat'),
+                LONGITUDE: aircraft.get('lon'),
+                SQUAWK: aircraft.get('squawk'),
+                SPI: aircraft.get('spi'),
+            }, position=aircraft.get('lat') is not None and position_age is not None and position_age < MAX_AGE)
+        except (TypeError, ValueError):
+            DECODE_ERRORS.labels('aircraft_json').inc()
+            continue
+        MESSAGES.labels('aircraft_json').inc()
+
+
+class FeedReader:
+    # Runs read() on a background thread until stop()
+
+    def __init__(self, table):
+        self.table = table
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'adsb-{type(self).__name__}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def _run(self):
+        try:
+            self.read()
+        except Exception as e:
+            logger.error(f"ADS-B feed reader failed: {e}", exc_info=True)
+
+    def read(self):
+        raise NotImplementedError
+
+
+class SbsTcpReader(FeedReader):
+
+    def __init__(self, table, host='127.0.0.1', port=30003):
+        super().__init__(table)
+        self.host = host
+        self.port = port
+
+    def read(self):
+        delay = RECONNECT_BASE
+        while not self.stopped:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=10) as connection:
+                    connection.settimeout(1)
+                    CONNECTS.inc()
+                    logger.info(f"Connected to SBS feed at {self.host}:{self.port}")
+                    delay = RECONNECT_BASE
+                    decoder = SbsDecoder(self.table)
+                    while not self.stopped:
+                        try:
+                            data = connection.recv(READ_SIZE)
+                        except socket.timeout:
+                            continue
+                        if not data:
+                            raise ConnectionError("connection closed by the receiver")
+                        decoder.feed(data)
+            except OSError as e:
+                if self.stopped:
+                    break
+                logger.warning(f"SBS feed at {self.host}:{self.port} unavailable ({e}). "
+                               f"Reconnecting in {delay} seconds...")
+                self._stop.wait(delay)
+                delay = min(RECONNECT_CAP, delay * 2)
+
+
+class SbsFileReader(FeedReader):
+    # Replays a recorded SBS stream. With speed > 0 the gaps between the
+    # messages' generated times are slept (divided by speed); either way
+    # states are stamped with the replay time, like a live feed.
+
+    def __init__(self, table, path, speed=1.0):
+        super().__init__(table)
+        self.path = path
+        self.speed = speed
+        self.finished = threading.Event()
+
+    def read(self):
+        decoder = SbsDecoder(self.table)
+        previous = None
+        with open(self.path, 'r', encoding='ascii', errors='replace') as f:
+            for line in f:
+                if self.stopped:
+                    break
+                if self.speed:
+                    fields = line.split(',')
+                    try:
+                        generated = datetime.strptime(f"{fields[6]} {fields[7]}", '%Y/%m/%d %H:%M:%S.%f').timestamp()
+                    except (IndexError, ValueError):
+                        generated = None
+                    if generated is not None:
+                        if previous is not None and generated > previous:
+                            self._stop.wait((generated - previous) / self.speed)
+                        previous = generated
+                decoder.decode_line(line.strip())
+        self.finished.set()
+        logger.info(f"Finished replaying {self.path}")
+
+
+class AircraftJsonReader(FeedReader):
+    # Polls aircraft.json from dump1090's web server (http://...) or a file path
+
+    def __init__(self, table, source, interval=1.0):
+        super().__init__(table)
+        self.source = source
+        self.interval = interval
+        self.session = requests.Session() if source.startswith(('http://', 'https://')) else None
+
+    def load(self):
+        if self.session is not None:
+            response = self.session.get(self.source, timeout=(5, 10))
+            response.raise_for_status()
+            return response.json()
+        with open(self.source, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read(self):
+        while not self.stopped:
+            try:
+                apply_aircraft_json(self.table, self.load())
+            except (OSError, ValueError, requests.exceptions.RequestException) as e:
+                DECODE_ERRORS.labels('aircraft_json').inc()
+                logger.warning(f"Could not read {self.source}: {e}")
+            self._stop.wait(self.interval)
+
+
+def create_reader(table, settings):
+    # settings: {'format': 'sbs', 'host': ..., 'port': 30003} or
+    # {'format': 'sbs', 'path': ..., 'speed': 1} or
+    # {'format': 'aircraft_json', 'url': ... (or 'path': ...), 'interval': 1}
+    settings = dict(settings)
+    feed_format = settings.pop('format', 'sbs')
+    if feed_format == 'sbs':
+        if 'path' in settings:
+            return SbsFileReader(table, settings['path'], settings.get('speed', 1.0))
+        return SbsTcpReader(table, settings.get('host', '127.0.0.1'), settings.get('port', 30003))
+    if feed_format == 'aircraft_json':
+        return AircraftJsonReader(table, settings.get('url') or settings['path'], settings.get('interval', 1.0))
+    raise ValueError(f"Unknown ADS-B feed format '{feed_format}'")
+
+
+class AdsbFeed:
+
+    def __init__(self, settings, table=None):
+        self.table = table or AircraftTable()
+        self.reader = create_reader(self.table, settings)
+
+    def start(self):
+        self.reader.start()
+
+    def stop(self):
+        self.reader.stop()
+
+    def fetch_aircraft_flights(self):
+        # Same contract as opensky_api.fetch_aircraft_flights
+        icao24_set = FLEET_INDEX.refresh()
+        if not icao24_set:
+            logger.warning("No valid ICAO24 codes found for any configured fleet.")
+            return []
+        aircraft_flights = self.table.states(icao24_set)
+        logger.info(f"Filtered {len(aircraft_flights)} fleet flights from {len(self.table)} aircraft in the ADS-B feed.")
+        return aircraft_flights
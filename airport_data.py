@@ -0,0 +1,226 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+from airport_index import AirportIndex, build_tree, to_unit_vector
+
+logger = logging.getLogger(__name__)
+
+# Compact columnar airport database. All sections are 8-byte aligned:
+#   header: magic, version, byte order, flags, airport count
+#   lat, lon: float64[count], sorted by airport code
+#   when FLAG_INDEX is set: KD-tree order uint32[count], split axes uint8[count],
+#   and unit-vector columns x, y, z float64[count] in tree order
+#   string columns code, name, city, country: uint32 offsets[count + 1] + UTF-8 blob
+MAGIC = b'APDB'
+VERSION = 1
+FLAG_INDEX = 1
+HEADER = struct.Struct('<4sIBxxxII')
+STRING_FIELDS = ('code', 'name', 'city', 'country')
+BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class StringColumn:
+    # Read-only sequence of strings backed by an offset table and a UTF-8 blob
+
+    def __init__(self, buffer, offsets, blob_start):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._blob_start = blob_start
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        start = self._blob_start + self._offsets[i]
+        end = self._blob_start + self._offsets[i + 1]
+        return str(self._buffer[start:end], 'utf-8')
+
+
+class AirportTable:
+    # Airport columns sorted by code. Supports the same `code in db` and
+    # `db[code]['lat']` access as the JSON dict without materializing a dict
+    # per airport.
+
+    def __init__(self, codes, names, cities, countries, lats, lons, index_data=None, buffer=None):
+        self.codes = codes
+        self.names = names
+        self.cities = cities
+        self.countries = countries
+        self.lats = lats
+        self.lons = lons
+        self._index_data = index_data
+        self._index = None
+        self._buffer = buffer  # keeps the memory map alive
+
+    @classmethod
+    def from_dict(cls, airport_db):
+        codes = sorted(airport_db)
+        rows = [airport_db[code] for code in codes]
+        return cls(
+            codes,
+            [row.get('name', 'Unknown') for row in rows],
+            [row.get('city', 'Unknown') for row in rows],
+            [row.get('country', 'Unknown') for row in rows],
+            array('d', (row['lat'] for row in rows)),
+            array('d', (row['lon'] for row in rows)),
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __bool__(self):
+        return len(self.codes) > 0
+
+    def row_for(self, code):
+        row = bisect.bisect_left(self.codes, code)
+        if row < len(self.codes) and self.codes[row] == code:
+            return row
+        return -1
+
+    def __contains__(self, code):
+        return self.row_for(code) >= 0
+
+    def row(self, row):
+        return {
+            'name': self.names[row],
+            'city': self.cities[row],
+            'country': self.countries[row],
+            'lat': self.lats[row],
+            'lon': self.lons[row],
+        }
+
+    def __getitem__(self, code):
+        row = self.row_for(code)
+        if row < 0:
+            raise KeyError(code)
+        return self.row(row)
+
+    def get(self, code, default=None):
+        row = self.row_for(code)
+        return self.row(row) if row >= 0 else default
+
+    @property
+    def index(self):
+        # Built (or wrapped from the precomputed file section) on first use
+        if self._index is None:
+            if self._index_data is not None:
+                self._index = AirportIndex(self.codes, *self._index_data)
+            else:
+                self._index = AirportIndex.build(self.codes, self.lats, self.lons)
+        return self._index
+
+
+def write_compact_airport_db(airport_db, filename, include_index=True):
+    codes = sorted(airport_db)
+    rows = [airport_db[code] for code in codes]
+    lats = array('d', (row['lat'] for row in rows))
+    lons = array('d', (row['lon'] for row in rows))
+
+    sections = [lats.tobytes(), lons.tobytes()]
+    flags = 0
+    if include_index:
+        flags |= FLAG_INDEX
+        vectors = [to_unit_vector(lat, lon) for lat, lon in zip(lats, lons)]
+        order, axes = build_tree(vectors)
+        sections.append(array('I', order).tobytes())
+        sections.append(bytes(axes))
+        for axis in range(3):
+            sections.append(array('d', (vectors[i][axis] for i in order)).tobytes())
+
+    for field in STRING_FIELDS:
+        encoded = [(code if field == 'code' else str(row.get(field, 'Unknown'))).encode('utf-8')
+                   for code, row in zip(codes, rows)]
+        offsets = array('I', [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        sections.append(offsets.tobytes())
+        sections.append(b''.join(encoded))
+
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, flags, len(codes)))
+        for section in sections:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(section)
+    os.replace(tmp_filename, filename)
+
+
+def open_compact_airport_db(filename):
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, byte_order, flags, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{filename} is not a version {VERSION} compact airport database")
+    if byte_order != BYTE_ORDER:
+        raise ValueError(f"{filename} was written on a host with a different byte order")
+
+    view = memoryview(buffer)
+    offset = HEADER.size
+
+    def take(fmt, length, itemsize):
+        nonlocal offset
+        offset = _align(offset)
+        section = view[offset:offset + length * itemsize].cast(fmt)
+        offset += length * itemsize
+        return section
+
+    lats = take('d', count, 8)
+    lons = take('d', count, 8)
+
+    index_data = None
+    if flags & FLAG_INDEX:
+        order = take('I', count, 4)
+        axes = take('B', count, 1)
+        xs = take('d', count, 8)
+        ys = take('d', count, 8)
+        zs = take('d', count, 8)
+        index_data = (order, axes, xs, ys, zs)
+
+    columns = []
+    for _ in STRING_FIELDS:
+        offsets = take('I', count + 1, 4)
+        blob_start = _align(offset)
+        columns.append(StringColumn(buffer, offsets, blob_start))
+        offset = blob_start + offsets[count]
+
+    codes, names, cities, countries = columns
+    return AirportTable(codes, names, cities, countries, lats, lons, index_data, buffer)
+
+
+def load_airport_table(compact_filename, json_filename):
+    # Prefer the memory-mapped compact file; fall back to parsing the JSON
+    if os.path.exists(compact_filename):
+        try:
+            table = open_compact_airport_db(compact_filename)
+            logger.info(f"Mapped {len(table)} airports from {compact_filename}")
+            return table
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Could not map {compact_filename}, falling back to {json_filename}: {e}")
+    try:
+        with open(json_filename, 'r') as f:
+            airport_db = json.load(f)
+    except FileNotFoundError:
+        logger.warning("Airport database not found. Please run update_airport_db.py first.")
+        return AirportTable.from_dict({})
+    table = AirportTable.from_dict(airport_db)
+    logger.info(f"Loaded {len(table)} airports from {json_filename}")
+    # The compact file is generated, not shipped: build it for this host on
+    # first run (or after a byte order mismatch) so later starts can map it
+    try:
+        write_compact_airport_db(airport_db, compact_filename)
+        logger.info(f"Wrote {compact_filename}")
+    except OSError as e:
+        logger.warning(f"Could not write {compact_filename}: {e}")
+    return table
@@ -0,0 +1,170 @@
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371
+LEAF_SIZE = 8
+
+
+def distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    return EARTH_RADIUS_KM * c
+
+
+def to_unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord_sq):
+    # Squared straight-line distance between unit vectors -> great-circle km
+    chord = math.sqrt(chord_sq)
+    return EARTH_RADIUS_KM * 2 * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord_sq(km):
+    angle = min(math.pi, km / EARTH_RADIUS_KM)
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+def build_tree(vectors):
+    order = list(range(len(vectors)))
+    axes = [0] * len(vectors)
+    stack = [(0, len(order))]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo <= LEAF_SIZE:
+            continue
+        chunk = order[lo:hi]
+        spreads = []
+        for axis in range(3):
+            values = [vectors[i][axis] for i in chunk]
+            spreads.append(max(values) - min(values))
+        axis = spreads.index(max(spreads))
+        chunk.sort(key=lambda i: vectors[i][axis])
+        order[lo:hi] = chunk
+        mid = (lo + hi) // 2
+        axes[mid] = axis
+        stack.append((lo, mid))
+        stack.append((mid + 1, hi))
+    return order, axes
+
+
+class AirportIndex:
+    # KD-tree over airport positions projected onto the unit sphere. Euclidean
+    # (chord) distance in 3D is monotonic in great-circle distance, so the
+    # nearest point by chord is exactly the nearest airport by haversine.
+    # The tree is implicit: the range [lo, hi) of self.order is split at
+    # mid = (lo + hi) // 2 along self.axes[mid]; ranges of LEAF_SIZE or fewer
+    # points are scanned linearly. Coordinates are stored in tree order as
+    # three flat columns, which can come straight from a memory-mapped file.
+
+    def __init__(self, codes, order, axes, xs, ys, zs):
+        self.codes = codes
+        self.size = len(order)
+        self.order = order
+        self.axes = axes
+        self._columns = (xs, ys, zs)
+
+    @classmethod
+    def build(cls, codes, lats, lons):
+        vectors = [to_unit_vector(lat, lon) for lat, lon in zip(lats, lons)]
+        order, axes = build_tree(vectors)
+        xs, ys, zs = ([vectors[i][axis] for i in order] for axis in range(3))
+        return cls(codes, order, axes, xs, ys, zs)
+
+    @classmethod
+    def from_airport_db(cls, airport_db):
+        codes = list(airport_db)
+        lats = [airport_db[code]['lat'] for code in codes]
+        lons = [airport_db[code]['lon'] for code in codes]
+        return cls.build(codes, lats, lons)
+
+    def __len__(self):
+        return self.size
+
+    def _search(self, query, bound, visit):
+        # Generic branch-and-bound walk. `bound()` returns the current pruning
+        # radius (squared chord); `visit(pos, d2)` is called for each candidate.
+        qx, qy, qz = query
+        xs, ys, zs = self._columns
+        columns = self._columns
+        axes = self.axes
+        stack = [(0, self.size, 0.0)]
+        while stack:
+            lo, hi, min_d2 = stack.pop()
+            if min_d2 > bound():
+                continue
+            if hi - lo <= LEAF_SIZE:
+                for pos in range(lo, hi):
+                    d2 = (xs[pos] - qx) ** 2 + (ys[pos] - qy) ** 2 + (zs[pos] - qz) ** 2
+                    if d2 <= bound():
+                        visit(pos, d2)
+                continue
+            mid = (lo + hi) // 2
+            d2 = (xs[mid] - qx) ** 2 + (ys[mid] - qy) ** 2 + (zs[mid] - qz) ** 2
+            if d2 <= bound():
+                visit(mid, d2)
+            axis = axes[mid]
+            diff = query[axis] - columns[axis][mid]
+            far_d2 = max(min_d2, diff * diff)
+            if diff < 0:
+                stack.append((mid + 1, hi, far_d2))
+                stack.append((lo, mid, min_d2))
+            else:
+                stack.append((lo, mid, far_d2))
+                stack.append((mid + 1, hi, min_d2))
+
+    def nearest(self, latitude, longitude):
+        if not self.size:
+            return None
+        best = [math.inf, -1]
+
+        def bound():
+            return best[0]
+
+        def visit(pos, d2):
+            if d2 < best[0]:
+                best[0] = d2
+                best[1] = pos
+
+        self._search(to_unit_vector(latitude, longitude), bound, visit)
+        return (self.codes[self.order[best[1]]], chord_to_km(best[0]))
+
+    def k_nearest(self, latitude, longitude, k):
+        if not self.size or k <= 0:
+            return []
+        heap = []  # max-heap of (-d2, pos) holding the k best so far
+
+        def bound():
+            return -heap[0][0] if len(heap) == k else math.inf
+
+        def visit(pos, d2):
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, pos))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, pos))
+
+        self._search(to_unit_vector(latitude, longitude), bound, visit)
+        return [(self.codes[self.order[pos]], chord_to_km(-neg_d2))
+                for neg_d2, pos in sorted(heap, reverse=True)]
+
+    def within_radius(self, latitude, longitude, radius_km):
+        if not self.size or radius_km < 0:
+            return []
+        limit = km_to_chord_sq(radius_km)
+        found = []
+
+        def bound():
+            return limit
+
+        def visit(pos, d2):
+            found.append((d2, pos))
+
+        self._search(to_unit_vector(latitude, longitude), bound, visit)
+        found.sort()
+        return [(self.codes[self.order[pos]], chord_to_km(d2)) for d2, pos in found]
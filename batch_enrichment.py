@@ -0,0 +1,138 @@
+import numpy as np
+from datetime import datetime, timedelta
+from airport_index import EARTH_RADIUS_KM
+from track_history import MIN_ETA_SPEED_MS
+
+CRUISE_SPEED_KMH = 800  # Assumed average speed for landing estimates
+CHUNK_SIZE = 64  # Flights per distance matrix, bounds memory to CHUNK_SIZE x airports
+
+
+class AirportArrays:
+    # Airport coordinates held as NumPy columns so a whole poll cycle can be
+    # matched against every airport with array operations. The columns are
+    # zero-copy views when the table is memory-mapped.
+
+    def __init__(self, table):
+        self.table = table
+        self.codes = table.codes
+        self.lats = np.asarray(table.lats, dtype=np.float64)
+        self.lons = np.asarray(table.lons, dtype=np.float64)
+        self.vectors = unit_vectors(self.lats, self.lons)
+
+    def row_for(self, code):
+        return self.table.row_for(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def unit_vectors(lats, lons):
+    lat = np.radians(lats)
+    lon = np.radians(lons)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_airports(airports, lats, lons):
+    # The largest dot product between unit vectors is the smallest great-circle
+    # distance, so each chunk is one matrix product plus an argmax.
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    rows = np.empty(len(lats), dtype=np.intp)
+    queries = unit_vectors(lats, lons)
+    for start in range(0, len(lats), CHUNK_SIZE):
+        block = queries[start:start + CHUNK_SIZE]
+        rows[start:start + CHUNK_SIZE] = np.argmax(block @ airports.vectors.T, axis=1)
+    distances = haversine_km(lats, lons, airports.lats[rows], airports.lons[rows])
+    return rows, distances
+
+
+def guess_destination_rows(airports, callsigns):
+    # Placeholder heuristic (the callsign suffix), used when no route inference is given
+    rows = np.full(len(callsigns), -1, dtype=np.intp)
+    for i, callsign in enumerate(callsigns):
+        callsign = (callsign or '').strip()
+        if len(callsign) > 3:
+            rows[i] = airports.row_for(callsign[-3:])
+    return rows
+
+
+def estimate_flight_hours(airports, lats, lons, dest_rows, speeds_kmh=None):
+    # speeds_kmh: measured ground speeds, NaN where unknown (cruise speed is assumed)
+    hours = np.full(len(dest_rows), np.nan)
+    known = dest_rows >= 0
+    if known.any():
+        rows = dest_rows[known]
+        dist = haversine_km(np.asarray(lats)[known], np.asarray(lons)[known],
+                            airports.lats[rows], airports.lons[rows])
+        speeds = np.full(len(rows), float(CRUISE_SPEED_KMH))
+        if speeds_kmh is not None:
+            measured = np.asarray(speeds_kmh, dtype=np.float64)[known]
+            speeds = np.where(np.isnan(measured), speeds, measured)
+        hours[known] = dist / speeds
+    return hours
+
+
+def infer_destination_rows(airports, routes, flights_data):
+    # Destination rows and expected route durations (seconds, NaN if unknown)
+    # from a route_inference.RouteInference; needs 'origin' already set
+    rows = np.full(len(flights_data), -1, dtype=np.intp)
+    durations = np.full(len(flights_data), np.nan)
+    for i, flight_data in enumerate(flights_data):
+        destination, duration = routes.infer(flight_data)
+        if destination is not None:
+            rows[i] = airports.row_for(destination)
+        if duration is not None:
+            durations[i] = duration
+    return rows, durations
+
+
+def enrich_flights(flights_data, airports, routes=None):
+    if not flights_data:
+        return []
+    if not len(airports):
+        for flight_data in flights_data:
+            flight_data['origin'] = "UNK"
+            flight_data['origin_city'] = "Unknown City"
+            flight_data['origin_country'] = "Unknown Country"
+            flight_data['destination'] = None
+            flight_data['estimated_landing_time'] = None
+        return flights_data
+
+    lats = np.array([f['latitude'] for f in flights_data], dtype=np.float64)
+    lons = np.array([f['longitude'] for f in flights_data], dtype=np.float64)
+    # The origin is matched at the takeoff point from the track history when known
+    takeoff_lats = np.array([f.get('takeoff_latitude', f['latitude']) for f in flights_data], dtype=np.float64)
+    takeoff_lons = np.array([f.get('takeoff_longitude', f['longitude']) for f in flights_data], dtype=np.float64)
+    speeds = np.array([f['ground_speed'] * 3.6 if (f.get('ground_speed') or 0) >= MIN_ETA_SPEED_MS else np.nan
+                       for f in flights_data], dtype=np.float64)
+
+    origin_rows, _ = nearest_airports(airports, takeoff_lats, takeoff_lons)
+    for flight_data, origin_row in zip(flights_data, origin_rows):
+        flight_data['origin'] = airports.codes[origin_row]
+        flight_data['origin_city'] = airports.table.cities[origin_row]
+        flight_data['origin_country'] = airports.table.countries[origin_row]
+
+    if routes is not None:
+        dest_rows, durations = infer_destination_rows(airports, routes, flights_data)
+    else:
+        dest_rows = guess_destination_rows(airports, [f['callsign'] for f in flights_data])
+        durations = np.full(len(flights_data), np.nan)
+    hours = estimate_flight_hours(airports, lats, lons, dest_rows, speeds)
+    # A known route's average duration, counted from the takeoff, beats distance over speed
+    now_ts = datetime.now().timestamp()
+    takeoff_ts = np.array([f.get('takeoff_timestamp') or now_ts for f in flights_data], dtype=np.float64)
+    by_route = ~np.isnan(durations)
+    hours[by_route] = np.maximum(0.0, (takeoff_ts[by_route] + durations[by_route] - now_ts) / 3600)
+
+    now = datetime.now()
+    for flight_data, dest_row, flight_hours in zip(flights_data, dest_rows, hours):
+        flight_data['destination'] = airports.codes[dest_row] if dest_row >= 0 else None
+        flight_data['estimated_landing_time'] = None if np.isnan(flight_hours) else now + timedelta(hours=float(flight_hours))
+    return flights_data
@@ -0,0 +1,79 @@
+import argparse
+import json
+import logging
+import random
+import time
+from airport_index import AirportIndex, distance
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+AIRPORT_DB_FILENAME = "airport_db.json"
+
+def linear_nearest(airport_db, latitude, longitude):
+    # The original get_airport_info scan, kept here as the baseline
+    return min(airport_db.items(), key=lambda x: distance(latitude, longitude, x[1]['lat'], x[1]['lon']))[0]
+
+def random_points(count, seed):
+    rng = random.Random(seed)
+    return [(rng.uniform(-85, 85), rng.uniform(-180, 180)) for _ in range(count)]
+
+def run_benchmark(airport_db, queries, seed):
+    points = random_points(queries, seed)
+
+    start = time.perf_counter()
+    index = AirportIndex.from_airport_db(airport_db)
+    build_time = time.perf_counter() - start
+    logger.info(f"Built index over {len(index)} airports in {build_time * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    linear_results = [linear_nearest(airport_db, lat, lon) for lat, lon in points]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_results = [index.nearest(lat, lon)[0] for lat, lon in points]
+    index_time = time.perf_counter() - start
+
+    # Ties between equidistant airports may resolve differently, so compare distances
+    mismatches = 0
+    for (lat, lon), linear_code, index_code in zip(points, linear_results, index_results):
+        linear_km = distance(lat, lon, airport_db[linear_code]['lat'], airport_db[linear_code]['lon'])
+        index_km = distance(lat, lon, airport_db[index_code]['lat'], airport_db[index_code]['lon'])
+        if abs(linear_km - index_km) > 1e-6:
+            mismatches += 1
+
+    logger.info(f"Linear scan: {linear_time:.3f} s for {queries} lookups ({linear_time / queries * 1000:.3f} ms/lookup)")
+    logger.info(f"KD-tree:     {index_time:.3f} s for {queries} lookups ({index_time / queries * 1000:.3f} ms/lookup)")
+    logger.info(f"Speedup: {linear_time / index_time:.1f}x, mismatches: {mismatches}")
+
+    start = time.perf_counter()
+    for lat, lon in points:
+        index.k_nearest(lat, lon, 5)
+    logger.info(f"k_nearest(k=5): {(time.perf_counter() - start) / queries * 1000:.3f} ms/lookup")
+
+    start = time.perf_counter()
+    for lat, lon in points:
+        index.within_radius(lat, lon, 50)
+    logger.info(f"within_radius(50 km): {(time.perf_counter() - start) / queries * 1000:.3f} ms/lookup")
+
+    return mismatches == 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare KD-tree airport lookups with the linear scan.")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=747)
+    args = parser.parse_args()
+
+    try:
+        with open(AIRPORT_DB_FILENAME, 'r') as f:
+            airport_db = json.load(f)
+    except FileNotFoundError:
+        logger.error("Airport database not found. Please run update_airport_db.py first.")
+        return
+
+    if not run_benchmark(airport_db, args.queries, args.seed):
+        logger.error("KD-tree results differ from the linear scan.")
+
+if __name__ == "__main__":
+    main()
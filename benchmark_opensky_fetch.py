@@ -0,0 +1,70 @@
+import argparse
+import json
+import logging
+import random
+import time
+import tracemalloc
+from fake_opensky_server import make_synthetic_states, start_fake_opensky_server
+from opensky_api import fetch_all_states, fetch_states_by_icao24, STREAM_CHUNK_SIZE
+from states_stream import parse_states_stream
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def measure(server, label, fetch, rounds):
+    server.reset_stats()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fetch()
+    elapsed = (time.perf_counter() - start) / rounds
+    logger.info(f"{label}: {len(result)} fleet states, {server.requests_served // rounds} requests, "
+                f"{server.bytes_served / rounds / 1024:.1f} KiB, {elapsed * 1000:.1f} ms per poll")
+    return result, server.bytes_served / rounds, elapsed
+
+def measure_parser(label, parse):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = parse()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    logger.info(f"{label}: {len(result)} fleet states, {elapsed * 1000:.1f} ms, peak {peak / 1024:.0f} KiB")
+    return result
+
+def compare_parsers(states, fleet):
+    # Parse the same full body from 64 KiB chunks, as it arrives off the socket
+    body = json.dumps({'time': 0, 'states': states}).encode('utf-8')
+    chunks = [body[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(body), STREAM_CHUNK_SIZE)]
+    full = measure_parser("json.loads + filter", lambda: [state for state in json.loads(b''.join(chunks))['states'] if state[0] in fleet])
+    streamed = measure_parser("Streaming parser", lambda: parse_states_stream(chunks, fleet)[1])
+    if full != streamed:
+        logger.error("Streaming parser returned different states than json.loads.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full /states/all downloads with fleet-filtered queries.")
+    parser.add_argument('--states', type=int, default=12000, help="global traffic size")
+    parser.add_argument('--fleet', type=int, default=400, help="tracked aircraft")
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    states = make_synthetic_states(args.states)
+    fleet = {state[0] for state in random.Random(1).sample(states, args.fleet)}
+    server = start_fake_opensky_server(states)
+    # Silence per-request logging from opensky_api while measuring
+    logging.getLogger('opensky_api').setLevel(logging.WARNING)
+    try:
+        full, full_bytes, full_time = measure(server, "Full download", lambda: fetch_all_states(fleet, server.base_url), args.rounds)
+        filtered, filtered_bytes, filtered_time = measure(server, "icao24 filtered", lambda: fetch_states_by_icao24(fleet, server.base_url), args.rounds)
+    finally:
+        server.shutdown()
+
+    compare_parsers(states, fleet)
+
+    if sorted(map(tuple, full)) != sorted(map(tuple, filtered)):
+        logger.error("Filtered fetch returned different states than the full download.")
+    logger.info(f"Bandwidth saved: {(1 - filtered_bytes / full_bytes) * 100:.1f}%, "
+                f"time per poll: {full_time / filtered_time:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import multiprocessing
+from replay_harness import ReplayDriver, simulate_snapshots, fleet_sample, log_report
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# End-to-end throughput of the bot on synthetic moving traffic, for a range
+# of fleet sizes. Each run gets a fresh process, so peak RSS and the
+# databases are per run.
+
+def run_benchmark(states, cycles, fleet_size):
+    snapshots = list(simulate_snapshots(states, cycles))
+    driver = ReplayDriver(fleet_sample(snapshots, fleet_size))
+    try:
+        return driver.run(snapshots)
+    finally:
+        driver.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the poll pipeline end to end.")
+    parser.add_argument('--states', type=int, default=12000, help="global traffic size")
+    parser.add_argument('--cycles', type=int, default=12)
+    parser.add_argument('--fleets', type=int, nargs='+', default=[100, 1000, 5000], help="tracked aircraft per run")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for fleet_size in args.fleets:
+        with context.Pool(1) as pool:
+            report = pool.apply(run_benchmark, (args.states, args.cycles, fleet_size))
+        logger.info(f"Fleet of {fleet_size}:")
+        log_report(report)
+        results.append((fleet_size, report))
+
+    logger.info("fleet  states/s  process p95 ms  peak RSS MiB  SQLite changes")
+    for fleet_size, report in results:
+        process = report['stages'].get('process', {})
+        logger.info(f"{fleet_size:>5}  {report['states_per_s']:>8.0f}  {process.get('p95_ms', 0):>14.2f}  "
+                    f"{report['peak_rss_mib']:>12.1f}  {report['sqlite_changes']:>14}")
+
+if __name__ == "__main__":
+    main()
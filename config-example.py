@@ -5,4 +5,58 @@ OPENSKY_API_USER = 'your_username'
 OPENSKY_API_PASS = 'your_password'
 
 # Aircraft type configuration
-AIRCRAFT_TYPE = 'Boeing 747'
\ No newline at end of file
+AIRCRAFT_TYPE = 'Boeing 747'
+
+# Fleets to track, all matched against one OpenSky fetch. Each fleet takes its
+# aircraft from a CSV with an icao24 column and/or an explicit icao24 list, may
+# be narrowed to callsign prefixes (airlines), and has its own message template
+# and networks (None posts to every network in PUBLISHERS). An aircraft in
+# several fleets is announced by each of them, so overlapping fleets should
+# post to different networks. update_aircraft_db.py writes the CSV of every
+# fleet with a 'filter' of typecode/model prefixes.
+# Without FLEETS only AIRCRAFT_TYPE from boeing_747_icao.csv is tracked.
+FLEETS = {
+    '747': {'aircraft_type': AIRCRAFT_TYPE, 'csv': 'boeing_747_icao.csv',
+            'filter': {'typecode_prefixes': ['B74'], 'model_prefixes': ['747']}},
+    # 'a380': {'aircraft_type': 'Airbus A380', 'csv': 'airbus_a380_icao.csv', 'publishers': ['twitter'],
+    #          'filter': {'typecode_prefixes': ['A388'], 'model_prefixes': ['A380']}},
+    # Overlaps '747'; enable it with separate 'publishers' lists on both fleets
+    # 'lufthansa-747': {'aircraft_type': 'Lufthansa 747', 'csv': 'boeing_747_icao.csv',
+    #                   'callsign_prefixes': ['DLH'], 'publishers': ['twitter-dryrun'],
+    #                   'template': "Lufthansa's {aircraft_type} {callsign} is airborne from {origin}."},
+}
+
+# Seconds between polls; sub-minute values are fine, rounded up to a multiple
+# of OpenSky's 5 second update cadence
+POLL_INTERVAL_SECONDS = 300
+
+# OpenSky fetch mode: 'icao24' requests only the tracked fleet, 'bbox' requests
+# the bounding boxes below, 'all' downloads every state vector
+OPENSKY_FETCH_MODE = 'icao24'
+OPENSKY_BOUNDING_BOXES = []  # e.g. [(lamin, lomin, lamax, lomax)]
+
+# Social networks to post to. 'type' selects a registered publisher (defaults
+# to the network name); 'rate_limit' is (posts, per_seconds)
+PUBLISHERS = {
+    'twitter': {},
+    # 'twitter-dryrun': {'type': 'fake', 'latency': 0.2},
+}
+
+# Prometheus-style metrics at http://127.0.0.1:<port>/metrics (None disables).
+# The same server toggles a sampling profiler: /profile/start, /profile/stop.
+METRICS_PORT = None
+# Start the sampling profiler with the bot
+METRICS_PROFILE = False
+
+# Worker processes for large fleets: each runs detection and enrichment for
+# its share of the aircraft, and one writer process owns flights.db. 0 keeps
+# everything in one process.
+TRACKER_WORKERS = 0
+
+# Read a local ADS-B receiver instead of polling OpenSky. SBS-1/BaseStation
+# over TCP (dump1090/readsb port 30003), an SBS recording, or aircraft.json:
+# ADSB_FEED = {'format': 'sbs', 'host': '127.0.0.1', 'port': 30003}
+# ADSB_FEED = {'format': 'sbs', 'path': 'recording.sbs', 'speed': 1}
+# ADSB_FEED = {'format': 'aircraft_json', 'url': 'http://127.0.0.1:8080/data/aircraft.json'}
+ADSB_FEED = None
+ADSB_POLL_INTERVAL_SECONDS = 5
@@ -0,0 +1,142 @@
+import argparse
+import json
+import logging
+import random
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# A local stand-in for the OpenSky /api/states/all endpoint. It understands
+# the icao24 and lamin/lomin/lamax/lomax filters and counts what it serves,
+# so fetch modes can be compared without touching the real API.
+
+def make_synthetic_states(count, seed=747, timestamp=None):
+    rng = random.Random(seed)
+    timestamp = int(timestamp or time.time())
+    states = []
+    seen = set()
+    while len(states) < count:
+        icao24 = '%06x' % rng.randrange(0x1000000)
+        if icao24 in seen:
+            continue
+        seen.add(icao24)
+        on_ground = rng.random() < 0.1
+        callsign = ''.join(rng.choice(string.ascii_uppercase) for _ in range(3)) + str(rng.randrange(10, 9999))
+        states.append([
+            icao24, callsign.ljust(8), rng.choice(['United States', 'Germany', 'China', 'Brazil', 'Japan']),
+            timestamp - rng.randrange(0, 30), timestamp - rng.randrange(0, 30),
+            round(rng.uniform(-180, 180), 4), round(rng.uniform(-60, 70), 4),
+            0.0 if on_ground else round(rng.uniform(300, 12500), 2), on_ground,
+            round(rng.uniform(0, 15), 2) if on_ground else round(rng.uniform(80, 280), 2),
+            round(rng.uniform(0, 360), 2), round(rng.uniform(-15, 15), 2), None,
+            None if on_ground else round(rng.uniform(300, 12800), 2),
+            '%04d' % rng.randrange(10000), False, 0,
+        ])
+    return states
+
+
+class FakeOpenSkyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, states, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeOpenSkyHandler)
+        self.states = states
+        self.timestamp = int(time.time())
+        self.stats_lock = threading.Lock()
+        self.requests_served = 0
+        self.bytes_served = 0
+        self.credits = 4000
+        self.credit_cost = 1
+        self.queued_errors = []  # status codes to return before serving data
+        self.retry_after_seconds = 0  # X-Rate-Limit-Retry-After-Seconds sent with a queued 429
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def select_states(self, query):
+        states = self.states
+        if 'icao24' in query:
+            wanted = {value.lower() for value in query['icao24']}
+            states = [state for state in states if state[0] in wanted]
+        if 'lamin' in query:
+            lamin, lomin = float(query['lamin'][0]), float(query['lomin'][0])
+            lamax, lomax = float(query['lamax'][0]), float(query['lomax'][0])
+            states = [state for state in states if state[6] is not None and state[5] is not None
+                      and lamin <= state[6] <= lamax and lomin <= state[5] <= lomax]
+        return states
+
+    def record(self, size):
+        with self.stats_lock:
+            self.requests_served += 1
+            self.bytes_served += size
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.requests_served = 0
+            self.bytes_served = 0
+
+
+class FakeOpenSkyHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/api/states/all':
+            self.send_error(404)
+            return
+        with self.server.stats_lock:
+            error = self.server.queued_errors.pop(0) if self.server.queued_errors else None
+            if error is None:
+                self.server.credits -= self.server.credit_cost
+            credits = self.server.credits
+        if error is not None:
+            self.send_response(error)
+            if error == 429:
+                self.send_header('X-Rate-Limit-Retry-After-Seconds', str(self.server.retry_after_seconds))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        states = self.server.select_states(parse_qs(url.query))
+        body = json.dumps({'time': self.server.timestamp, 'states': states or None}).encode('utf-8')
+        self.server.record(len(body))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Rate-Limit-Remaining', str(credits))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_fake_opensky_server(states, port=0):
+    server = FakeOpenSkyServer(states, port=port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic OpenSky state vectors locally.")
+    parser.add_argument('--port', type=int, default=8747)
+    parser.add_argument('--states', type=int, default=12000)
+    args = parser.parse_args()
+
+    server = FakeOpenSkyServer(make_synthetic_states(args.states), port=args.port)
+    logger.info(f"Serving {args.states} synthetic states at {server.base_url}/states/all")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Fake OpenSky server stopped by user.")
+
+if __name__ == "__main__":
+    main()
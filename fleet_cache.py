@@ -0,0 +1,46 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def parse_icao24_csv(content):
+    # content is the raw CSV bytes; returns a frozenset of lowercased codes
+    reader = csv.DictReader(io.StringIO(content.decode('utf-8', errors='replace')))
+    column = next((name for name in reader.fieldnames or [] if 'icao24' in name.lower()), None)
+    if column is None:
+        return frozenset()
+    return frozenset(code for code in (row[column].strip().strip("'").lower() for row in reader) if code)
+
+
+class FleetCache:
+    # Holds a fleet's icao24 set in memory. The file is only re-read when its
+    # mtime or size changes, and only re-parsed when its content hash changes,
+    # so an update_aircraft_db.py run is picked up without a restart.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat_key = None
+        self._digest = None
+        self._icao24s = frozenset()
+
+    def get(self):
+        stat = os.stat(self.path)  # FileNotFoundError propagates to the caller
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stat_key == self._stat_key:
+                return self._icao24s
+            with open(self.path, 'rb') as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if digest != self._digest:
+                self._icao24s = parse_icao24_csv(content)
+                self._digest = digest
+                logger.info(f"Loaded {len(self._icao24s)} ICAO24 codes from {self.path}")
+            self._stat_key = stat_key
+            return self._icao24s
@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import config
+from fleet_cache import FleetCache
+from publishers import DEFAULT_PUBLISHERS
+
+logger = logging.getLogger(__name__)
+
+# Every configured fleet is matched against the same fetched state set. The
+# fleets' icao24 sets are merged into one dict from icao24 to the fleets that
+# contain it, so a poll costs one fetch and one lookup per state vector no
+# matter how many fleets are tracked.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEMPLATE = ("A {aircraft_type} (callsign: {callsign}) just took off from {origin} Airport, "
+                    "{origin_city}, {origin_country}.")
+BOEING_747_FILTER = {'typecode_prefixes': ['B74'], 'model_prefixes': ['747']}
+# Used when config.py has no FLEETS, matching the original single-fleet bot
+DEFAULT_FLEETS = {
+    '747': {'aircraft_type': getattr(config, 'AIRCRAFT_TYPE', 'Boeing 747'), 'csv': 'boeing_747_icao.csv',
+            'filter': BOEING_747_FILTER},
+}
+
+
+class Fleet:
+
+    def __init__(self, name, aircraft_type=None, csv=None, icao24=(), callsign_prefixes=(),
+                 template=DEFAULT_TEMPLATE, publishers=None, filter=None):
+        self.name = name
+        # typecode/model prefixes update_aircraft_db.py exports the CSV with
+        self.filter = filter
+        self.aircraft_type = aircraft_type or name
+        self.csv_path = os.path.join(BASE_DIR, csv) if csv else None
+        self.cache = FleetCache(self.csv_path) if csv else None
+        self.extra_icao24s = frozenset(code.strip().lower() for code in icao24)
+        self.callsign_prefixes = tuple(prefix.strip().upper() for prefix in callsign_prefixes)
+        self.template = template
+        self.publishers = publishers  # network names, None for every configured network
+
+    def icao24s(self):
+        if self.cache is None:
+            return self.extra_icao24s
+        return self.cache.get() | self.extra_icao24s if self.extra_icao24s else self.cache.get()
+
+    def accepts_callsign(self, callsign):
+        if not self.callsign_prefixes:
+            return True
+        callsign = (callsign or '').strip().upper()
+        return callsign.startswith(self.callsign_prefixes)
+
+    def compose_message(self, flight_data):
+        return self.template.format(aircraft_type=self.aircraft_type, fleet=self.name, **flight_data)
+
+
+def load_fleets(fleet_settings=None, networks=None):
+    # networks: the configured PUBLISHERS names. A fleet posting to any other
+    # name would queue posts that no worker ever delivers.
+    fleet_settings = fleet_settings or getattr(config, 'FLEETS', None) or DEFAULT_FLEETS
+    networks = set(networks if networks is not None else getattr(config, 'PUBLISHERS', DEFAULT_PUBLISHERS))
+    fleets = [Fleet(name, **settings) for name, settings in fleet_settings.items()]
+    for fleet in fleets:
+        unknown = [network for network in fleet.publishers or () if network not in networks]
+        if unknown:
+            raise ValueError(f"Fleet '{fleet.name}' posts to {', '.join(unknown)}, which "
+                             f"{'is' if len(unknown) == 1 else 'are'} not in PUBLISHERS")
+    return fleets
+
+
+class FleetIndex:
+
+    def __init__(self, fleets):
+        self.fleets = fleets
+        self._lock = threading.Lock()
+        self._sources = None
+        self._by_icao24 = {}
+        self._icao24_set = frozenset()
+
+    def refresh(self):
+        # Rebuilds the combined map only when one of the fleets' sets changed;
+        # FleetCache hands back the same frozenset while its CSV is unchanged.
+        # Returns the combined icao24 set to request from OpenSky.
+        sources = []
+        for fleet in self.fleets:
+            try:
+                sources.append(fleet.icao24s())
+            except FileNotFoundError:
+                logger.error(f"Fleet '{fleet.name}': {fleet.csv_path} does not exist. Please run update_aircraft_db.py first.")
+                sources.append(frozenset())
+        with self._lock:
+            if self._sources is None or any(new is not old for new, old in zip(sources, self._sources)):
+                by_icao24 = {}
+                for fleet, icao24s in zip(self.fleets, sources):
+                    for icao24 in icao24s:
+                        by_icao24.setdefault(icao24, []).append(fleet)
+                self._by_icao24 = {icao24: tuple(fleets) for icao24, fleets in by_icao24.items()}
+                self._icao24_set = frozenset(self._by_icao24)
+                self._sources = sources
+                logger.info(f"Tracking {len(self._icao24_set)} aircraft across {len(self.fleets)} fleet(s)")
+            return self._icao24_set
+
+    def replace_fleets(self, fleets):
+        with self._lock:
+            self.fleets = fleets
+            self._sources = None
+        return self.refresh()
+
+    def match(self, icao24, callsign=None):
+        # Fleets this aircraft belongs to, in config order
+        fleets = self._by_icao24.get(icao24.lower() if icao24 else icao24, ())
+        if not fleets or callsign is None:
+            return fleets
+        return tuple(fleet for fleet in fleets if fleet.accepts_callsign(callsign))
+
+    def required_files(self):
+        return [fleet.csv_path for fleet in self.fleets if fleet.csv_path]
+
+
+FLEET_INDEX = FleetIndex(load_fleets())
@@ -0,0 +1,139 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from models import Flight
+from storage import in_progress_ids, get_in_progress_flight, finalize_flights, archive_closed_flights
+
+logger = logging.getLogger(__name__)
+
+# A state below both limits counts as rolling on the runway even when the
+# transponder does not report on_ground.
+LANDING_ALTITUDE_M = 300
+LANDING_VELOCITY_MS = 60
+# When an aircraft stops reporting, its last altitude decides whether it
+# probably landed (low) or just left receiver coverage (high).
+APPROACH_ALTITUDE_M = 1500
+STALE_AFTER = timedelta(minutes=30)
+MAX_FLIGHT_DURATION = timedelta(hours=20)
+ARCHIVE_INTERVAL = timedelta(hours=1)
+RETENTION_DAYS = 30
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def _format(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def is_low_and_slow(flight_data):
+    altitude = flight_data.get('altitude')
+    velocity = flight_data.get('velocity')
+    return (altitude is not None and altitude < LANDING_ALTITUDE_M
+            and velocity is not None and velocity < LANDING_VELOCITY_MS)
+
+
+class FlightLifecycle:
+    # Moves flights out of 'in_progress' by comparing each aircraft's current
+    # state vector with the one from the previous poll. Only aircraft in the
+    # latest poll or with an open flight are remembered, so memory is bounded
+    # by the fleet size.
+
+    def __init__(self, nearest_airport):
+        # nearest_airport(lat, lon) -> airport code
+        self._nearest_airport = nearest_airport
+        self._last_states = {}
+        self._missing = {}  # last state of open flights absent from the latest poll
+        # Flights closed as 'lost' may reappear still cruising; they are not
+        # new takeoffs until the aircraft has been seen on the ground
+        self._lost = {}  # icao24 -> when it was closed
+        self._last_archive = None
+
+    def _close(self, flight_id, status, state, landing_time):
+        arrival_airport = None
+        if status == 'landed' and state is not None and state.get('latitude') is not None \
+                and state.get('longitude') is not None:
+            arrival_airport = self._nearest_airport(state['latitude'], state['longitude'])
+        entry = get_in_progress_flight(flight_id) or {}
+        return Flight(flight_id, entry.get('takeoff_time'),
+                      _format(landing_time) if landing_time else None, status, arrival_airport)
+
+    def _check(self, flight_id, state, previous, now):
+        if state is not None and now - _utc(state['last_contact']) <= STALE_AFTER:
+            if state.get('on_ground'):
+                return self._close(flight_id, 'landed', state, _utc(state['last_contact']))
+            # Require two consecutive low, slow vectors so one noisy altitude
+            # reading does not end a flight.
+            if previous is not None and is_low_and_slow(state) and is_low_and_slow(previous):
+                return self._close(flight_id, 'landed', state, _utc(state['last_contact']))
+            return None
+
+        last = state or previous
+        if last is None:
+            # Nothing seen since a restart: give up once the flight is too old
+            entry = get_in_progress_flight(flight_id)
+            takeoff_time = entry and entry.get('takeoff_time')
+            if takeoff_time:
+                takeoff = datetime.strptime(takeoff_time[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+                if now - takeoff > MAX_FLIGHT_DURATION:
+                    return self._close(flight_id, 'expired', None, None)
+            return None
+
+        last_contact = _utc(last['last_contact'])
+        if now - last_contact <= STALE_AFTER:
+            return None
+        altitude = last.get('altitude')
+        if last.get('on_ground') or (altitude is not None and altitude < APPROACH_ALTITUDE_M):
+            return self._close(flight_id, 'landed', last, last_contact)
+        return self._close(flight_id, 'lost', None, last_contact)
+
+    def was_lost(self, flight_id):
+        return flight_id in self._lost
+
+    def _release_lost(self, current, now):
+        for flight_id, closed_at in list(self._lost.items()):
+            state = current.get(flight_id)
+            on_ground = state is not None and (state.get('on_ground') or is_low_and_slow(state))
+            if on_ground or now - closed_at > MAX_FLIGHT_DURATION:
+                del self._lost[flight_id]
+
+    def observe(self, flights_data, now=None, previous=None):
+        # Feed one poll's state vectors (a list, or a dict by icao24); returns
+        # the flights closed by it. previous is the last poll's dict when the
+        # caller keeps it anyway (snapshot_delta.SnapshotDiffer): then no copy
+        # of the poll is made and the work follows the open flights only.
+        now = now or datetime.now(timezone.utc)
+        if isinstance(flights_data, dict):
+            current = flights_data
+        else:
+            current = {flight_data['icao24']: flight_data for flight_data in flights_data}
+        last_states = self._last_states if previous is None else previous
+        self._release_lost(current, now)
+        closed = []
+        missing = {}
+        for flight_id in in_progress_ids():
+            state = current.get(flight_id)
+            last = last_states.get(flight_id) or self._missing.get(flight_id)
+            flight = self._check(flight_id, state, last, now)
+            if flight is not None:
+                closed.append(flight)
+            elif state is None and last is not None:
+                missing[flight_id] = last
+        self._missing = missing
+        if previous is None:
+            # Remember this poll's states, so flights opened after this call have a baseline
+            self._last_states = dict(current)
+            for flight in closed:
+                self._last_states.pop(flight.id, None)
+
+        if closed and finalize_flights(closed):
+            for flight in closed:
+                logger.info(f"Flight {flight.id} {flight.status} at {flight.landing_time} "
+                            f"(arrival airport: {flight.arrival_airport})")
+                if flight.status == 'lost':
+                    self._lost[flight.id] = now
+
+        if self._last_archive is None or now - self._last_archive >= ARCHIVE_INTERVAL:
+            archive_closed_flights(RETENTION_DAYS)
+            self._last_archive = now
+        return closed
@@ -1,154 +1,312 @@
-import schedule
-import time
-from opensky_api import fetch_aircraft_flights
-from social_media_handler import post_updates
-from storage import check_duplicate, update_record, store_estimated_landing, init_db
-from config import AIRCRAFT_TYPE
+from opensky_api import fetch_aircraft_flights, OPENSKY_CLIENT
+from social_media_handler import takeoff_post, posts_queued, start_posting, stop_posting
+from storage import check_duplicates, record_takeoffs, init_db, takeoff_time
+import config
 import logging
 import os
 from datetime import datetime, timedelta
-import math
-import json
+from airport_data import load_airport_table
+from batch_enrichment import AirportArrays, enrich_flights
+from flight_lifecycle import FlightLifecycle, is_low_and_slow
+from poll_scheduler import PollScheduler
+from fleets import FLEET_INDEX
+from track_history import TrackHistory
+from route_inference import RouteInference
+from snapshot_delta import SnapshotDiffer, NEW, CHANGED
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load airport database
-AIRPORT_DB = {}
-try:
-    with open('airport_db.json', 'r') as f:
-        AIRPORT_DB = json.load(f)
-except FileNotFoundError:
-    logger.warning("Airport database not found. Please run update_airport_db.py first.")
-
-def distance(lat1, lon1, lat2, lon2):
-    R = 6371  # Radius of the Earth in kilometers
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
+# Rounded up to a multiple of OpenSky's 5 second update cadence
+POLL_INTERVAL_SECONDS = getattr(config, 'POLL_INTERVAL_SECONDS', 300)
+METRICS_PORT = getattr(config, 'METRICS_PORT', None)
+METRICS_PROFILE = getattr(config, 'METRICS_PROFILE', False)
+# A local receiver feed replaces OpenSky when set (see adsb_feed.create_reader)
+ADSB_FEED = getattr(config, 'ADSB_FEED', None)
+ADSB_POLL_INTERVAL_SECONDS = getattr(config, 'ADSB_POLL_INTERVAL_SECONDS', 5)
+# Worker processes for sharded tracking (sharded_tracker); 0 runs everything here
+TRACKER_WORKERS = getattr(config, 'TRACKER_WORKERS', 0)
+
+STAGE_SECONDS = metrics.histogram('bot_stage_seconds', "Time spent per poll cycle stage", ('stage',))
+CYCLE_ERRORS = metrics.counter('bot_cycle_errors', "Poll cycles that raised")
+STATES_PROCESSED = metrics.counter('bot_states_processed', "Fleet state vectors processed")
+TAKEOFFS = metrics.counter('bot_takeoffs', "Takeoff events announced")
+
+AIRPORT_DB_JSON = 'airport_db.json'
+AIRPORT_DB_BIN = 'airport_db.bin'
+
+# The airport database is memory-mapped on first use rather than at import
+_airport_db = None
+_airport_arrays = None
+_adsb_feed = None
+
+def get_airport_db():
+    global _airport_db
+    if _airport_db is None:
+        _airport_db = load_airport_table(AIRPORT_DB_BIN, AIRPORT_DB_JSON)
+    return _airport_db
+
+def get_airport_arrays():
+    # Column arrays for vectorized enrichment of a whole poll cycle
+    global _airport_arrays
+    if _airport_arrays is None:
+        _airport_arrays = AirportArrays(get_airport_db())
+    return _airport_arrays
+
+def get_nearest_airport_code(latitude, longitude):
+    return get_airport_info(latitude, longitude)[0]
+
+# Closes in-progress flights when they land or go stale
+FLIGHT_LIFECYCLE = FlightLifecycle(get_nearest_airport_code)
+# Recent positions per aircraft, for the takeoff point and measured ground speed
+TRACK_HISTORY = TrackHistory()
+# Destinations and durations learned from landed flights in flights.db
+ROUTE_INFERENCE = RouteInference(get_airport_db)
+# Per-cycle changes (new, changed, disappeared aircraft); other consumers can subscribe
+SNAPSHOT_DIFFER = SnapshotDiffer()
+# Airborne fleet aircraft whose takeoff was rejected (e.g. a stale position)
+# or could not be recorded; checked again every cycle without a delta event
+_pending_takeoffs = set()
 
 def get_airport_info(latitude, longitude):
-    if not AIRPORT_DB:
+    airport_db = get_airport_db()
+    if not airport_db:
         return ("UNK", "Unknown City", "Unknown Country")
-    nearest_airport = min(AIRPORT_DB.items(), key=lambda x: distance(latitude, longitude, x[1]['lat'], x[1]['lon']))
-    code = nearest_airport[0]
-    info = nearest_airport[1]
+    code, _ = airport_db.index.nearest(latitude, longitude)
+    info = airport_db[code]
     return (code, info['city'], info['country'])
 
-def estimate_landing_time(flight_data):
-    if 'destination' in flight_data and flight_data['destination'] in AIRPORT_DB:
-        dest = AIRPORT_DB[flight_data['destination']]
-        dist = distance(flight_data['latitude'], flight_data['longitude'], dest['lat'], dest['lon'])
-        est_duration = dist / 800  # Assuming an average speed of 800 km/h
-        return datetime.now() + timedelta(hours=est_duration)
-    return None
-
-def get_destination(flight_data):
-    # This is a placeholder. In reality, you'd need to use a flight schedule API or database.
-    callsign = flight_data['callsign'].strip()
-    if len(callsign) > 3:
-        possible_dest = callsign[-3:]
-        if possible_dest in AIRPORT_DB:
-            return possible_dest
-    return None
-
-def enrich_flight_data(flight_data):
-    origin_airport, origin_city, origin_country = get_airport_info(flight_data['latitude'], flight_data['longitude'])
-    flight_data['origin'] = origin_airport
-    flight_data['origin_city'] = origin_city
-    flight_data['origin_country'] = origin_country
-    flight_data['destination'] = get_destination(flight_data)
-    flight_data['estimated_landing_time'] = estimate_landing_time(flight_data)
+def add_track_details(flight_data):
+    # The aircraft may be well past the runway by the time it is first seen
+    # airborne, so the origin comes from the track's takeoff point
+    flight_id = flight_data['icao24']
+    takeoff = TRACK_HISTORY.takeoff_point(flight_id)
+    if takeoff is not None:
+        flight_data['takeoff_latitude'], flight_data['takeoff_longitude'], flight_data['takeoff_timestamp'] = takeoff
+    velocity = TRACK_HISTORY.smoothed_velocity(flight_id)
+    if velocity is not None and velocity[0] is not None:
+        flight_data['ground_speed'] = velocity[0]
     return flight_data
 
-def process_flight(flight):
+def build_flight_data(flight):
+    flight_id, callsign, origin_country, last_contact, last_position_update, longitude, latitude, altitude, on_ground, velocity, *rest = flight
+    return {
+        'icao24': flight_id,
+        'callsign': callsign,
+        'origin_country': origin_country,
+        'longitude': longitude,
+        'latitude': latitude,
+        'altitude': altitude,
+        'on_ground': on_ground,
+        'velocity': velocity,
+        'true_track': rest[0] if len(rest) > 0 else None,
+        'vertical_rate': rest[1] if len(rest) > 1 else None,
+        'last_contact': last_contact,
+        'fleets': FLEET_INDEX.match(flight_id, callsign),
+    }
+
+def is_new_takeoff(flight_data, in_progress):
+    # in_progress is the set from a bulk check_duplicates call
+    flight_id = flight_data['icao24']
+    if datetime.now() - datetime.fromtimestamp(flight_data['last_contact']) > timedelta(minutes=10):
+        logger.debug(f"Skipped old flight {flight_id}")
+        return False
+    if flight_data['on_ground']:
+        logger.debug(f"Skipped flight {flight_id} (on ground)")
+        return False
+    if is_low_and_slow(flight_data):
+        logger.debug(f"Skipped flight {flight_id} (rolling on runway)")
+        return False
+    if flight_id in in_progress:
+        logger.debug(f"Skipped flight {flight_id} (duplicate)")
+        return False
+    if FLIGHT_LIFECYCLE.was_lost(flight_id):
+        logger.debug(f"Skipped flight {flight_id} (back in coverage after being lost, no takeoff seen)")
+        return False
+    return True
+
+def compose_takeoff_message(enriched_data, fleet):
+    message = fleet.compose_message(enriched_data)
+
+    if enriched_data['destination']:
+        message += f" Destination: {enriched_data['destination']}."
+
+    if enriched_data['estimated_landing_time']:
+        message += f" Estimated landing time: {enriched_data['estimated_landing_time'].strftime('%Y-%m-%d %H:%M:%S UTC')}."
+    return message
+
+def compose_takeoff_posts(enriched_data):
+    # One post per matching fleet, each with its own template and networks.
+    # The idempotency key is the aircraft, the takeoff time that is recorded
+    # and the fleet name, so an aircraft in several fleets is announced by
+    # each of them.
+    enriched_data['takeoff_time'] = takeoff_time(enriched_data)
+    posts = []
+    for fleet in enriched_data['fleets']:
+        try:
+            posts.append(takeoff_post(enriched_data, compose_takeoff_message(enriched_data, fleet),
+                                      fleet.publishers, fleet.name))
+        except Exception as e:
+            logger.error(f"Error composing {fleet.name} post for flight {enriched_data['icao24']}: {e}", exc_info=True)
+    return posts
+
+def process_flights(flights):
+    # Batch path for a whole poll cycle. Only aircraft that appeared or
+    # changed (on ground, altitude band, callsign, fleets) since the last poll,
+    # or are pending from an earlier cycle, can be new takeoffs; those are
+    # enriched at once with array operations, and all new takeoffs are written
+    # in a single transaction.
+    all_flights_data = []
+    for flight in flights:
+        try:
+            all_flights_data.append(build_flight_data(flight))
+        except Exception as e:
+            logger.error(f"Error processing flight {flight}: {e}", exc_info=True)
+    TRACK_HISTORY.record_many(all_flights_data)
+    STATES_PROCESSED.inc(len(all_flights_data))
+    events = SNAPSHOT_DIFFER.diff(all_flights_data)
+
+    just_closed = set()
     try:
-        flight_id, callsign, origin_country, last_contact, last_position_update, longitude, latitude, altitude, on_ground, velocity, *_ = flight
-
-        flight_data = {
-            'icao24': flight_id,
-            'callsign': callsign,
-            'origin_country': origin_country,
-            'longitude': longitude,
-            'latitude': latitude,
-            'altitude': altitude,
-            'on_ground': on_ground,
-            'velocity': velocity,
-            'last_contact': last_contact
-        }
-
-        if datetime.now() - datetime.fromtimestamp(last_contact) > timedelta(minutes=10):
-            logger.debug(f"Skipped old flight {flight_id}")
-            return
+        with STAGE_SECONDS.labels('lifecycle').time():
+            closed = FLIGHT_LIFECYCLE.observe(SNAPSHOT_DIFFER.current, previous=SNAPSHOT_DIFFER.previous)
+            just_closed = {flight.id for flight in closed}
+    except Exception as e:
+        logger.error(f"Error updating flight lifecycle: {e}", exc_info=True)
+
+    changed = {event.icao24: event.state for event in events if event.kind in (NEW, CHANGED)}
+    for flight_id in _pending_takeoffs:
+        if flight_id in SNAPSHOT_DIFFER.current:
+            changed.setdefault(flight_id, SNAPSHOT_DIFFER.current[flight_id])
+    _pending_takeoffs.clear()
 
-        if not on_ground and not check_duplicate(flight_id):
-            enriched_data = enrich_flight_data(flight_data)
-            
-            message = f"A {AIRCRAFT_TYPE} (callsign: {callsign}) just took off from {enriched_data['origin']} Airport, {enriched_data['origin_city']}, {enriched_data['origin_country']}."
-            
-            if enriched_data['destination']:
-                message += f" Destination: {enriched_data['destination']}."
-            
-            if enriched_data['estimated_landing_time']:
-                message += f" Estimated landing time: {enriched_data['estimated_landing_time'].strftime('%Y-%m-%d %H:%M:%S UTC')}."
-
-            try:
-                post_updates(enriched_data, message)
-            except Exception as e:
-                logger.error(f"Error posting update for flight {flight_id}: {e}", exc_info=True)
-            
-            update_record(enriched_data)
-            if enriched_data['estimated_landing_time']:
-                store_estimated_landing(flight_id, enriched_data['estimated_landing_time'])
-            logger.info(f"Processed takeoff event for flight {flight_id}")
+    flights_data = []
+    for flight_data in changed.values():
+        if flight_data['icao24'] in just_closed:
+            continue
+        if not flight_data['fleets']:
+            logger.debug(f"Skipped flight {flight_data['icao24']} (no matching fleet)")
+            continue
+        flights_data.append(flight_data)
+
+    in_progress = check_duplicates([flight_data['icao24'] for flight_data in flights_data])
+    candidates = []
+    for flight_data in flights_data:
+        if flight_data['latitude'] is None or flight_data['longitude'] is None:
+            logger.debug(f"Skipped flight {flight_data['icao24']} (no position)")
+            accepted = False
         else:
-            logger.debug(f"Skipped flight {flight_id} (on ground: {on_ground}, duplicate: {check_duplicate(flight_id)})")
-    except Exception as e:
-        logger.error(f"Error processing flight {flight}: {e}", exc_info=True)
+            accepted = is_new_takeoff(flight_data, in_progress)
+        if accepted:
+            candidates.append(flight_data)
+        elif not flight_data['on_ground'] and flight_data['icao24'] not in in_progress \
+                and not FLIGHT_LIFECYCLE.was_lost(flight_data['icao24']):
+            _pending_takeoffs.add(flight_data['icao24'])
+    if not candidates:
+        return
+
+    with STAGE_SECONDS.labels('enrich').time():
+        for flight_data in candidates:
+            add_track_details(flight_data)
+        ROUTE_INFERENCE.refresh()
+        enriched_flights = enrich_flights(candidates, get_airport_arrays(), ROUTE_INFERENCE)
+    with STAGE_SECONDS.labels('post').time():
+        posts = [post for enriched_data in enriched_flights for post in compose_takeoff_posts(enriched_data)]
+    # The posts are queued in the takeoffs' transaction: a takeoff is recorded
+    # and announced together, or retried next cycle
+    if not record_takeoffs(enriched_flights, posts):
+        _pending_takeoffs.update(enriched_data['icao24'] for enriched_data in enriched_flights)
+        return
+    posts_queued(posts)
+    TAKEOFFS.inc(len(enriched_flights))
+    logger.info(f"Processed {len(enriched_flights)} takeoff events")
+
+def retry_takeoffs(flight_ids):
+    # Takeoffs whose write failed after process_flights returned (the
+    # sharded tracker's writer reports them) are checked again next cycle
+    _pending_takeoffs.update(flight_ids)
 
+def fetch_flights():
+    if _adsb_feed is not None:
+        return _adsb_feed.fetch_aircraft_flights()
+    return fetch_aircraft_flights()
+
+@STAGE_SECONDS.labels('cycle').time()
 def job():
     try:
-        flights = fetch_aircraft_flights()
+        flights = fetch_flights()
         if not flights:
-            logger.warning("No flights fetched. The boeing_747_icao.csv file might be missing or empty.")
+            logger.warning("No flights fetched. The fleet CSV files might be missing or empty.")
             return
         logger.info(f"Fetched {len(flights)} flights. Processing...")
-        for flight in flights:
-            process_flight(flight)
+        with STAGE_SECONDS.labels('process').time():
+            process_flights(flights)
         logger.info("Finished processing all flights.")
     except Exception as e:
+        CYCLE_ERRORS.inc()
         logger.error(f"An error occurred during the scheduled job: {e}", exc_info=True)
 
 def check_required_files():
-    required_files = ['boeing_747_icao.csv', 'config.py', 'airport_db.json']
+    required_files = FLEET_INDEX.required_files() + ['config.py']
     missing_files = [file for file in required_files if not os.path.exists(file)]
+    if not os.path.exists(AIRPORT_DB_BIN) and not os.path.exists(AIRPORT_DB_JSON):
+        missing_files.append(AIRPORT_DB_JSON)
     if missing_files:
         logger.error(f"Missing required files: {', '.join(missing_files)}. Please ensure all required files are present.")
         return False
     return True
 
 def main():
+    global _adsb_feed
     logger.info("Starting 747 Flight Tracker Bot")
     if not check_required_files():
         logger.error("Exiting due to missing required files.")
         return
 
     init_db()
+    if METRICS_PORT:
+        metrics.start_metrics_server(METRICS_PORT)
+    if METRICS_PROFILE:
+        metrics.PROFILER.start()
+
+    if ADSB_FEED:
+        from adsb_feed import AdsbFeed
+        _adsb_feed = AdsbFeed(ADSB_FEED)
+        _adsb_feed.start()
 
-    schedule.every(5).minutes.do(job)
+    tracker = None
+    poll = job
+    if TRACKER_WORKERS:
+        # This process only fetches; shards and the writer do the rest
+        from sharded_tracker import ShardedTracker
+        tracker = ShardedTracker(TRACKER_WORKERS, fetch_flights)
+        tracker.start()
+        poll = tracker.job
+    else:
+        start_posting()
+
+    if _adsb_feed is not None:
+        # The feed is decoded continuously; polls only read its latest states
+        scheduler = PollScheduler(poll, ADSB_POLL_INTERVAL_SECONDS, cadence=1, offset=0)
+    else:
+        # Slow down when the remaining OpenSky credits would not last the day
+        scheduler = PollScheduler(poll, POLL_INTERVAL_SECONDS,
+                                  interval_fn=lambda: OPENSKY_CLIENT.recommended_poll_interval(POLL_INTERVAL_SECONDS))
 
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
-    except KeyboardInterrupt:
-        logger.info("Bot stopped by user.")
+        scheduler.run()
+        logger.info("Bot stopped.")
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+    finally:
+        if tracker is not None:
+            tracker.stop()
+        else:
+            stop_posting()
+        if _adsb_feed is not None:
+            _adsb_feed.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,307 @@
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# In-process counters, gauges and histograms, served in the Prometheus text
+# format from a small HTTP server on localhost. Metrics are declared next to
+# the code they measure, e.g.
+#     FETCH_SECONDS = metrics.histogram('opensky_fetch_seconds', "...")
+#     with FETCH_SECONDS.time(): ...
+# A sampling profiler can be switched on and off over the same server.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROFILE_INTERVAL = 0.01  # seconds between stack samples
+PROFILE_TOP = 50  # stacks listed by /profile
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer(ContextDecorator):
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call, so concurrent calls don't share a start time
+        return _Timer(self.histogram)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Counter:
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield name + '_total', (), self.value
+
+
+class Gauge:
+    # Either set() directly or given a function that is read at scrape time
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self, name):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                logger.debug(f"Gauge {name} failed: {e}")
+                return
+        if value is not None:
+            yield name, (), value
+
+
+class Histogram:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        # Context manager and decorator
+        return _Timer(self)
+
+    def samples(self, name):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield name + '_bucket', (('le', _format_value(bound)),), cumulative
+        yield name + '_sum', (), total
+        yield name + '_count', (), count
+
+
+class MetricFamily:
+    # A named metric with optional labels; without labels it behaves as its
+    # single child (inc, set, observe, time)
+
+    def __init__(self, name, documentation, kind, factory, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._factory()
+            return child
+
+    def __getattr__(self, attribute):
+        if attribute.startswith('_') or self.labelnames:
+            raise AttributeError(attribute)
+        return getattr(self.labels(), attribute)
+
+    def render(self):
+        # Counter samples are name_total, and HELP/TYPE must use the same name
+        name = self.name + '_total' if self.kind == 'counter' else self.name
+        documentation = self.documentation.replace('\\', '\\\\').replace('\n', '\\n')
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            for sample_name, extra, value in child.samples(self.name):
+                lines.append(f"{sample_name}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._families = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, documentation, kind, factory, labelnames=()):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(name, documentation, kind, factory, labelnames)
+            return family
+
+    def render(self):
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(name, documentation, 'counter', Counter, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(name, documentation, 'gauge', Gauge, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(name, documentation, 'histogram', lambda: Histogram(buckets), labelnames)
+
+
+class SamplingProfiler:
+    # Samples the stack of every other thread from a background thread and
+    # counts identical stacks. Cheap enough to leave on for a few cycles in
+    # production; stopped by default.
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return False
+            self.stacks.clear()
+            self.samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info("Sampling profiler started")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = ';'.join(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                                 for entry in traceback.extract_stack(frame))
+                with self._lock:
+                    self.stacks[stack] += 1
+            with self._lock:
+                self.samples += 1
+
+    def report(self, top=PROFILE_TOP):
+        # Folded stacks ("frame;frame;frame count"), most frequent first; the
+        # output feeds straight into flamegraph.pl
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common(top)]
+            return f"# {self.samples} samples every {self.interval * 1000:.0f} ms\n" + '\n'.join(lines) + '\n'
+
+
+PROFILER = SamplingProfiler()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/metrics':
+            self._reply(REGISTRY.render(), 'text/plain; version=0.0.4')
+        elif url.path == '/profile/start':
+            self._reply("started\n" if PROFILER.start() else "already running\n")
+        elif url.path == '/profile/stop':
+            PROFILER.stop()
+            self._reply(PROFILER.report())
+        elif url.path == '/profile':
+            top = parse_qs(url.query).get('top', [PROFILE_TOP])[0]
+            self._reply(PROFILER.report(int(top)))
+        else:
+            self.send_error(404)
+
+    def _reply(self, text, content_type='text/plain'):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    # Serves /metrics plus /profile/start, /profile/stop and /profile
+    server = MetricsServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
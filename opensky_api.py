@@ -1,47 +1,262 @@
 import requests
-import pandas as pd
-import os
+from requests.adapters import HTTPAdapter
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import config
 from config import OPENSKY_API_USER, OPENSKY_API_PASS
 import logging
+from fleets import FLEET_INDEX
+from states_stream import parse_states_stream
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-BOEING_747_CSV = "boeing_747_icao.csv"
+OPENSKY_API_URL = getattr(config, 'OPENSKY_API_URL', 'https://opensky-network.org/api')
+# 'icao24' asks OpenSky only for the tracked fleet, 'bbox' downloads the
+# configured bounding boxes, 'all' downloads the global /states/all payload.
+OPENSKY_FETCH_MODE = getattr(config, 'OPENSKY_FETCH_MODE', 'icao24')
+OPENSKY_BOUNDING_BOXES = getattr(config, 'OPENSKY_BOUNDING_BOXES', [])  # (lamin, lomin, lamax, lomax)
+ICAO24_CHUNK_SIZE = 200  # icao24 parameters per request, keeps URLs well under server limits
+
+CONNECT_TIMEOUT = 5  # seconds
+READ_TIMEOUT = 30  # seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 2  # seconds, doubled on every retry
+BACKOFF_CAP = 60  # seconds; longer server-requested waits fail the poll instead of sleeping
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+STREAM_CHUNK_SIZE = 64 * 1024  # bytes handed to the streaming states parser
+
+REQUEST_SECONDS = metrics.histogram('opensky_request_seconds', "OpenSky request time until response headers")
+PARSE_SECONDS = metrics.histogram('opensky_parse_seconds', "Time reading and parsing an OpenSky response body")
+FETCH_SECONDS = metrics.histogram('opensky_fetch_seconds', "Time fetching the fleet states for one poll")
+FETCH_BYTES = metrics.counter('opensky_fetch_bytes', "Decoded response body bytes received from OpenSky")
+RESPONSES = metrics.counter('opensky_responses', "OpenSky responses by HTTP status", ('status',))
+RATE_LIMIT_WAITS = metrics.counter('opensky_rate_limit_waits', "Backoffs after an OpenSky 429 response")
+CREDITS_REMAINING = metrics.gauge('opensky_credits_remaining', "API credits left today, from X-Rate-Limit-Remaining")
+STATES_FETCHED = metrics.gauge('opensky_fleet_states', "Fleet state vectors returned by the last poll")
+
+
+class RateLimitedError(requests.exceptions.RequestException):
+    # OpenSky asked us to stay away longer than a retry is worth waiting for
+    pass
+
+
+def _counted(chunks):
+    for chunk in chunks:
+        FETCH_BYTES.inc(len(chunk))
+        yield chunk
+
+
+class OpenSkyClient:
+    # Long-lived HTTP client for the OpenSky REST API: one pooled keep-alive
+    # session, gzip, bounded timeouts, jittered exponential backoff on 429 and
+    # 5xx responses, conditional requests, and API credit tracking from the
+    # X-Rate-Limit-* response headers.
+
+    def __init__(self, user, password, pool_size=4):
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Accept': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._validators = {}  # request key -> (etag, last_modified, states)
+        self.credits_remaining = None
+        self.credits_used = 0
+        self.rate_limit_waits = 0
+        self.retry_after = None  # monotonic time before which requests would be refused
+
+    def _backoff_delay(self, attempt, response):
+        retry_after = None
+        if response is not None:
+            retry_after = (response.headers.get('X-Rate-Limit-Retry-After-Seconds')
+                           or response.headers.get('Retry-After'))
+        if retry_after and retry_after.isdigit():
+            # Honoured in full: with the daily credits used up it runs until they reset
+            return int(retry_after)
+        # Full jitter keeps several bot instances from retrying in lockstep
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _track_credits(self, response):
+        remaining = response.headers.get('X-Rate-Limit-Remaining')
+        if remaining is None or not remaining.lstrip('-').isdigit():
+            return
+        remaining = int(remaining)
+        with self._lock:
+            if self.credits_remaining is not None and remaining < self.credits_remaining:
+                self.credits_used += self.credits_remaining - remaining
+            self.credits_remaining = remaining
+
+    def _wait_for_retry_after(self):
+        # A 429 told us when to come back; requests before that would only be refused
+        with self._lock:
+            retry_after = self.retry_after
+        delay = retry_after - time.monotonic() if retry_after is not None else 0
+        if delay > BACKOFF_CAP:
+            raise RateLimitedError(f"OpenSky rate limit in effect for another {delay:.0f} seconds")
+        if delay > 0:
+            logger.info(f"OpenSky rate limit in effect. Waiting {delay:.1f} seconds...")
+            time.sleep(delay)
+
+    def get(self, url, params=None, icao24_set=None):
+        # With icao24_set the body is parsed as a stream and only matching
+        # state vectors are kept; otherwise the whole body is decoded.
+        key = (url, tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (params or {}).items())),
+               hash(frozenset(icao24_set)) if icao24_set is not None else None)
+        headers = {}
+        cached = self._validators.get(key)
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = None
+        for attempt in range(MAX_RETRIES + 1):
+            self._wait_for_retry_after()
+            try:
+                with REQUEST_SECONDS.time():
+                    response = self.session.get(url, params=params, headers=headers, stream=True,
+                                                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = self._backoff_delay(attempt, None)
+                logger.warning(f"OpenSky request failed ({e}). Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+                continue
+
+            self._track_credits(response)
+            RESPONSES.labels(response.status_code).inc()
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+            delay = self._backoff_delay(attempt, response)
+            if response.status_code == 429:
+                # Also holds back the next poll when the retries run out
+                with self._lock:
+                    self.retry_after = time.monotonic() + delay
+            if attempt == MAX_RETRIES or delay > BACKOFF_CAP:
+                break
+            if response.status_code == 429:
+                self.rate_limit_waits += 1
+                RATE_LIMIT_WAITS.inc()
+                logger.warning(f"OpenSky returned 429. Retrying in {delay:.1f} seconds...")
+                response.close()
+                continue  # the wait happens in _wait_for_retry_after
+            logger.warning(f"OpenSky returned {response.status_code}. Retrying in {delay:.1f} seconds...")
+            response.close()
+            time.sleep(delay)
+
+        with response:
+            if response.status_code == 304:
+                if not cached:
+                    # Only conditional requests can get a 304; there is no body to parse
+                    raise requests.exceptions.HTTPError(f"OpenSky returned 304 for an unconditional request to {url}",
+                                                        response=response)
+                logger.debug(f"OpenSky data not modified for {url}")
+                return cached[2]
+            response.raise_for_status()  # Ensure we got a valid response
+            with PARSE_SECONDS.time():
+                if icao24_set is None:
+                    FETCH_BYTES.inc(len(response.content))
+                    states = response.json().get('states') or []
+                else:
+                    chunks = _counted(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+                    _, states = parse_states_stream(chunks, icao24_set)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self._validators[key] = (etag, last_modified, states)
+        return states
+
+    def get_states(self, params=None, base_url=None, icao24_set=None):
+        return self.get(f"{base_url or OPENSKY_API_URL}/states/all", params, icao24_set)
+
+    def recommended_poll_interval(self, base_interval, credits_per_poll=None):
+        # Spread the remaining daily credits (OpenSky resets them at midnight
+        # UTC) over the rest of the day, never polling faster than base_interval.
+        with self._lock:
+            remaining = self.credits_remaining
+            cost = credits_per_poll or self.credits_used
+        if remaining is None or not cost:
+            return base_interval
+        now = datetime.now(timezone.utc)
+        reset = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        polls_left = remaining // cost
+        if polls_left <= 0:
+            return max(base_interval, (reset - now).total_seconds())
+        return max(base_interval, (reset - now).total_seconds() / polls_left)
+
+    def begin_poll(self):
+        # credits_used then measures what one poll costs
+        with self._lock:
+            self.credits_used = 0
+
+
+OPENSKY_CLIENT = OpenSkyClient(OPENSKY_API_USER, OPENSKY_API_PASS)
+CREDITS_REMAINING.set_function(lambda: OPENSKY_CLIENT.credits_remaining)
+
+def _get_states(params, base_url, icao24_set=None):
+    return OPENSKY_CLIENT.get_states(params, base_url, icao24_set)
+
+def merge_states(state_lists):
+    # Chunks and overlapping boxes can return the same aircraft twice; keep
+    # the vector with the latest last_contact.
+    merged = {}
+    for states in state_lists:
+        for state in states:
+            current = merged.get(state[0])
+            if current is None or (state[4] or 0) > (current[4] or 0):
+                merged[state[0]] = state
+    return list(merged.values())
+
+def fetch_states_by_icao24(icao24_set, base_url=None):
+    icao24_list = sorted(icao24_set)
+    chunks = [icao24_list[i:i + ICAO24_CHUNK_SIZE] for i in range(0, len(icao24_list), ICAO24_CHUNK_SIZE)]
+    logger.info(f"Fetching {len(icao24_list)} aircraft from OpenSky API in {len(chunks)} requests...")
+    return merge_states(_get_states({'icao24': chunk}, base_url, icao24_set) for chunk in chunks)
+
+def fetch_states_by_bounding_boxes(bounding_boxes, icao24_set, base_url=None):
+    logger.info(f"Fetching {len(bounding_boxes)} bounding boxes from OpenSky API...")
+    state_lists = []
+    for lamin, lomin, lamax, lomax in bounding_boxes:
+        state_lists.append(_get_states({'lamin': lamin, 'lomin': lomin, 'lamax': lamax, 'lomax': lomax},
+                                       base_url, icao24_set))
+    return merge_states(state_lists)
+
+def fetch_all_states(icao24_set, base_url=None):
+    logger.info("Fetching flights from OpenSky API...")
+    return _get_states(None, base_url, icao24_set)
+
+def fetch_fleet_states(icao24_set, mode=None, base_url=None):
+    # base_url and mode default to the module settings at call time, so a
+    # replay can point the bot at a fake endpoint
+    mode = mode or OPENSKY_FETCH_MODE
+    if mode == 'icao24':
+        return fetch_states_by_icao24(icao24_set, base_url)
+    if mode == 'bbox' and OPENSKY_BOUNDING_BOXES:
+        return fetch_states_by_bounding_boxes(OPENSKY_BOUNDING_BOXES, icao24_set, base_url)
+    return fetch_all_states(icao24_set, base_url)
 
 def fetch_aircraft_flights():
     try:
-        # Get the directory of the current script
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(current_dir, BOEING_747_CSV)
-        
-        logger.info(f"Loading ICAO24 codes for Boeing 747 from {csv_path}...")
-        if not os.path.exists(csv_path):
-            raise FileNotFoundError(f"The file {csv_path} does not exist. Please run update_aircraft_db.py first.")
-        
-        icao_df = pd.read_csv(csv_path)
-        if icao_df.empty:
-            logger.warning(f"The file {csv_path} is empty. No ICAO24 codes loaded.")
-            return []
-        
-        icao24_set = set(icao_df['icao24'].dropna())
+        OPENSKY_CLIENT.begin_poll()
+        # One combined set for every configured fleet, so one fetch serves them all
+        icao24_set = FLEET_INDEX.refresh()
         if not icao24_set:
-            logger.warning("No valid ICAO24 codes found in the CSV file.")
+            logger.warning("No valid ICAO24 codes found for any configured fleet.")
             return []
-        
-        logger.info(f"Loaded {len(icao24_set)} ICAO24 codes for Boeing 747.")
-
-        logger.info("Fetching flights from OpenSky API...")
-        url = 'https://opensky-network.org/api/states/all'
-        response = requests.get(url, auth=(OPENSKY_API_USER, OPENSKY_API_PASS))
-        response.raise_for_status()  # Ensure we got a valid response
-        data = response.json()['states']
-        logger.info(f"Fetched {len(data)} flights.")
-
-        logger.info("Filtering flights for Boeing 747...")
-        aircraft_flights = [flight for flight in data if flight[0] in icao24_set]
-        logger.info(f"Filtered {len(aircraft_flights)} Boeing 747 flights.")
+
+        with FETCH_SECONDS.time():
+            aircraft_flights = fetch_fleet_states(icao24_set)
+        STATES_FETCHED.set(len(aircraft_flights))
+        logger.info(f"Filtered {len(aircraft_flights)} fleet flights.")
 
         return aircraft_flights
     except FileNotFoundError as e:
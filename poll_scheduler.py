@@ -0,0 +1,108 @@
+import logging
+import math
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# OpenSky refreshes state vectors every 5 seconds for authenticated users
+# (10 for anonymous ones). Polls are placed on a fixed grid of multiples of
+# the interval, a little after each refresh, and deadlines come from the
+# monotonic clock so neither slow jobs nor wall-clock jumps make them drift.
+OPENSKY_CADENCE = 5  # seconds
+CADENCE_OFFSET = 1.0  # seconds after a refresh, so the new data is published
+
+
+class PollScheduler:
+    # overlap='skip' drops the ticks a slow job ran over and waits for the
+    # next one on the grid; overlap='coalesce' runs once straight away for all
+    # of them. Either way a job never overlaps itself.
+
+    def __init__(self, job, interval, cadence=OPENSKY_CADENCE, offset=CADENCE_OFFSET,
+                 interval_fn=None, overlap='skip'):
+        if overlap not in ('skip', 'coalesce'):
+            raise ValueError(f"Unknown overlap policy '{overlap}'")
+        self.job = job
+        self.cadence = cadence
+        self.offset = offset
+        self.interval_fn = interval_fn
+        self.overlap = overlap
+        self.interval = self._snap(interval)
+        self.runs = 0
+        self.skipped = 0
+        self.late = 0.0  # seconds the last run started after its tick
+        self._stop = threading.Event()
+
+    def _snap(self, interval):
+        # Whole multiples of the cadence; polling faster only re-reads the same data
+        return max(self.cadence, math.ceil(interval / self.cadence) * self.cadence)
+
+    def _first_deadline(self):
+        # Next wall-clock multiple of the interval (plus offset), as a monotonic time
+        now = time.time()
+        tick = math.floor((now - self.offset) / self.interval + 1) * self.interval + self.offset
+        return time.monotonic() + (tick - now)
+
+    def _next_deadline(self, deadline):
+        deadline += self.interval
+        now = time.monotonic()
+        if deadline > now:
+            return deadline
+        missed = math.floor((now - deadline) / self.interval) + 1
+        if self.overlap == 'coalesce':
+            # The latest missed tick is already due, so it runs straight away
+            # and the following deadlines stay on the grid
+            self.skipped += missed - 1
+            logger.warning(f"Poll overran by {missed} interval(s); running once to catch up")
+            return deadline + (missed - 1) * self.interval
+        self.skipped += missed
+        logger.warning(f"Poll overran; skipping {missed} missed run(s)")
+        return deadline + missed * self.interval
+
+    def _update_interval(self):
+        if self.interval_fn is None:
+            return False
+        interval = self._snap(self.interval_fn())
+        if interval == self.interval:
+            return False
+        logger.info(f"Adjusting poll interval to {interval} seconds")
+        self.interval = interval
+        return True
+
+    def stop(self, *args):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def run(self, max_runs=None):
+        # Blocks until stop() is called, a SIGINT/SIGTERM arrives or max_runs
+        # jobs have run. Signal handlers are only installed from the main thread.
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                handlers[signum] = signal.signal(signum, self._handle_signal)
+        try:
+            deadline = self._first_deadline()
+            while not self._stop.wait(max(0.0, deadline - time.monotonic())):
+                self.late = time.monotonic() - deadline
+                try:
+                    self.job()
+                except Exception as e:
+                    logger.error(f"An error occurred during the scheduled job: {e}", exc_info=True)
+                self.runs += 1
+                if max_runs is not None and self.runs >= max_runs:
+                    break
+                if self._update_interval():
+                    deadline = self._first_deadline()
+                else:
+                    deadline = self._next_deadline(deadline)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, stopping after the current poll")
+        self.stop()
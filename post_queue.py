@@ -0,0 +1,275 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+from publishers import CircuitBreaker, PublisherMetrics, RateLimitError, PermanentPostError
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30  # seconds, doubled on every failed attempt
+BACKOFF_CAP = 3600  # seconds
+BATCH_SIZE = 50  # due jobs claimed per worker pass
+IDLE_WAIT = 30  # seconds between queue scans when nothing is due
+
+PUBLISH_SECONDS = metrics.histogram('post_publish_seconds', "Publisher call time by network and outcome",
+                                    ('network', 'outcome'))
+POSTS_ENQUEUED = metrics.counter('post_enqueued', "Posts queued by network", ('network',))
+RATE_LIMIT_WAITS = metrics.counter('post_rate_limit_waits', "Posts deferred after a network rate limit",
+                                   ('network',))
+QUEUE_DEPTH = metrics.gauge('post_queue_depth', "Pending posts by network", ('network',))
+
+CREATE_POST_QUEUE_TABLE = """
+    CREATE TABLE IF NOT EXISTS post_queue (
+        job_id INTEGER PRIMARY KEY,
+        network TEXT NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        last_error TEXT,
+        external_id TEXT,
+        UNIQUE (network, idempotency_key)
+    )
+"""
+CREATE_POST_QUEUE_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_post_queue_network_due ON post_queue (network, status, next_attempt_at)
+"""
+INSERT_JOB = """
+    INSERT OR IGNORE INTO post_queue (network, idempotency_key, message, next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+SELECT_DUE_JOBS = """
+    SELECT job_id, message, attempts FROM post_queue
+    WHERE network = ? AND status = 'pending' AND next_attempt_at <= ?
+    ORDER BY next_attempt_at LIMIT ?
+"""
+SELECT_NEXT_DUE = """
+    SELECT MIN(next_attempt_at) FROM post_queue
+    WHERE network = ? AND status = 'pending' AND next_attempt_at > ?
+"""
+COUNT_PENDING = "SELECT COUNT(*) FROM post_queue WHERE status = 'pending'"
+COUNT_PENDING_FOR_NETWORK = "SELECT COUNT(*) FROM post_queue WHERE network = ? AND status = 'pending'"
+MARK_SENT = "UPDATE post_queue SET status = 'sent', attempts = attempts + 1, external_id = ? WHERE job_id = ?"
+MARK_RETRY = """
+    UPDATE post_queue SET attempts = ?, next_attempt_at = ?, last_error = ?, status = ?
+    WHERE job_id = ?
+"""
+DEFER_JOB = "UPDATE post_queue SET next_attempt_at = ?, last_error = ? WHERE job_id = ?"
+
+
+def job_rows(networks, idempotency_key, message, now=None):
+    # INSERT_JOB parameters for one event, for writers that queue posts in
+    # their own flights.db transaction (see PostQueue.notify)
+    now = now or time.time()
+    return [(network, idempotency_key, message, now, now) for network in networks]
+
+
+class TokenBucket:
+
+    def __init__(self, capacity, per_seconds):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def drain(self, seconds):
+        # The network told us to back off: push the next token out that far
+        with self._lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+            self.updated = time.monotonic()
+
+
+class NetworkWorker:
+    # Delivery state for one network: its publisher, token bucket, circuit
+    # breaker, metrics and worker thread. Each network runs on its own
+    # thread, so a slow or failing network never delays the others.
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.bucket = TokenBucket(*publisher.rate_limit) if publisher.rate_limit else None
+        self.breaker = CircuitBreaker()
+        self.metrics = PublisherMetrics()
+        self.wake = threading.Event()
+        self.thread = None
+
+
+class PostQueue:
+    # Durable outbound queue in SQLite with one background worker thread per
+    # network. Delivery is at-least-once: a job is marked sent only after its
+    # publisher returns, and (network, idempotency_key) is unique, so
+    # enqueueing the same event twice never posts it twice.
+
+    def __init__(self, db_filename):
+        self.db_filename = db_filename
+        self._conn = sqlite3.connect(db_filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        with self._conn:
+            self._conn.execute(CREATE_POST_QUEUE_TABLE)
+            self._conn.execute(CREATE_POST_QUEUE_INDEX)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.workers = {}
+
+    def enqueue(self, networks, idempotency_key, message):
+        # Fans one event out to every network in a single transaction
+        now = time.time()
+        inserted = []
+        with self._lock, self._conn:
+            for network in networks:
+                if self._conn.execute(INSERT_JOB, (network, idempotency_key, message, now, now)).rowcount:
+                    inserted.append(network)
+                else:
+                    logger.info(f"Skipped duplicate {network} post {idempotency_key}")
+        for network in inserted:
+            POSTS_ENQUEUED.labels(network).inc()
+            worker = self.workers.get(network)
+            if worker is not None:
+                worker.wake.set()
+        return inserted
+
+    def notify(self, networks=None):
+        # Wakes the workers for jobs another connection committed to flights.db
+        for network, worker in self.workers.items():
+            if networks is None or network in networks:
+                worker.wake.set()
+
+    def depth(self, network=None):
+        with self._lock:
+            if network is None:
+                return self._conn.execute(COUNT_PENDING).fetchone()[0]
+            return self._conn.execute(COUNT_PENDING_FOR_NETWORK, (network,)).fetchone()[0]
+
+    def metrics(self):
+        return {network: worker.metrics.snapshot() for network, worker in self.workers.items()}
+
+    def start(self, publishers):
+        # publishers: network name -> publishers.Publisher
+        self._stop.clear()
+        for network, publisher in publishers.items():
+            worker = NetworkWorker(publisher)
+            worker.thread = threading.Thread(target=self._run, args=(network, worker),
+                                             name=f'post-queue-{network}', daemon=True)
+            self.workers[network] = worker
+            QUEUE_DEPTH.labels(network).set_function(lambda network=network: self.depth(network))
+            worker.thread.start()
+        logger.info(f"Post queue workers started for {', '.join(publishers) or 'no networks'}")
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        for worker in self.workers.values():
+            worker.wake.set()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers.values():
+            worker.thread.join(max(0, deadline - time.monotonic()))
+        self.workers = {}
+
+    def _retry(self, job_id, network, attempts, error, delay=None):
+        attempts += 1
+        if delay is None:
+            delay = random.uniform(0.5, 1.0) * min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+        status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+        with self._lock, self._conn:
+            self._conn.execute(MARK_RETRY, (attempts, time.time() + delay, str(error), status, job_id))
+        if status == 'failed':
+            logger.error(f"Giving up on {network} post {job_id} after {attempts} attempts: {error}")
+        else:
+            logger.warning(f"{network} post {job_id} failed ({error}). Retrying in {delay:.0f} seconds...")
+
+    def _defer(self, job_id, delay, reason):
+        with self._lock, self._conn:
+            self._conn.execute(DEFER_JOB, (time.time() + delay, reason, job_id))
+
+    def _deliver(self, network, worker, job_id, message, attempts):
+        start = time.perf_counter()
+        try:
+            external_id = worker.publisher.publish(message)
+        except RateLimitError as e:
+            delay = e.retry_after if e.retry_after is not None else BACKOFF_BASE
+            worker.metrics.record_rate_limited()
+            RATE_LIMIT_WAITS.labels(network).inc()
+            if worker.bucket is not None:
+                worker.bucket.drain(delay)
+            # Being throttled is not the message's fault: defer without using an attempt
+            self._defer(job_id, delay, str(e))
+            logger.warning(f"{network} rate limit hit. Deferring post {job_id} by {delay:.0f} seconds...")
+            return
+        except PermanentPostError as e:
+            worker.metrics.record_failure(time.perf_counter() - start)
+            PUBLISH_SECONDS.labels(network, 'rejected').observe(time.perf_counter() - start)
+            self._retry(job_id, network, MAX_ATTEMPTS, e)
+            return
+        except Exception as e:
+            worker.metrics.record_failure(time.perf_counter() - start)
+            PUBLISH_SECONDS.labels(network, 'error').observe(time.perf_counter() - start)
+            if worker.breaker.record_failure():
+                logger.error(f"Circuit breaker opened for {network} after repeated failures")
+            self._retry(job_id, network, attempts, e)
+            return
+        worker.metrics.record_success(time.perf_counter() - start)
+        PUBLISH_SECONDS.labels(network, 'sent').observe(time.perf_counter() - start)
+        worker.breaker.record_success()
+        with self._lock, self._conn:
+            self._conn.execute(MARK_SENT, (None if external_id is None else str(external_id), job_id))
+        logger.info(f"Delivered {network} post {job_id}")
+
+    def run_once(self, network, worker):
+        # One pass over the network's due jobs; returns seconds until the
+        # worker should look again
+        now = time.time()
+        with self._lock:
+            jobs = self._conn.execute(SELECT_DUE_JOBS, (network, now, BATCH_SIZE)).fetchall()
+        wait = IDLE_WAIT
+        delivered = 0
+        for job_id, message, attempts in jobs:
+            if self._stop.is_set():
+                break
+            if not worker.breaker.allow():
+                # Jobs stay due; try again once the breaker lets a probe through
+                wait = min(wait, worker.breaker.wait_time())
+                break
+            if worker.bucket is not None and not worker.bucket.try_acquire():
+                wait = min(wait, worker.bucket.wait_time())
+                break
+            self._deliver(network, worker, job_id, message, attempts)
+            delivered += 1
+        if delivered and len(jobs) == BATCH_SIZE:
+            return 0
+        with self._lock:
+            next_due = self._conn.execute(SELECT_NEXT_DUE, (network, now)).fetchone()[0]
+        if next_due is not None:
+            wait = min(wait, max(0.0, next_due - time.time()))
+        return wait
+
+    def _run(self, network, worker):
+        while not self._stop.is_set():
+            worker.wake.clear()
+            try:
+                wait = self.run_once(network, worker)
+            except Exception as e:
+                logger.error(f"Post queue worker error for {network}: {e}", exc_info=True)
+                wait = IDLE_WAIT
+            worker.wake.wait(max(wait, 0.05))
@@ -0,0 +1,168 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Social networks are plugged in as Publisher subclasses registered by type
+# name. The post queue gives each configured publisher its own worker thread,
+# token bucket and circuit breaker.
+
+PUBLISHER_TYPES = {}
+# Used when config.py has no PUBLISHERS
+DEFAULT_PUBLISHERS = {'twitter': {}}
+LATENCY_SAMPLES = 500  # recent publish latencies kept per network
+
+
+class RateLimitError(Exception):
+    # Raised by a publisher when the network throttles us; retry_after in seconds
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentPostError(Exception):
+    # Raised by a publisher for errors that retrying cannot fix
+    pass
+
+
+def register_publisher(type_name):
+    def register(cls):
+        PUBLISHER_TYPES[type_name] = cls
+        return cls
+    return register
+
+
+def create_publisher(name, settings=None):
+    # settings: dict from config.PUBLISHERS; 'type' defaults to the network name
+    settings = dict(settings or {})
+    type_name = settings.pop('type', name)
+    if type_name not in PUBLISHER_TYPES:
+        raise ValueError(f"Unknown publisher type '{type_name}' for network '{name}'")
+    return PUBLISHER_TYPES[type_name](name, **settings)
+
+
+class Publisher:
+    # rate_limit: (posts, per_seconds) or None for no client-side limit
+    default_rate_limit = None
+
+    def __init__(self, name, rate_limit=None):
+        self.name = name
+        self.rate_limit = tuple(rate_limit) if rate_limit else self.default_rate_limit
+
+    def publish(self, message):
+        # One delivery attempt; returns the network's post id (or None).
+        # Raise RateLimitError or PermanentPostError where appropriate, any
+        # other exception is retried with backoff.
+        raise NotImplementedError
+
+
+@register_publisher('null')
+class NullPublisher(Publisher):
+
+    def publish(self, message):
+        return None
+
+
+@register_publisher('fake')
+class FakePublisher(Publisher):
+    # For dry runs and benchmarks: sleeps for latency seconds and fails at
+    # failure_rate, keeping every message it accepted
+
+    def __init__(self, name, rate_limit=None, latency=0.0, failure_rate=0.0, seed=None):
+        super().__init__(name, rate_limit)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.messages = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._rng.random() < self.failure_rate:
+                raise ConnectionError(f"{self.name} fake failure")
+            self.messages.append(message)
+            return f"{self.name}-{len(self.messages)}"
+
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive failures and stops delivery
+    # for reset_timeout seconds; then lets one probe through (half-open)
+
+    def __init__(self, failure_threshold=5, reset_timeout=300):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def wait_time(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        # Returns True when this failure opens (or re-opens) the breaker
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class PublisherMetrics:
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record_success(self, latency):
+        with self._lock:
+            self.attempts += 1
+            self.successes += 1
+            self.latencies.append(latency)
+
+    def record_failure(self, latency):
+        with self._lock:
+            self.attempts += 1
+            self.failures += 1
+            self.latencies.append(latency)
+
+    def record_rate_limited(self):
+        with self._lock:
+            self.attempts += 1
+            self.rate_limited += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                'attempts': self.attempts,
+                'successes': self.successes,
+                'failures': self.failures,
+                'rate_limited': self.rate_limited,
+            }
+        if latencies:
+            snapshot['latency_avg'] = sum(latencies) / len(latencies)
+            snapshot['latency_p50'] = latencies[len(latencies) // 2]
+            snapshot['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return snapshot
@@ -0,0 +1,277 @@
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from fake_opensky_server import make_synthetic_states, start_fake_opensky_server
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Records OpenSky /states/all snapshots to gzip-compressed JSON lines and
+# replays them through the whole bot (job -> fetch -> lifecycle -> enrichment
+# -> storage -> post queue) against a fake OpenSky endpoint and a null
+# publisher, timing each stage.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Per-cycle INFO logging from these is silenced during a replay
+QUIET_LOGGERS = ('main', 'opensky_api', 'storage', 'post_queue', 'fleets', 'social_media_handler',
+                 'flight_lifecycle', 'route_inference')
+LAST_CONTACT, TIME_POSITION = 4, 3
+STAGES = (
+    # (stage name, attribute of main that is timed)
+    ('fetch', 'fetch_aircraft_flights'),
+    ('lifecycle', 'FLIGHT_LIFECYCLE.observe'),
+    ('dedupe', 'check_duplicates'),
+    ('enrich', 'enrich_flights'),
+    ('post', 'compose_takeoff_posts'),
+    ('storage', 'record_takeoffs'),
+    ('process', 'process_flights'),
+)
+
+
+def save_snapshots(path, snapshots):
+    # One {"time": ..., "states": [...]} object per line
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for snapshot in snapshots:
+            f.write(json.dumps(snapshot, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def load_snapshots(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_snapshots(path, count, interval, params=None):
+    # Polls the configured OpenSky endpoint; params may hold a bounding box
+    from opensky_api import OPENSKY_CLIENT
+
+    def poll():
+        for i in range(count):
+            started = time.monotonic()
+            states = OPENSKY_CLIENT.get_states(params)
+            snapshot_time = max((state[LAST_CONTACT] or 0 for state in states), default=0) or int(time.time())
+            logger.info(f"Recorded snapshot {i + 1}/{count}: {len(states)} states")
+            yield {'time': snapshot_time, 'states': states}
+            if i + 1 < count:
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    return save_snapshots(path, poll())
+
+
+def _move(lat, lon, track, km):
+    lat_r, lon_r, theta = map(math.radians, (lat, lon, track))
+    delta = km / 6371
+    lat2 = math.asin(math.sin(lat_r) * math.cos(delta) + math.cos(lat_r) * math.sin(delta) * math.cos(theta))
+    lon2 = lon_r + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(lat_r),
+                              math.cos(delta) - math.sin(lat_r) * math.sin(lat2))
+    return round(math.degrees(lat2), 4), round((math.degrees(lon2) + 540) % 360 - 180, 4)
+
+
+def simulate_snapshots(count, cycles, interval=300, takeoff_rate=0.05, landing_rate=0.02, seed=747):
+    # Synthetic traffic that moves between snapshots: aircraft on the ground
+    # take off, airborne ones fly along their track, climb and sometimes land
+    rng = random.Random(seed)
+    start = int(time.time()) - cycles * interval
+    states = [list(state) for state in make_synthetic_states(count, seed=seed, timestamp=start)]
+    for cycle in range(cycles):
+        now = start + cycle * interval
+        for state in states:
+            if state[8]:
+                if rng.random() < takeoff_rate:
+                    state[7:12] = [400.0, False, 85.0, state[10], 10.0]
+            elif rng.random() < landing_rate:
+                state[7:12] = [0.0, True, 5.0, state[10], 0.0]
+            else:
+                state[6], state[5] = _move(state[6], state[5], state[10], state[9] * interval / 1000)
+                state[7] = round(min(11500.0, state[7] + (state[11] or 0) * interval), 2)
+                state[11] = 0.0 if state[7] >= 11500 else state[11]
+            state[TIME_POSITION] = state[LAST_CONTACT] = now - rng.randrange(0, 10)
+        yield {'time': now, 'states': [list(state) for state in states]}
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.samples = {}
+
+    def wrap(self, owner, attribute, stage):
+        original = getattr(owner, attribute)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+
+        setattr(owner, attribute, timed)
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[stage] = {
+                'calls': len(ordered),
+                'total_ms': sum(ordered) * 1000,
+                'p50_ms': ordered[len(ordered) // 2] * 1000,
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                'max_ms': ordered[-1] * 1000,
+            }
+        return result
+
+
+class ReplayDriver:
+    # Runs the bot in a scratch directory so flights.db and the post queue
+    # start empty. main is imported only after changing into it, because
+    # storage opens flights.db at import.
+
+    def __init__(self, fleet_icao24s, workdir=None, quiet=True):
+        if quiet:
+            for name in QUIET_LOGGERS:
+                logging.getLogger(name).setLevel(logging.WARNING)
+        self.workdir = workdir or tempfile.mkdtemp(prefix='replay-')
+        os.chdir(self.workdir)
+        if BASE_DIR not in sys.path:
+            sys.path.insert(0, BASE_DIR)
+        import main
+        import opensky_api
+        import social_media_handler
+        import storage
+        from fleets import Fleet, FLEET_INDEX
+
+        self.main = main
+        self.storage = storage
+        self.social_media_handler = social_media_handler
+        main.AIRPORT_DB_BIN = os.path.join(BASE_DIR, main.AIRPORT_DB_BIN)
+        main.AIRPORT_DB_JSON = os.path.join(BASE_DIR, main.AIRPORT_DB_JSON)
+        FLEET_INDEX.replace_fleets([Fleet('replay', aircraft_type='Replay aircraft', icao24=fleet_icao24s)])
+        social_media_handler.configure_publishers({'null': {'type': 'null'}})
+        self.server = start_fake_opensky_server([])
+        opensky_api.OPENSKY_API_URL = self.server.base_url
+        self.timer = StageTimer()
+        for stage, attribute in STAGES:
+            owner = main
+            *path, name = attribute.split('.')
+            for part in path:
+                owner = getattr(owner, part)
+            self.timer.wrap(owner, name, stage)
+
+    def _db_changes(self):
+        queue = self.social_media_handler.get_post_queue()
+        return self.storage.get_db_connection().total_changes + queue._conn.total_changes
+
+    def run(self, snapshots, speed=0):
+        # speed: 1 replays in real time, 10 ten times faster, 0 as fast as possible
+        main = self.main
+        self.social_media_handler.start_posting()
+        changes_before = self._db_changes()
+        states_seen = 0
+        cycles = 0
+        previous_time = None
+        started = time.perf_counter()
+        try:
+            for snapshot in snapshots:
+                if speed and previous_time is not None:
+                    time.sleep(max(0.0, (snapshot['time'] - previous_time) / speed))
+                previous_time = snapshot['time']
+                # Shift the recorded times to now, so freshness checks see live data
+                offset = int(time.time()) - snapshot['time']
+                states = snapshot['states']
+                for state in states:
+                    for field in (TIME_POSITION, LAST_CONTACT):
+                        if state[field] is not None:
+                            state[field] += offset
+                self.server.states = states
+                self.server.timestamp = snapshot['time'] + offset
+                main.job()
+                states_seen += len(states)
+                cycles += 1
+        finally:
+            elapsed = time.perf_counter() - started
+            queue = self.social_media_handler.get_post_queue()
+            # Let the null publisher drain what was queued before stopping
+            deadline = time.monotonic() + 10
+            while queue.depth() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            posts = sum(metrics['successes'] for metrics in queue.metrics().values())
+            self.social_media_handler.stop_posting()
+
+        return {
+            'cycles': cycles,
+            'states': states_seen,
+            'elapsed_s': elapsed,
+            'states_per_s': states_seen / elapsed if elapsed else 0.0,
+            'stages': self.timer.summary(),
+            'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'sqlite_changes': self._db_changes() - changes_before,
+            'posts_delivered': posts,
+        }
+
+    def close(self):
+        self.server.shutdown()
+
+
+def log_report(report):
+    logger.info(f"{report['cycles']} cycles, {report['states']} states in {report['elapsed_s']:.2f} s "
+                f"({report['states_per_s']:.0f} states/s), peak RSS {report['peak_rss_mib']:.1f} MiB, "
+                f"{report['sqlite_changes']} SQLite row changes, {report['posts_delivered']} posts")
+    for stage, _ in STAGES:
+        sample = report['stages'].get(stage)
+        if sample:
+            logger.info(f"  {stage:<10} {sample['calls']:>5} calls  p50 {sample['p50_ms']:8.2f} ms  "
+                        f"p95 {sample['p95_ms']:8.2f} ms  max {sample['max_ms']:8.2f} ms")
+
+
+def fleet_sample(snapshots, fleet_size, seed=1):
+    icao24s = sorted({state[0] for snapshot in snapshots for state in snapshot['states']})
+    return random.Random(seed).sample(icao24s, min(fleet_size, len(icao24s)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record OpenSky snapshots or replay them through the bot.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help="save live /states/all snapshots")
+    record.add_argument('path')
+    record.add_argument('--count', type=int, default=12)
+    record.add_argument('--interval', type=float, default=300)
+    simulate = commands.add_parser('simulate', help="save synthetic moving traffic")
+    simulate.add_argument('path')
+    simulate.add_argument('--states', type=int, default=12000)
+    simulate.add_argument('--cycles', type=int, default=12)
+    replay = commands.add_parser('replay', help="feed saved snapshots through the bot")
+    replay.add_argument('path')
+    replay.add_argument('--fleet', type=int, default=400, help="aircraft tracked, sampled from the snapshots")
+    replay.add_argument('--speed', type=float, default=0, help="1 = real time, 0 = as fast as possible")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        count = record_snapshots(args.path, args.count, args.interval)
+        logger.info(f"Saved {count} snapshots to {args.path}")
+    elif args.command == 'simulate':
+        count = save_snapshots(args.path, simulate_snapshots(args.states, args.cycles))
+        logger.info(f"Saved {count} snapshots to {args.path}")
+    else:
+        path = os.path.abspath(args.path)
+        snapshots = list(load_snapshots(path))
+        driver = ReplayDriver(fleet_sample(snapshots, args.fleet))
+        try:
+            log_report(driver.run(snapshots, args.speed))
+        finally:
+            driver.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import logging
+import math
+import threading
+import time
+from functools import lru_cache
+from airport_index import AirportIndex
+from storage import load_route_history
+from track_history import bearing
+
+logger = logging.getLogger(__name__)
+
+# Destination and duration inference from the bot's own flight history.
+# Landed flights in flights.db are folded into a route table keyed by
+# callsign; a takeoff whose callsign (and origin) has been seen before gets
+# the most common destination and the average duration of that route.
+# Unknown callsigns fall back to ranking the airports the fleet has landed at
+# by how well they line up with the aircraft's track.
+
+REFRESH_INTERVAL = 3600  # seconds between route table rebuilds
+MIN_ROUTE_DURATION = 10 * 60  # seconds; shorter "flights" are noise
+MAX_ROUTE_DURATION = 20 * 3600
+MAX_HEADING_RANGE_KM = 15000
+MAX_HEADING_DEVIATION = 20  # degrees between the track and the bearing to a candidate
+HISTORY_WEIGHT = 2.0  # degrees of deviation forgiven per e-fold of past arrivals
+MAX_REVERSE_DEVIATION = 90  # a callsign-only route is ignored when flying away from it
+CACHE_SIZE = 4096
+# Heading lookups are cached on a coarse grid
+POSITION_STEP = 0.5  # degrees
+TRACK_STEP = 5  # degrees
+
+
+class Route:
+
+    def __init__(self, callsign, origin, destination, flights, duration):
+        self.callsign = callsign
+        self.origin = origin
+        self.destination = destination
+        self.flights = flights
+        self.duration = duration  # average seconds from takeoff to landing
+
+    def __repr__(self):
+        return f"Route({self.callsign} {self.origin}->{self.destination}, {self.flights} flights)"
+
+
+class RouteTable:
+
+    def __init__(self, rows=()):
+        # rows as returned by storage.load_route_history
+        self.by_callsign = {}
+        self.arrivals = {}
+        for callsign, origin, destination, flights, duration in rows:
+            route = Route(callsign, origin, destination, flights, duration)
+            self.by_callsign.setdefault(callsign, []).append(route)
+            self.arrivals[destination] = self.arrivals.get(destination, 0) + flights
+        for routes in self.by_callsign.values():
+            routes.sort(key=lambda route: route.flights, reverse=True)
+
+    def __len__(self):
+        return sum(len(routes) for routes in self.by_callsign.values())
+
+    def routes_for(self, callsign):
+        return self.by_callsign.get(callsign, [])
+
+
+class RouteInference:
+
+    def __init__(self, get_airport_db, load_history=load_route_history):
+        self._get_airport_db = get_airport_db
+        self._load_history = load_history
+        self._lock = threading.Lock()
+        self._refreshed_at = None
+        self.table = RouteTable()
+        self._arrival_index = None
+        self._arrival_positions = {}
+        self._lookup = lru_cache(maxsize=CACHE_SIZE)(self._lookup_route)
+        self._rank = lru_cache(maxsize=CACHE_SIZE)(self._rank_by_heading)
+
+    def refresh(self, force=False):
+        # Rebuilds the route table at most every REFRESH_INTERVAL seconds
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._refreshed_at is not None and now - self._refreshed_at < REFRESH_INTERVAL:
+                return False
+            self._refreshed_at = now
+        table = RouteTable(self._load_history(MIN_ROUTE_DURATION, MAX_ROUTE_DURATION))
+        airport_db = self._get_airport_db()
+        codes = [code for code in table.arrivals if code in airport_db]
+        positions = {code: (airport_db[code]['lat'], airport_db[code]['lon']) for code in codes}
+        index = AirportIndex.build(codes, [positions[code][0] for code in codes],
+                                   [positions[code][1] for code in codes]) if codes else None
+        with self._lock:
+            self.table = table
+            self._arrival_positions = positions
+            self._arrival_index = index
+            self._lookup.cache_clear()
+            self._rank.cache_clear()
+        logger.info(f"Route table rebuilt: {len(table)} routes, {len(codes)} destination airports")
+        return True
+
+    def _lookup_route(self, callsign, origin):
+        routes = self.table.routes_for(callsign)
+        for route in routes:
+            if route.origin == origin:
+                return route
+        return routes[0] if routes else None
+
+    def _rank_by_heading(self, latitude, longitude, track, exclude):
+        # Known destinations within range, best aligned with the track first
+        if self._arrival_index is None:
+            return ()
+        ranked = []
+        for code, km in self._arrival_index.within_radius(latitude, longitude, MAX_HEADING_RANGE_KM):
+            if code == exclude or km < 1:
+                continue
+            lat, lon = self._arrival_positions[code]
+            deviation = abs((bearing(latitude, longitude, lat, lon) - track + 180) % 360 - 180)
+            if deviation > MAX_HEADING_DEVIATION:
+                continue
+            score = deviation - HISTORY_WEIGHT * math.log1p(self.table.arrivals.get(code, 0))
+            ranked.append((score, code))
+        ranked.sort()
+        return tuple(code for _, code in ranked)
+
+    def candidates_by_heading(self, latitude, longitude, track, exclude=None):
+        return self._rank(round(latitude / POSITION_STEP) * POSITION_STEP,
+                          round(longitude / POSITION_STEP) * POSITION_STEP,
+                          round(track / TRACK_STEP) * TRACK_STEP % 360, exclude)
+
+    def infer(self, flight_data):
+        # Returns (destination code or None, expected duration in seconds or
+        # None) for an enriched takeoff; 'origin' should already be set
+        callsign = (flight_data.get('callsign') or '').strip()
+        origin = flight_data.get('origin')
+        track = flight_data.get('true_track')
+        latitude, longitude = flight_data.get('latitude'), flight_data.get('longitude')
+
+        route = self._lookup(callsign, origin) if callsign else None
+        if route is not None and route.origin != origin and track is not None and latitude is not None:
+            # Same callsign from another origin: only trust it if we are heading that way
+            position = self._arrival_positions.get(route.destination)
+            if position is None or abs((bearing(latitude, longitude, *position) - track + 180) % 360 - 180) > MAX_REVERSE_DEVIATION:
+                route = None
+        if route is not None:
+            return route.destination, route.duration if route.origin == origin else None
+
+        if track is None or latitude is None or longitude is None:
+            return None, None
+        candidates = self.candidates_by_heading(latitude, longitude, track, origin)
+        return (candidates[0] if candidates else None), None
@@ -0,0 +1,290 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from multiprocessing import shared_memory
+import numpy as np
+import config
+import metrics
+from opensky_api import fetch_aircraft_flights
+
+logger = logging.getLogger(__name__)
+
+# Multi-process mode for large fleets. The main process only polls OpenSky
+# and publishes each snapshot in a shared memory block, with the rows sorted
+# by shard. One worker process per shard (icao24 crc32 modulo the worker
+# count) runs the detection and enrichment pipeline from main on its own rows.
+# Because an aircraft always lands on the same worker, its lifecycle state,
+# track history and in-progress entry live in that process only. Workers hand
+# every flights.db write, takeoff posts included, to a single writer process,
+# which group-commits them and runs the post queue. After each snapshot a
+# worker waits for the writer to confirm its writes; if some failed, it
+# reloads its registry from the database and retries the lost takeoffs.
+
+DISPATCH_TIMEOUT = 600  # seconds to wait for the shards to finish one snapshot
+WRITER_BATCH = 256  # queued write batches folded into one transaction
+
+# One row per state vector; None is stored as NaN (floats), -1 (flags) or b''
+STATE_DTYPE = np.dtype([
+    ('shard', 'u2'),
+    ('icao24', 'S6'),
+    ('callsign', 'S8'),
+    ('origin_country', 'S64'),
+    ('time_position', 'f8'),
+    ('last_contact', 'f8'),
+    ('longitude', 'f8'),
+    ('latitude', 'f8'),
+    ('baro_altitude', 'f8'),
+    ('on_ground', 'i1'),
+    ('velocity', 'f8'),
+    ('true_track', 'f8'),
+    ('vertical_rate', 'f8'),
+    ('geo_altitude', 'f8'),
+    ('squawk', 'S4'),
+    ('spi', 'i1'),
+    ('position_source', 'i1'),
+])
+# State vector index of each column; index 12 (sensors) is not kept
+COLUMNS = (
+    ('icao24', 0), ('callsign', 1), ('origin_country', 2), ('time_position', 3), ('last_contact', 4),
+    ('longitude', 5), ('latitude', 6), ('baro_altitude', 7), ('on_ground', 8), ('velocity', 9),
+    ('true_track', 10), ('vertical_rate', 11), ('geo_altitude', 13), ('squawk', 14), ('spi', 15),
+    ('position_source', 16),
+)
+STATE_LENGTH = 17
+TEXT_COLUMNS = {'icao24', 'callsign', 'origin_country', 'squawk'}
+FLAG_COLUMNS = {'on_ground', 'spi'}
+TIME_COLUMNS = {'time_position', 'last_contact'}
+
+
+def shard_of(icao24, shards):
+    return zlib.crc32(icao24.encode('ascii', 'replace')) % shards
+
+
+def _field(state, index):
+    return state[index] if len(state) > index else None
+
+
+def pack_states(states, shards):
+    # Copies the states into a new shared memory block, sorted by shard.
+    # Returns the block and the row offsets: shard k owns rows offsets[k]:offsets[k + 1].
+    states = sorted(states, key=lambda state: shard_of(state[0], shards))
+    count = len(states)
+    block = shared_memory.SharedMemory(create=True, size=max(1, count * STATE_DTYPE.itemsize))
+    rows = np.ndarray(count, dtype=STATE_DTYPE, buffer=block.buf)
+    rows['shard'] = [shard_of(state[0], shards) for state in states]
+    for name, index in COLUMNS:
+        values = [_field(state, index) for state in states]
+        if name in TEXT_COLUMNS:
+            rows[name] = [(value or '').encode('utf-8')[:STATE_DTYPE[name].itemsize] for value in values]
+        elif name in FLAG_COLUMNS:
+            rows[name] = [-1 if value is None else int(bool(value)) for value in values]
+        elif name == 'position_source':
+            rows[name] = [-1 if value is None else value for value in values]
+        else:
+            rows[name] = [np.nan if value is None else value for value in values]
+    offsets = np.searchsorted(rows['shard'], np.arange(shards + 1)).tolist()
+    del rows  # drop the view so the block can be closed
+    return block, offsets
+
+
+def unpack_states(buffer, count, start, stop):
+    # Rebuilds state vector lists for rows start:stop, reading the shared
+    # buffer in place
+    rows = np.ndarray(count, dtype=STATE_DTYPE, buffer=buffer)[start:stop]
+    states = [[None] * STATE_LENGTH for _ in range(len(rows))]
+    for name, index in COLUMNS:
+        values = rows[name].tolist()
+        for state, value in zip(states, values):
+            if name in TEXT_COLUMNS:
+                value = value.decode('utf-8', 'replace')
+                state[index] = value if value or name == 'icao24' else None
+            elif name in FLAG_COLUMNS:
+                state[index] = None if value < 0 else bool(value)
+            elif name == 'position_source':
+                state[index] = None if value < 0 else value
+            elif value != value:
+                state[index] = None
+            else:
+                state[index] = int(value) if name in TIME_COLUMNS else value
+    return states
+
+
+def _process_metrics_port(offset):
+    port = getattr(config, 'METRICS_PORT', None)
+    if port:
+        metrics.start_metrics_server(port + offset)
+
+
+def _flush_writes(shard, writes, acks):
+    # Waits until the writer has applied this shard's queued writes and
+    # rolls the registry back to the database if any of them failed
+    import main
+    import storage
+
+    writes.put(('flush', shard))
+    try:
+        failed = acks.get(timeout=DISPATCH_TIMEOUT)
+    except queue.Empty:
+        logger.error(f"Shard {shard} timed out waiting for the writer; reloading its registry")
+        failed = None
+    if failed == []:
+        return
+    if failed:
+        logger.warning(f"Shard {shard}: {len(failed)} write batches failed; reloading its registry")
+        main.retry_takeoffs(row[0] for operations in failed for statement, rows in operations
+                            if statement == storage.UPSERT_TAKEOFF for row in rows)
+    storage.load_in_progress()
+
+
+def run_worker(shard, shards, tasks, results, writes, acks):
+    # Shutdown is driven by the parent through the task queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import main
+    import storage
+    from fleets import FLEET_INDEX
+
+    storage.use_write_sink(lambda operations: writes.put(('sql', shard, operations)),
+                           owns=lambda icao24: shard_of(icao24, shards) == shard)
+    _process_metrics_port(1 + shard)
+    logger.info(f"Shard {shard}/{shards} worker started (pid {os.getpid()})")
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        sequence, name, count, start, stop = task
+        processed = 0
+        try:
+            block = shared_memory.SharedMemory(name=name)
+            try:
+                states = unpack_states(block.buf, count, start, stop)
+            finally:
+                block.close()
+            FLEET_INDEX.refresh()
+            main.process_flights(states)
+            processed = len(states)
+        except Exception as e:
+            logger.error(f"Shard {shard} failed to process snapshot {name}: {e}", exc_info=True)
+        _flush_writes(shard, writes, acks)
+        results.put((sequence, processed))
+
+
+def run_writer(writes, acks, shards):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import social_media_handler
+    import storage
+
+    _process_metrics_port(1 + shards)
+    social_media_handler.start_posting()
+    post_queue = social_media_handler.get_post_queue()
+    failures = [[] for _ in range(shards)]  # failed write batches per shard, until its next flush
+    stopping = False
+    try:
+        while not stopping:
+            items = [writes.get()]
+            while len(items) < WRITER_BATCH:
+                try:
+                    items.append(writes.get_nowait())
+                except queue.Empty:
+                    break
+            batches = []
+            flushes = []
+            for item in items:
+                if item is None:
+                    stopping = True
+                elif item[0] == 'flush':
+                    flushes.append(item[1])
+                else:
+                    batches.append(item[1:])
+            if batches:
+                failed = storage.apply_writes([operations for _, operations in batches])
+                for index in failed:
+                    shard, operations = batches[index]
+                    failures[shard].append(operations)
+                # Takeoff posts arrive inside the write batches
+                post_queue.notify()
+            # A shard waits for its flush before queueing more writes, so
+            # every write it sent before the flush has been applied by now
+            for shard in flushes:
+                acks[shard].put(failures[shard])
+                failures[shard] = []
+    finally:
+        social_media_handler.stop_posting()
+
+
+class ShardedTracker:
+
+    def __init__(self, workers=None, fetch=fetch_aircraft_flights):
+        # fetch() returns the fleet's state vectors, from OpenSky by default
+        self.fetch = fetch
+        self.shards = workers or os.cpu_count() or 1
+        context = multiprocessing.get_context('spawn')
+        self.writes = context.Queue()
+        self.results = context.Queue()
+        self.tasks = [context.Queue() for _ in range(self.shards)]
+        self.acks = [context.Queue() for _ in range(self.shards)]
+        self.writer = context.Process(target=run_writer, args=(self.writes, self.acks, self.shards),
+                                      name='tracker-writer', daemon=True)
+        self.sequence = 0
+        self.workers = [context.Process(target=run_worker, args=(shard, self.shards, self.tasks[shard],
+                                                                 self.results, self.writes, self.acks[shard]),
+                                        name=f'tracker-shard-{shard}', daemon=True)
+                        for shard in range(self.shards)]
+
+    def start(self):
+        self.writer.start()
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"Sharded tracker started with {self.shards} workers and a writer")
+
+    def dispatch(self, states):
+        # Publishes one snapshot and waits until every shard has processed it,
+        # so each shard sees the snapshots in order
+        self.sequence += 1
+        block, offsets = pack_states(states, self.shards)
+        try:
+            for shard in range(self.shards):
+                self.tasks[shard].put((self.sequence, block.name, len(states), offsets[shard], offsets[shard + 1]))
+            processed = 0
+            pending = self.shards
+            deadline = time.monotonic() + DISPATCH_TIMEOUT
+            while pending:
+                try:
+                    sequence, count = self.results.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    dead = [worker.name for worker in self.workers if not worker.is_alive()]
+                    logger.error(f"Timed out waiting for {pending} shards (dead workers: {', '.join(dead) or 'none'})")
+                    break
+                if sequence != self.sequence:
+                    continue  # late answer for a snapshot that timed out
+                pending -= 1
+                processed += count
+            return processed
+        finally:
+            block.close()
+            block.unlink()
+
+    def job(self):
+        try:
+            flights = self.fetch()
+            if not flights:
+                logger.warning("No flights fetched. The fleet CSV files might be missing or empty.")
+                return
+            processed = self.dispatch(flights)
+            logger.info(f"Processed {processed} of {len(flights)} flights across {self.shards} shards.")
+        except Exception as e:
+            logger.error(f"An error occurred during the sharded job: {e}", exc_info=True)
+
+    def stop(self, timeout=30):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        # Workers have flushed their writes; the sentinel queues behind them
+        self.writes.put(None)
+        self.writer.join(timeout)
+        logger.info("Sharded tracker stopped")
@@ -0,0 +1,94 @@
+import logging
+from bisect import bisect_right
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Change-only view of consecutive poll snapshots. Each aircraft is reduced to
+# a small key (on the ground, altitude band, has a position, callsign, fleets
+# it matches); diff() compares the keys with the previous snapshot and emits
+# an event only when an aircraft appears, its key changes, or it disappears.
+# A cruising aircraft produces no events, so the work downstream of the diff
+# follows the events, not the fleet size. Listeners subscribed with
+# subscribe() get each cycle's events.
+
+NEW = 'new'
+CHANGED = 'changed'
+DISAPPEARED = 'disappeared'
+# Band edges in metres: takeoff roll and initial climb are split finely,
+# anything above FL300 is one band
+ALTITUDE_BANDS_M = (300, 1500, 3000, 6000, 9000)
+
+EVENTS = metrics.counter('delta_events', "Snapshot delta events by kind", ('kind',))
+
+
+class DeltaEvent:
+    __slots__ = ('kind', 'icao24', 'state', 'previous')
+
+    def __init__(self, kind, icao24, state, previous):
+        self.kind = kind
+        self.icao24 = icao24
+        self.state = state  # this poll's flight data, None when disappeared
+        self.previous = previous  # last poll's flight data, None when new
+
+    def __repr__(self):
+        return f"DeltaEvent({self.kind} {self.icao24})"
+
+
+class SnapshotDiffer:
+
+    def __init__(self, bands=ALTITUDE_BANDS_M):
+        self.bands = tuple(bands)
+        self.current = {}  # icao24 -> flight data from the latest diff()
+        self.previous = {}  # the snapshot before that
+        self._keys = {}
+        self._listeners = []
+
+    def key(self, flight_data):
+        altitude = flight_data.get('altitude')
+        on_ground = flight_data.get('on_ground')
+        return (None if on_ground is None else bool(on_ground),
+                None if altitude is None else bisect_right(self.bands, altitude),
+                flight_data.get('latitude') is not None and flight_data.get('longitude') is not None,
+                (flight_data.get('callsign') or '').strip(),
+                tuple(fleet.name for fleet in flight_data.get('fleets') or ()))
+
+    def subscribe(self, listener):
+        # listener(events) is called after every diff(), in subscription order
+        self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def diff(self, flights_data):
+        # flights_data: one poll's build_flight_data dicts. Returns the events.
+        current = {}
+        keys = {}
+        events = []
+        for flight_data in flights_data:
+            icao24 = flight_data['icao24']
+            key = self.key(flight_data)
+            current[icao24] = flight_data
+            keys[icao24] = key
+            old = self._keys.get(icao24)
+            if old is None:
+                events.append(DeltaEvent(NEW, icao24, flight_data, None))
+            elif old != key:
+                events.append(DeltaEvent(CHANGED, icao24, flight_data, self.current[icao24]))
+        for icao24 in self._keys.keys() - keys.keys():
+            events.append(DeltaEvent(DISAPPEARED, icao24, None, self.current[icao24]))
+
+        self.previous, self.current, self._keys = self.current, current, keys
+        for event in events:
+            EVENTS.labels(event.kind).inc()
+        for listener in self._listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error(f"Snapshot delta listener {listener} failed: {e}", exc_info=True)
+        return events
+
+    def reset(self):
+        # The next diff() reports every aircraft as new
+        self.current, self.previous, self._keys = {}, {}, {}
@@ -1,6 +1,11 @@
 import tweepy
 import time
 import logging
+from datetime import datetime, timezone
+from post_queue import PostQueue
+from publishers import Publisher, RateLimitError, PermanentPostError, register_publisher, create_publisher, \
+    DEFAULT_PUBLISHERS
+import config
 from twitter_config import (
     TWITTER_API_KEY,
     TWITTER_API_SECRET,
@@ -19,43 +24,89 @@ client = tweepy.Client(
     access_token_secret=TWITTER_ACCESS_TOKEN_SECRET
 )
 
+# Posts go through a durable queue in flights.db and are delivered by one
+# background worker per network, so a throttled or failing network never
+# blocks the poll loop or the other networks.
+POST_QUEUE_DB = 'flights.db'
+
 def post_to_twitter(message):
-    max_retries = 3
-    retry_delay = 60  # seconds
-
-    for attempt in range(max_retries):
-        try:
-            response = client.create_tweet(text=message)
-            if response.data:
-                tweet_id = response.data['id']
-                logger.info(f"Successfully posted to Twitter. Tweet ID: {tweet_id}")
-            else:
-                logger.warning("Tweet was created, but no data was returned.")
-            return
-        except tweepy.TooManyRequests:
-            if attempt < max_retries - 1:
-                logger.warning(f"Rate limit exceeded. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                logger.error("Failed to post to Twitter after multiple attempts due to rate limiting.")
-        except tweepy.TwitterServerError as e:
-            logger.error(f"Twitter server error: {e}")
-        except tweepy.Forbidden as e:
-            logger.error(f"Twitter authentication error: {e}")
-        except tweepy.BadRequest as e:
-            logger.error(f"Bad request error: {e}")
-        except tweepy.NotFound as e:
-            logger.error(f"Not found error: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error posting to Twitter: {e}")
-
-def post_updates(flight, message):
-    # Post to Twitter
-    post_to_twitter(message)
-
-    # Add logic to post to other social networks here
-    # For example:
-    # post_to_facebook(message)
-    # post_to_instagram(message)
-
-    logger.info(f"Posted update for flight {flight['icao24']}")
\ No newline at end of file
+    # One delivery attempt; retries and backoff are the queue's job
+    try:
+        response = client.create_tweet(text=message)
+    except tweepy.TooManyRequests as e:
+        reset = e.response.headers.get('x-rate-limit-reset') if e.response is not None else None
+        retry_after = max(0, int(reset) - time.time()) if reset and reset.isdigit() else None
+        raise RateLimitError("Twitter rate limit exceeded", retry_after)
+    except (tweepy.Forbidden, tweepy.BadRequest, tweepy.NotFound) as e:
+        logger.error(f"Twitter rejected the post: {e}")
+        raise PermanentPostError(str(e))
+    if response.data:
+        tweet_id = response.data['id']
+        logger.info(f"Successfully posted to Twitter. Tweet ID: {tweet_id}")
+        return tweet_id
+    logger.warning("Tweet was created, but no data was returned.")
+    return None
+
+@register_publisher('twitter')
+class TwitterPublisher(Publisher):
+    default_rate_limit = (50, 24 * 3600)
+
+    def publish(self, message):
+        return post_to_twitter(message)
+
+# network -> publisher settings; 'type' picks a registered Publisher class
+# and defaults to the network name
+PUBLISHERS = getattr(config, 'PUBLISHERS', DEFAULT_PUBLISHERS)
+
+_publishers = None
+_post_queue = None
+
+def get_post_queue():
+    global _post_queue
+    if _post_queue is None:
+        _post_queue = PostQueue(POST_QUEUE_DB)
+    return _post_queue
+
+def get_publishers():
+    global _publishers
+    if _publishers is None:
+        _publishers = {name: create_publisher(name, settings) for name, settings in PUBLISHERS.items()}
+    return _publishers
+
+def configure_publishers(settings):
+    # Replaces the configured networks, e.g. with a null publisher for replays
+    global PUBLISHERS, _publishers
+    PUBLISHERS = settings
+    _publishers = None
+
+def start_posting():
+    get_post_queue().start(get_publishers())
+
+def stop_posting():
+    if _post_queue is not None:
+        _post_queue.stop()
+
+def event_key(flight, fleet=None):
+    # One takeoff is one event: the aircraft and the takeoff time recorded in
+    # flights.db, so a second takeoff with the same callsign is a new event.
+    # Each fleet announcing the takeoff gets its own key.
+    takeoff_time = flight.get('takeoff_time') or datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    key = f"takeoff:{flight['icao24']}:{takeoff_time}"
+    return f"{key}:{fleet}" if fleet else key
+
+def takeoff_post(flight, message, networks=None, fleet=None):
+    # (networks, idempotency key, message) for storage.record_takeoffs, which
+    # queues the post in the same transaction as the takeoff
+    return (list(networks or PUBLISHERS), flight.get('event_key') or event_key(flight, fleet), message)
+
+def posts_queued(posts):
+    # Called once the posts are committed, so delivery starts without waiting
+    # for the workers' next scan
+    if _post_queue is not None:
+        _post_queue.notify({network for networks, _, _ in posts for network in networks})
+
+def post_updates(flight, message, networks=None, fleet=None):
+    networks, key, message = takeoff_post(flight, message, networks, fleet)
+    queued = get_post_queue().enqueue(networks, key, message)
+    if queued:
+        logger.info(f"Queued update for flight {flight['icao24']} on {', '.join(queued)}")
@@ -0,0 +1,143 @@
+import json
+import re
+
+# Incremental parser for OpenSky /states/all bodies. It walks the "states"
+# array row by row as chunks arrive, reads only the leading icao24 of each
+# row, and JSON-decodes just the rows whose icao24 is wanted. Peak memory is
+# one chunk plus the matching rows, whatever the global traffic.
+
+STATES_KEY = re.compile(rb'"states"\s*:\s*')
+TIME_FIELD = re.compile(rb'"time"\s*:\s*(\d+)')
+ROW_PREFIX = re.compile(rb'\[\s*"([^"\\]*)"')
+# A whole row with no nested array and no escaped characters (almost every
+# row), preceded by its separator. Quotes delimit each repetition, so the
+# pattern cannot backtrack badly on a row cut off at the buffer end.
+SIMPLE_ROW = re.compile(rb'[\s,]*(\[\s*"([^"\\]*)"[^\[\]"\\]*(?:"[^"\\]*"[^\[\]"\\]*)*\])')
+# Strings (with escapes), a lone quote (string cut off at the buffer end) or a bracket
+ROW_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|"|[\[\]]')
+WHITESPACE = b' \t\r\n'
+MAX_TIME_TAIL = 256  # bytes kept after the array while looking for "time"
+
+
+class StatesStreamError(ValueError):
+    pass
+
+
+def _find_row_end(buffer, start):
+    # Returns the index just past the row starting at buffer[start] == '[',
+    # or None if the row is not complete yet.
+    end = buffer.find(b']', start)
+    if end < 0:
+        return None
+    row = buffer[start:end]
+    # Fast path: no nested array, no escapes, balanced quotes
+    if b'[' not in row[1:] and b'\\' not in row and row.count(b'"') % 2 == 0:
+        return end + 1
+
+    depth = 0
+    for token in ROW_TOKEN.finditer(buffer, start):
+        value = token.group()
+        if value == b'[':
+            depth += 1
+        elif value == b']':
+            depth -= 1
+            if depth == 0:
+                return token.end()
+        elif value == b'"':
+            return None
+    return None
+
+
+def parse_states_stream(chunks, icao24_set):
+    # chunks: iterable of bytes. Returns (time, matching state rows).
+    buffer = b''
+    pos = 0
+    phase = 'header'
+    snapshot_time = None
+    states = []
+    chunks = iter(chunks)
+    wanted = {code.encode('ascii', 'ignore') for code in icao24_set}
+    wanted |= {code.upper() for code in wanted}
+
+    def more():
+        nonlocal buffer, pos
+        for chunk in chunks:
+            if chunk:
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                return True
+        return False
+
+    while True:
+        if phase == 'header':
+            match = STATES_KEY.search(buffer, pos)
+            if match is None or match.end() >= len(buffer):
+                if snapshot_time is None:
+                    time_match = TIME_FIELD.search(buffer, pos)
+                    if time_match and time_match.end() < len(buffer):
+                        snapshot_time = int(time_match.group(1))
+                # Keep enough bytes for a key split across chunks
+                pos = max(pos, len(buffer) - 32)
+                if not more():
+                    raise StatesStreamError("Response has no states field")
+                continue
+            if snapshot_time is None:
+                time_match = TIME_FIELD.search(buffer, pos, match.start())
+                if time_match:
+                    snapshot_time = int(time_match.group(1))
+            value = match.end()
+            if buffer.startswith(b'null', value):
+                pos = value + 4
+                phase = 'tail'
+            elif buffer[value:value + 1] == b'[':
+                pos = value + 1
+                phase = 'rows'
+            elif len(buffer) - value < 4:
+                # Possibly a cut-off null: keep the key and read on
+                if not more():
+                    raise StatesStreamError("Truncated states field")
+            else:
+                raise StatesStreamError("Unexpected states value")
+
+        elif phase == 'rows':
+            match = SIMPLE_ROW.match(buffer, pos)
+            while match is not None:
+                if match.group(2) in wanted:
+                    states.append(json.loads(match.group(1)))
+                pos = match.end()
+                match = SIMPLE_ROW.match(buffer, pos)
+            # Anything else (separator at the buffer end, nested array,
+            # escapes, a cut-off row, the closing bracket) goes the slow way
+            while pos < len(buffer) and buffer[pos] in WHITESPACE + b',':
+                pos += 1
+            if pos >= len(buffer):
+                if not more():
+                    raise StatesStreamError("Truncated states array")
+                continue
+            if buffer[pos:pos + 1] == b']':
+                pos += 1
+                phase = 'tail'
+                continue
+            end = _find_row_end(buffer, pos)
+            if end is None:
+                if not more():
+                    raise StatesStreamError("Truncated state vector")
+                continue
+            prefix = ROW_PREFIX.match(buffer, pos, end)
+            if prefix is None or prefix.group(1).decode('ascii', 'replace').lower() in icao24_set:
+                state = json.loads(buffer[pos:end])
+                if isinstance(state[0], str) and state[0].lower() in icao24_set:
+                    states.append(state)
+            pos = end
+
+        else:  # tail: only "time" may still be missing
+            if snapshot_time is not None:
+                return snapshot_time, states
+            time_match = TIME_FIELD.search(buffer, pos)
+            if time_match and time_match.end() < len(buffer):
+                return int(time_match.group(1)), states
+            pos = max(pos, len(buffer) - MAX_TIME_TAIL)
+            if not more():
+                if time_match:
+                    return int(time_match.group(1)), states
+                return None, states
@@ -1,67 +1,354 @@
 import sqlite3
+import threading
 import logging
+import multiprocessing
+import metrics
+from datetime import datetime, timedelta, timezone
+from post_queue import CREATE_POST_QUEUE_TABLE, CREATE_POST_QUEUE_INDEX, INSERT_JOB, job_rows
 
 logger = logging.getLogger(__name__)
 
+DB_FILENAME = 'flights.db'
+SCHEMA_VERSION = 3
+DB_SECONDS = metrics.histogram('db_operation_seconds', "flights.db call time, including waiting for the lock",
+                               ('operation',), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                                        0.1, 0.25, 0.5, 1, 5))
+
+# One long-lived connection shared by the bot. sqlite3 caches prepared
+# statements per connection, so the SQL below is kept in constants and
+# reused verbatim.
+_conn = None
+_lock = threading.RLock()
+
+# In-memory registry of in-progress flights keyed by icao24, loaded from the
+# database in init_db and written through after every successful commit, so
+# duplicate checks never touch SQLite.
+_in_progress = {}
+
+# In sharded mode (sharded_tracker) a worker process only keeps the flights
+# of its own shard in the registry, and its writes are handed to the writer
+# process, the only one that writes to the database.
+_owns = None  # icao24 -> bool
+_write_sink = None  # callable(operations)
+
+CREATE_FLIGHTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS flights (
+        flight_key INTEGER PRIMARY KEY,
+        id TEXT NOT NULL,
+        callsign TEXT,
+        takeoff_time TEXT,
+        landing_time TEXT,
+        origin_country TEXT,
+        estimated_landing_time TEXT,
+        status TEXT NOT NULL DEFAULT 'in_progress',
+        arrival_airport TEXT,
+        origin_airport TEXT
+    )
+"""
+# Closed flights older than the retention window are moved here by
+# archive_closed_flights so the hot table stays small.
+CREATE_ARCHIVE_TABLE = """
+    CREATE TABLE IF NOT EXISTS flights_archive (
+        flight_key INTEGER PRIMARY KEY,
+        id TEXT NOT NULL,
+        callsign TEXT,
+        takeoff_time TEXT,
+        landing_time TEXT,
+        origin_country TEXT,
+        estimated_landing_time TEXT,
+        status TEXT,
+        arrival_airport TEXT,
+        origin_airport TEXT
+    )
+"""
+# Columns added after schema version 1, applied with ALTER TABLE when missing
+ADDED_COLUMNS = (
+    ('arrival_airport', 'TEXT'),
+    ('origin_airport', 'TEXT'),
+)
+CREATE_FLIGHTS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_flights_id_status ON flights (id, status)",
+    # At most one open flight per aircraft
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_flights_in_progress ON flights (id) WHERE status = 'in_progress'",
+    "CREATE INDEX IF NOT EXISTS idx_flights_status_landing ON flights (status, landing_time)",
+)
+
+SELECT_ALL_IN_PROGRESS = """
+    SELECT id, callsign, takeoff_time, origin_country, estimated_landing_time
+    FROM flights WHERE status = 'in_progress'
+"""
+UPSERT_TAKEOFF = """
+    INSERT INTO flights (id, callsign, takeoff_time, origin_country, estimated_landing_time, origin_airport, status)
+    VALUES (?, ?, ?, ?, ?, ?, 'in_progress')
+    ON CONFLICT (id) WHERE status = 'in_progress' DO UPDATE SET
+        callsign = excluded.callsign,
+        origin_country = excluded.origin_country,
+        estimated_landing_time = COALESCE(excluded.estimated_landing_time, estimated_landing_time),
+        origin_airport = COALESCE(origin_airport, excluded.origin_airport)
+"""
+FINALIZE_FLIGHT = """
+    UPDATE flights
+    SET status = ?, landing_time = ?, arrival_airport = ?
+    WHERE id = ? AND status = 'in_progress'
+"""
+ARCHIVE_CLOSED_FLIGHTS = """
+    INSERT INTO flights_archive
+    SELECT flight_key, id, callsign, takeoff_time, landing_time, origin_country,
+           estimated_landing_time, status, arrival_airport, origin_airport
+    FROM flights
+    WHERE status != 'in_progress' AND COALESCE(landing_time, takeoff_time) < ?
+"""
+DELETE_CLOSED_FLIGHTS = """
+    DELETE FROM flights
+    WHERE status != 'in_progress' AND COALESCE(landing_time, takeoff_time) < ?
+"""
+# Landed flights per (callsign, origin, arrival) with their average duration,
+# from both the live table and the archive, for route_inference
+SELECT_ROUTE_HISTORY = """
+    SELECT TRIM(callsign), origin_airport, arrival_airport, COUNT(*),
+           AVG((julianday(landing_time) - julianday(takeoff_time)) * 86400)
+    FROM (
+        SELECT callsign, origin_airport, arrival_airport, takeoff_time, landing_time
+        FROM flights WHERE status = 'landed'
+        UNION ALL
+        SELECT callsign, origin_airport, arrival_airport, takeoff_time, landing_time
+        FROM flights_archive WHERE status = 'landed'
+    )
+    WHERE TRIM(COALESCE(callsign, '')) != '' AND arrival_airport IS NOT NULL
+      AND (julianday(landing_time) - julianday(takeoff_time)) * 86400 BETWEEN ? AND ?
+    GROUP BY 1, 2, 3
+"""
+
 def get_db_connection():
-    conn = sqlite3.connect('flights.db')
-    return conn
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = sqlite3.connect(DB_FILENAME, check_same_thread=False, cached_statements=64)
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.execute("PRAGMA synchronous=NORMAL")
+            _conn.execute("PRAGMA busy_timeout=5000")
+        return _conn
 
-def check_duplicate(flight_id):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM flights WHERE id = ? AND status = 'in_progress'", (flight_id,))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
+def close_db_connection():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
 
-def update_record(flight):
-    conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        c.execute("""
-            INSERT INTO flights (id, callsign, takeoff_time, origin_country, status)
-            VALUES (?, ?, datetime('now'), ?, 'in_progress')
-        """, (flight['icao24'], flight['callsign'], flight['origin_country']))
-        conn.commit()
-        logger.info(f"Updated record for flight {flight['icao24']}")
-    except sqlite3.Error as e:
-        logger.error(f"Error updating record for flight {flight['icao24']}: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
-
-def store_estimated_landing(flight_id, estimated_landing_time):
+def _utc_timestamp(moment=None):
+    # Same format as SQLite's datetime('now')
+    return (moment or datetime.now(timezone.utc)).strftime('%Y-%m-%d %H:%M:%S')
+
+def takeoff_time(flight, detected=None):
+    # The track history's takeoff time when known (route durations are
+    # learned from it), otherwise the time the takeoff was detected
+    takeoff_timestamp = flight.get('takeoff_timestamp')
+    if takeoff_timestamp is None:
+        return detected or _utc_timestamp()
+    return _utc_timestamp(datetime.fromtimestamp(takeoff_timestamp, timezone.utc))
+
+@DB_SECONDS.labels('load_in_progress').time()
+def load_in_progress():
+    with _lock:
+        rows = get_db_connection().execute(SELECT_ALL_IN_PROGRESS).fetchall()
+        if _owns is not None:
+            rows = [row for row in rows if _owns(row[0])]
+        _in_progress.clear()
+        for flight_id, callsign, takeoff_time, origin_country, estimated_landing_time in rows:
+            _in_progress[flight_id] = {
+                'callsign': callsign,
+                'takeoff_time': takeoff_time,
+                'origin_country': origin_country,
+                'estimated_landing_time': estimated_landing_time,
+            }
+    logger.info(f"Loaded {len(rows)} in-progress flights")
+
+def use_write_sink(sink, owns=None):
+    # sink(operations) receives every write as a list of (statement, rows)
+    # pairs to run in one transaction; owns(icao24) limits the registry
+    global _write_sink, _owns
+    _write_sink = sink
+    _owns = owns
+    load_in_progress()
+
+def _write(operations):
+    # Returns the rowcount of the last statement, or None when handed to the sink
+    if _write_sink is not None:
+        _write_sink(operations)
+        return None
     conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        c.execute("""
-            UPDATE flights
-            SET estimated_landing_time = ?
-            WHERE id = ? AND status = 'in_progress'
-        """, (estimated_landing_time, flight_id))
-        conn.commit()
-        logger.info(f"Stored estimated landing time for flight {flight_id}")
-    except sqlite3.Error as e:
-        logger.error(f"Error storing estimated landing time for flight {flight_id}: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+    cursor = None
+    with conn:
+        for statement, rows in operations:
+            cursor = conn.executemany(statement, rows)
+    return cursor.rowcount if cursor is not None else 0
+
+@DB_SECONDS.labels('apply_writes').time()
+def apply_writes(batches):
+    # Writer side of the sink: commits several batches of operations in one
+    # transaction, falling back to one transaction per batch if it fails.
+    # Returns the indexes of the batches that could not be written.
+    with _lock:
+        try:
+            _write([operation for operations in batches for operation in operations])
+            return []
+        except sqlite3.Error as e:
+            logger.warning(f"Group commit of {len(batches)} write batches failed ({e}). Retrying one by one...")
+        failed = []
+        for index, operations in enumerate(batches):
+            try:
+                _write(operations)
+            except sqlite3.Error as e:
+                logger.error(f"Error applying writes {[statement.split()[0] for statement, _ in operations]}: {e}")
+                failed.append(index)
+        return failed
+
+def get_in_progress_flight(flight_id):
+    with _lock:
+        entry = _in_progress.get(flight_id)
+        return dict(entry) if entry is not None else None
+
+def in_progress_ids():
+    with _lock:
+        return set(_in_progress)
+
+def check_duplicates(flight_ids):
+    # Returns the subset of flight_ids that already have an in-progress flight
+    with _lock:
+        return {flight_id for flight_id in flight_ids if flight_id in _in_progress}
+
+@DB_SECONDS.labels('record_takeoffs').time()
+def record_takeoffs(flights, posts=()):
+    # Inserts (or refreshes) every takeoff from one poll cycle, with its
+    # estimated landing time, in a single transaction. posts are
+    # (networks, idempotency_key, message) for the post queue, committed in
+    # the same transaction so a recorded takeoff is never left unannounced.
+    detected = _utc_timestamp()
+    rows = [(flight['icao24'], flight['callsign'], flight.get('takeoff_time') or takeoff_time(flight, detected),
+             flight['origin_country'], flight.get('estimated_landing_time'), flight.get('origin'))
+            for flight in flights]
+    if not rows:
+        return True
+    operations = [(UPSERT_TAKEOFF, rows)]
+    jobs = [job for networks, key, message in posts for job in job_rows(networks, key, message)]
+    if jobs:
+        operations.append((INSERT_JOB, jobs))
+    with _lock:
+        try:
+            _write(operations)
+            # Mirror the upsert: an existing entry keeps its takeoff time
+            for flight_id, callsign, recorded_takeoff_time, origin_country, estimated_landing_time, _ in rows:
+                entry = _in_progress.setdefault(flight_id, {'takeoff_time': recorded_takeoff_time,
+                                                            'estimated_landing_time': None})
+                entry['callsign'] = callsign
+                entry['origin_country'] = origin_country
+                if estimated_landing_time is not None:
+                    entry['estimated_landing_time'] = estimated_landing_time
+            logger.info(f"Recorded {len(rows)} takeoffs")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error recording {len(rows)} takeoffs: {e}")
+            return False
+
+@DB_SECONDS.labels('finalize_flights').time()
+def finalize_flights(flights):
+    # Closes in-progress flights in one transaction. Each item is a
+    # models.Flight whose status is the final one ('landed', 'lost', ...).
+    rows = [(flight.status, flight.landing_time, flight.arrival_airport, flight.id) for flight in flights]
+    if not rows:
+        return True
+    with _lock:
+        try:
+            _write([(FINALIZE_FLIGHT, rows)])
+            for flight in flights:
+                _in_progress.pop(flight.id, None)
+            logger.info(f"Finalized {len(rows)} flights")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error finalizing {len(rows)} flights: {e}")
+            return False
+
+@DB_SECONDS.labels('archive_closed_flights').time()
+def archive_closed_flights(retention_days=30):
+    cutoff = _utc_timestamp(datetime.now(timezone.utc) - timedelta(days=retention_days))
+    with _lock:
+        try:
+            archived = _write([(ARCHIVE_CLOSED_FLIGHTS, [(cutoff,)]), (DELETE_CLOSED_FLIGHTS, [(cutoff,)])])
+            if archived:
+                logger.info(f"Archived {archived} flights closed before {cutoff}")
+            return archived
+        except sqlite3.Error as e:
+            logger.error(f"Error archiving closed flights: {e}")
+            return 0
+
+@DB_SECONDS.labels('load_route_history').time()
+def load_route_history(min_duration, max_duration):
+    # Rows of (callsign, origin_airport, arrival_airport, flights, average
+    # duration in seconds) for landed flights lasting between the bounds
+    with _lock:
+        try:
+            return get_db_connection().execute(SELECT_ROUTE_HISTORY, (min_duration, max_duration)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error loading route history: {e}")
+            return []
+
+def _add_missing_columns(conn, table):
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, declaration in ADDED_COLUMNS:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+def _migrate_legacy_flights(conn):
+    # The original table had no key and no indexes, and nothing stopped an
+    # aircraft from having several open rows. Copy it across, keeping only the
+    # newest open row per aircraft in progress.
+    logger.info(f"Migrating flights table to schema version {SCHEMA_VERSION}...")
+    conn.execute("ALTER TABLE flights RENAME TO flights_legacy")
+    conn.execute(CREATE_FLIGHTS_TABLE)
+    conn.execute("""
+        INSERT INTO flights (id, callsign, takeoff_time, landing_time, origin_country,
+                             estimated_landing_time, status)
+        SELECT id, callsign, takeoff_time, landing_time, origin_country, estimated_landing_time,
+               CASE WHEN status = 'in_progress' AND rowid != (
+                        SELECT MAX(rowid) FROM flights_legacy newer
+                        WHERE newer.id = flights_legacy.id AND newer.status = 'in_progress')
+                    THEN 'closed' ELSE COALESCE(status, 'closed') END
+        FROM flights_legacy
+        WHERE id IS NOT NULL
+        ORDER BY rowid
+    """)
+    conn.execute("DROP TABLE flights_legacy")
 
 def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        c.execute('''CREATE TABLE IF NOT EXISTS flights
-                     (id TEXT, callsign TEXT, takeoff_time TEXT, landing_time TEXT,
-                      origin_country TEXT, estimated_landing_time TEXT, status TEXT)''')
-        conn.commit()
-        logger.info("Initialized flights database")
-    except sqlite3.Error as e:
-        logger.error(f"Error initializing database: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
-
-# Call this function when your application starts
-init_db()
\ No newline at end of file
+    with _lock:
+        conn = get_db_connection()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                has_table = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'flights'").fetchone()
+                if has_table and version < 1:
+                    _migrate_legacy_flights(conn)
+                conn.execute(CREATE_FLIGHTS_TABLE)
+                conn.execute(CREATE_ARCHIVE_TABLE)
+                if version < SCHEMA_VERSION:
+                    _add_missing_columns(conn, 'flights')
+                    _add_missing_columns(conn, 'flights_archive')
+                for statement in CREATE_FLIGHTS_INDEXES:
+                    conn.execute(statement)
+                # Takeoff posts are queued in the same transaction as the takeoff
+                conn.execute(CREATE_POST_QUEUE_TABLE)
+                conn.execute(CREATE_POST_QUEUE_INDEX)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            logger.info("Initialized flights database")
+            load_in_progress()
+        except sqlite3.Error as e:
+            logger.error(f"Error initializing database: {e}")
+
+# Call this function when your application starts. Sharded tracker processes
+# re-import main; the parent has already initialized the database and only
+# the writer process writes to it.
+if multiprocessing.parent_process() is None:
+    init_db()
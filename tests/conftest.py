@@ -0,0 +1,42 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py and twitter_config.py hold credentials and are not in the
+# repository; without them the tests run with the settings from
+# config-example.py and placeholder Twitter keys
+try:
+    import config  # noqa: F401
+except ImportError:
+    spec = importlib.util.spec_from_file_location('config', os.path.join(ROOT, 'config-example.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    sys.modules['config'] = config
+try:
+    import twitter_config  # noqa: F401
+except ImportError:
+    twitter_config = types.ModuleType('twitter_config')
+    for name in ('TWITTER_API_KEY', 'TWITTER_API_SECRET', 'TWITTER_ACCESS_TOKEN', 'TWITTER_ACCESS_TOKEN_SECRET'):
+        setattr(twitter_config, name, 'test')
+    sys.modules['twitter_config'] = twitter_config
+
+# storage opens flights.db in the working directory at import
+os.chdir(tempfile.mkdtemp(prefix='tracker-tests-'))
+
+
+@pytest.fixture
+def flights_db(tmp_path, monkeypatch):
+    # A fresh flights.db for the storage module
+    import storage
+    storage.close_db_connection()
+    monkeypatch.setattr(storage, 'DB_FILENAME', str(tmp_path / 'flights.db'))
+    storage.init_db()
+    yield storage
+    storage.close_db_connection()
+    storage._in_progress.clear()
@@ -0,0 +1,91 @@
+import time
+import pytest
+import adsb_feed
+from adsb_feed import (AdsbFeed, AircraftTable, SbsDecoder, SbsFileReader, apply_aircraft_json,
+                       BARO_ALTITUDE, CALLSIGN, LAST_CONTACT, LATITUDE, LONGITUDE, ON_GROUND, SQUAWK,
+                       TIME_POSITION, VELOCITY)
+from fleets import FleetIndex, load_fleets
+
+NOW = 1714564800
+
+POSITION = b"MSG,3,1,1,4CA2D6,1,2024/05/01,12:00:00.000,2024/05/01,12:00:00.000,,37000,,,51.5,-0.4,,,0,0,0,0\n"
+IDENTITY = b"MSG,1,1,1,4CA2D6,1,2024/05/01,12:00:01.000,2024/05/01,12:00:01.000,EIN123  ,,,,,,,,,,,\n"
+VELOCITY_MSG = b"MSG,4,1,1,4CA2D6,1,2024/05/01,12:00:02.000,2024/05/01,12:00:02.000,,,450,90,,,-64,,,,,\n"
+SQUAWK_MSG = b"MSG,6,1,1,4ca2d6,1,2024/05/01,12:00:03.000,2024/05/01,12:00:03.000,,,,,,,,7000,0,0,0,-1\n"
+
+
+def test_sbs_messages_split_across_chunks():
+    table = AircraftTable()
+    decoder = SbsDecoder(table, clock=lambda: NOW)
+    stream = POSITION + IDENTITY + VELOCITY_MSG + SQUAWK_MSG + b"MSG,3,1,1,ABCDEF"
+    for start in range(0, len(stream), 7):
+        decoder.feed(stream[start:start + 7])
+
+    [state] = table.states(now=NOW)
+    assert state[0] == '4ca2d6'
+    assert state[CALLSIGN] == 'EIN123'
+    assert state[LATITUDE] == 51.5 and state[LONGITUDE] == -0.4
+    assert state[BARO_ALTITUDE] == pytest.approx(37000 * 0.3048)
+    assert state[VELOCITY] == pytest.approx(450 * 0.514444)
+    assert state[SQUAWK] == '7000'
+    assert state[ON_GROUND] is True
+    assert state[TIME_POSITION] == state[LAST_CONTACT] == NOW
+    # The unterminated line is held back until the rest arrives
+    assert len(table) == 1
+    decoder.feed(b",1,2024/05/01,12:00:04.000,2024/05/01,12:00:04.000,,1000,,,52.0,0.1,,,0,0,0,0\n")
+    assert {state[0] for state in table.states(now=NOW)} == {'4ca2d6', 'abcdef'}
+
+
+def test_short_sbs_lines_are_decode_errors():
+    table = AircraftTable()
+    decoder = SbsDecoder(table, clock=lambda: NOW)
+    assert not decoder.decode_line("MSG,3,1,1,4CA2D6")
+    assert not decoder.decode_line("STA,,,,4CA2D6")
+    assert len(table) == 0
+
+
+def test_sbs_file_reader_replays_the_recording(tmp_path):
+    path = tmp_path / 'feed.sbs'
+    path.write_bytes(POSITION + IDENTITY.replace(b'12:00:01.000', b'12:00:00.500'))
+    table = AircraftTable()
+    reader = SbsFileReader(table, str(path), speed=10)
+    started = time.monotonic()
+    reader.read()
+    assert time.monotonic() - started >= 0.04  # half a second of recording at 10x
+    assert reader.finished.is_set()
+    [state] = table.states()
+    assert (state[0], state[CALLSIGN], state[LATITUDE]) == ('4ca2d6', 'EIN123', 51.5)
+
+
+def test_aircraft_json_entries():
+    table = AircraftTable()
+    apply_aircraft_json(table, {'now': NOW, 'aircraft': [
+        {'hex': '4ca2d6', 'flight': 'EIN123  ', 'alt_baro': 'ground', 'gs': 12, 'lat': 53.4, 'lon': -6.2,
+         'seen_pos': 1, 'seen': 1},
+        {'hex': 'abcdef', 'alt_baro': 35000, 'lat': 50.0, 'lon': 1.0, 'seen_pos': 2, 'seen': 30},
+        {'hex': '~1234ab', 'alt_baro': 1000, 'lat': 51.0, 'lon': 0.0, 'seen_pos': 1, 'seen': 1},
+        {'hex': '123456', 'alt_baro': 20000, 'lat': 48.0, 'lon': 2.0, 'seen_pos': 300, 'seen': 1},
+    ]}, clock=lambda: NOW)
+
+    # TIS-B addresses are skipped; a stale position is not reported as current
+    assert len(table) == 3
+    states = {state[0]: state for state in table.states(now=NOW)}
+    assert set(states) == {'4ca2d6', 'abcdef'}
+    on_ground = states['4ca2d6']
+    assert on_ground[ON_GROUND] is True and on_ground[BARO_ALTITUDE] == 0.0
+    assert on_ground[CALLSIGN] == 'EIN123'
+    assert states['abcdef'][ON_GROUND] is False
+    assert states['abcdef'][LAST_CONTACT] == NOW - 30
+
+
+def test_fetch_returns_only_fleet_aircraft(monkeypatch):
+    fleets = load_fleets({'747': {'icao24': ['4ca2d6', '000001']}}, networks=())
+    monkeypatch.setattr(adsb_feed, 'FLEET_INDEX', FleetIndex(fleets))
+    table = AircraftTable()
+    decoder = SbsDecoder(table)
+    decoder.feed(POSITION + POSITION.replace(b'4CA2D6', b'ABCDEF'))
+    feed = AdsbFeed({'format': 'sbs', 'path': 'unused.sbs'}, table=table)
+    assert [state[0] for state in feed.fetch_aircraft_flights()] == ['4ca2d6']
+
+    monkeypatch.setattr(adsb_feed, 'FLEET_INDEX', FleetIndex([]))
+    assert feed.fetch_aircraft_flights() == []
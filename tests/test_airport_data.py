@@ -0,0 +1,70 @@
+import json
+import pytest
+import airport_data
+from airport_data import AirportTable, load_airport_table, open_compact_airport_db, write_compact_airport_db
+
+AIRPORTS = {
+    'KJFK': {'name': 'John F Kennedy International Airport', 'city': 'New York', 'country': 'US',
+             'lat': 40.6398, 'lon': -73.7789},
+    'EGLL': {'name': 'London Heathrow Airport', 'city': 'London', 'country': 'GB', 'lat': 51.4706, 'lon': -0.4619},
+    'RJAA': {'name': 'Narita International Airport', 'city': 'Tokyo', 'country': 'JP', 'lat': 35.7647, 'lon': 140.3864},
+    'EDDF': {'name': 'Frankfurt am Main Airport', 'city': 'Frankfurt-am-Main', 'country': 'DE',
+             'lat': 50.0264, 'lon': 8.5431},
+    'SBGR': {'name': 'Guarulhos - Governador André Franco Montoro International Airport', 'city': 'São Paulo',
+             'country': 'BR', 'lat': -23.4356, 'lon': -46.4731},
+}
+
+
+@pytest.fixture
+def json_path(tmp_path):
+    path = tmp_path / 'airport_db.json'
+    path.write_text(json.dumps(AIRPORTS), encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('include_index', [True, False])
+def test_compact_db_round_trip(tmp_path, include_index):
+    path = str(tmp_path / 'airport_db.bin')
+    write_compact_airport_db(AIRPORTS, path, include_index=include_index)
+    table = open_compact_airport_db(path)
+    assert len(table) == len(AIRPORTS)
+    assert list(table.codes) == sorted(AIRPORTS)
+    for code, airport in AIRPORTS.items():
+        assert code in table
+        assert table[code] == airport
+    assert 'XXXX' not in table
+    assert table.get('XXXX') is None
+    with pytest.raises(KeyError):
+        table['XXXX']
+    assert table.index.nearest(50.1, 8.6)[0] == 'EDDF'
+
+
+def test_compact_db_matches_the_json_table(tmp_path):
+    path = str(tmp_path / 'airport_db.bin')
+    write_compact_airport_db(AIRPORTS, path)
+    compact, from_json = open_compact_airport_db(path), AirportTable.from_dict(AIRPORTS)
+    assert [compact.row(i) for i in range(len(compact))] == [from_json.row(i) for i in range(len(from_json))]
+
+
+def test_compact_db_is_built_on_first_run(tmp_path, json_path):
+    path = str(tmp_path / 'airport_db.bin')
+    table = load_airport_table(path, json_path)
+    assert table['EGLL']['city'] == 'London'
+    assert open_compact_airport_db(path)['EGLL'] == AIRPORTS['EGLL']
+
+
+def test_compact_db_from_another_byte_order_is_rebuilt(tmp_path, json_path, monkeypatch):
+    path = str(tmp_path / 'airport_db.bin')
+    monkeypatch.setattr(airport_data, 'BYTE_ORDER', 1 - airport_data.BYTE_ORDER)
+    write_compact_airport_db(AIRPORTS, path)
+    monkeypatch.undo()
+    with pytest.raises(ValueError):
+        open_compact_airport_db(path)
+    assert load_airport_table(path, json_path)['RJAA']['country'] == 'JP'
+    assert len(open_compact_airport_db(path)) == len(AIRPORTS)
+
+
+def test_missing_database_gives_an_empty_table(tmp_path):
+    table = load_airport_table(str(tmp_path / 'airport_db.bin'), str(tmp_path / 'airport_db.json'))
+    assert not table
+    assert table.index.nearest(0, 0) is None
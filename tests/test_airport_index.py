@@ -0,0 +1,70 @@
+import random
+import pytest
+from airport_index import AirportIndex, distance
+
+
+@pytest.fixture(scope='module')
+def airports():
+    rng = random.Random(7)
+    airports = {f'A{i:04d}': {'lat': rng.uniform(-90, 90), 'lon': rng.uniform(-180, 180)} for i in range(1000)}
+    # Clusters and the edges of the map
+    airports.update({f'C{i:03d}': {'lat': 51.47 + rng.uniform(-0.05, 0.05), 'lon': -0.46 + rng.uniform(-0.05, 0.05)}
+                     for i in range(50)})
+    airports.update({'NPOL': {'lat': 90.0, 'lon': 0.0}, 'EAST': {'lat': 10.0, 'lon': 179.99},
+                     'WEST': {'lat': 10.0, 'lon': -179.99}})
+    return airports
+
+
+@pytest.fixture(scope='module')
+def index(airports):
+    return AirportIndex.from_airport_db(airports)
+
+
+def queries():
+    rng = random.Random(11)
+    points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(100)]
+    return points + [(51.47, -0.46), (89.9, 120.0), (10.0, -180.0), (10.0, 180.0), (-90.0, 0.0)]
+
+
+def brute_force(airports, latitude, longitude):
+    return sorted((distance(latitude, longitude, airport['lat'], airport['lon']), code)
+                  for code, airport in airports.items())
+
+
+def test_nearest_matches_brute_force(airports, index):
+    for latitude, longitude in queries():
+        km, _ = brute_force(airports, latitude, longitude)[0]
+        code, found_km = index.nearest(latitude, longitude)
+        # Ties are broken either way; the distance must be the minimum
+        assert found_km == pytest.approx(km, abs=1e-6)
+        assert distance(latitude, longitude, airports[code]['lat'], airports[code]['lon']) == \
+            pytest.approx(km, abs=1e-6)
+
+
+def test_k_nearest_matches_brute_force(airports, index):
+    for latitude, longitude in queries():
+        expected = brute_force(airports, latitude, longitude)[:10]
+        found = index.k_nearest(latitude, longitude, 10)
+        assert [km for _, km in found] == pytest.approx([km for km, _ in expected], abs=1e-6)
+    assert index.k_nearest(0, 0, 0) == []
+    assert len(index.k_nearest(0, 0, len(airports) + 5)) == len(airports)
+
+
+def test_within_radius_matches_brute_force(airports, index):
+    for latitude, longitude in queries():
+        distances = brute_force(airports, latitude, longitude)
+        for radius_km in (0, 5, 250, 1500):
+            # Airports right on the edge may go either way
+            expected = {code for km, code in distances if km < radius_km - 1e-6}
+            borderline = {code for km, code in distances if abs(km - radius_km) <= 1e-6}
+            found = index.within_radius(latitude, longitude, radius_km)
+            assert expected <= {code for code, _ in found} <= expected | borderline
+            assert [km for _, km in found] == sorted(km for _, km in found)
+
+
+def test_empty_index():
+    index = AirportIndex.from_airport_db({})
+    assert len(index) == 0
+    assert index.nearest(0, 0) is None
+    assert index.k_nearest(0, 0, 3) == []
+    assert index.within_radius(0, 0, 100) == []
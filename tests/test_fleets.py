@@ -0,0 +1,21 @@
+import pytest
+from fleets import FleetIndex, load_fleets
+
+
+def test_fleet_publishers_must_be_configured():
+    settings = {'747': {'icao24': ['abc123']}, 'dlh': {'icao24': ['abc123'], 'publishers': ['mastodon']}}
+    with pytest.raises(ValueError, match="mastodon"):
+        load_fleets(settings, networks={'twitter': {}})
+    fleets = load_fleets(settings, networks={'twitter': {}, 'mastodon': {}})
+    assert [fleet.publishers for fleet in fleets] == [None, ['mastodon']]
+
+
+def test_match_by_icao24_and_callsign_prefix():
+    index = FleetIndex(load_fleets({'747': {'icao24': ['ABC123', 'def456']},
+                                    'dlh': {'icao24': ['abc123'], 'callsign_prefixes': ['dlh']}},
+                                   networks=()))
+    assert index.refresh() == {'abc123', 'def456'}
+    assert [fleet.name for fleet in index.match('abc123', 'DLH400  ')] == ['747', 'dlh']
+    assert [fleet.name for fleet in index.match('abc123', 'BAW1')] == ['747']
+    assert [fleet.name for fleet in index.match('abc123', '')] == ['747']
+    assert index.match('000000', 'DLH400') == ()
@@ -0,0 +1,41 @@
+import time
+from datetime import datetime, timezone
+import main
+from flight_lifecycle import FlightLifecycle
+
+
+def state(icao24, last_contact, altitude=11000, velocity=250, on_ground=False):
+    return {'icao24': icao24, 'callsign': 'BAW1', 'origin_country': 'United Kingdom', 'latitude': 51.0,
+            'longitude': -30.0, 'altitude': altitude, 'velocity': velocity, 'on_ground': on_ground,
+            'last_contact': last_contact, 'fleets': []}
+
+
+def test_lost_flight_back_in_coverage_is_not_a_takeoff(flights_db, monkeypatch):
+    lifecycle = FlightLifecycle(lambda latitude, longitude: 'EGLL')
+    monkeypatch.setattr(main, 'FLIGHT_LIFECYCLE', lifecycle)
+    flights_db.record_takeoffs([{'icao24': 'abc123', 'callsign': 'BAW1', 'origin_country': 'United Kingdom'}])
+    now = time.time()
+
+    # Last seen cruising 40 minutes ago: closed as lost
+    closed = lifecycle.observe([state('abc123', now - 2400)])
+    assert [(flight.id, flight.status) for flight in closed] == [('abc123', 'lost')]
+    assert flights_db.check_duplicates(['abc123']) == set()
+
+    # Reappears still cruising: the same flight, not a new takeoff
+    cruising = state('abc123', now)
+    assert lifecycle.observe([cruising]) == []
+    assert not main.is_new_takeoff(cruising, set())
+
+    # Once it has been on the ground, the next airborne state is a takeoff
+    lifecycle.observe([state('abc123', now, altitude=0, velocity=5, on_ground=True)])
+    assert main.is_new_takeoff(cruising, set())
+
+
+def test_lost_flights_are_forgotten_after_the_longest_flight(flights_db):
+    lifecycle = FlightLifecycle(lambda latitude, longitude: 'EGLL')
+    flights_db.record_takeoffs([{'icao24': 'abc123', 'callsign': 'BAW1', 'origin_country': 'United Kingdom'}])
+    now = time.time()
+    lifecycle.observe([state('abc123', now - 2400)])
+    assert lifecycle.was_lost('abc123')
+    lifecycle.observe([], now=datetime.fromtimestamp(now + 21 * 3600, timezone.utc))
+    assert not lifecycle.was_lost('abc123')
@@ -0,0 +1,50 @@
+import urllib.request
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    family = registry.register('errors', "Errors by message", 'counter', Counter, ('message',))
+    family.labels('say "hi"\\now\nplease').inc()
+    assert 'errors_total{message="say \\"hi\\"\\\\now\\nplease"} 1' in registry.render().splitlines()
+
+
+def test_help_and_type_names_match_the_samples():
+    registry = Registry()
+    registry.register('posts', "Posts sent", 'counter', Counter).inc(3)
+    registry.register('depth', "Queue depth", 'gauge', Gauge).set(7)
+    with registry.register('latency', "Latency", 'histogram', lambda: Histogram((0.1, 1))).time():
+        pass
+    lines = registry.render().splitlines()
+    assert lines[:3] == ["# HELP posts_total Posts sent", "# TYPE posts_total counter", "posts_total 3"]
+    assert lines[3:6] == ["# HELP depth Queue depth", "# TYPE depth gauge", "depth 7"]
+    assert lines[6:9] == ["# HELP latency Latency", "# TYPE latency histogram", 'latency_bucket{le="0.1"} 1']
+    assert lines[-1] == "latency_count 1"
+    assert 'latency_bucket{le="+Inf"} 1' in lines
+
+
+def test_labelled_histogram_and_gauge_function():
+    registry = Registry()
+    family = registry.register('stage_seconds', "Stage time", 'histogram', lambda: Histogram((1,)), ('stage',))
+    family.labels(stage='fetch').observe(0.5)
+    family.labels('fetch').observe(2)
+    registry.register('items', "Items", 'gauge', Gauge).set_function(lambda: 42)
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{stage="fetch",le="1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="fetch",le="+Inf"} 2' in lines
+    assert 'stage_seconds_sum{stage="fetch"} 2.5' in lines
+    assert 'items 42' in lines
+
+
+def test_metrics_server():
+    metrics.counter('test_requests', "Requests made by the tests").inc()
+    server = metrics.start_metrics_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode('utf-8')
+        assert "# TYPE test_requests_total counter\ntest_requests_total 1\n" in body
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,97 @@
+import time
+import pytest
+import requests
+import opensky_api
+from fake_opensky_server import make_synthetic_states, start_fake_opensky_server
+from opensky_api import OpenSkyClient, fetch_fleet_states
+
+
+@pytest.fixture
+def states():
+    return make_synthetic_states(1000, seed=8)
+
+
+@pytest.fixture
+def server(states):
+    server = start_fake_opensky_server(states)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = OpenSkyClient('user', 'password')
+    monkeypatch.setattr(opensky_api, 'OPENSKY_CLIENT', client)
+    # Retries without the jittered backoff sleeps
+    monkeypatch.setattr(opensky_api, 'BACKOFF_BASE', 0)
+    return client
+
+
+def fleet_of(states, count):
+    return {state[0] for state in states[:count]} | {'000000', 'ffffff'}
+
+
+def test_icao24_fetch_matches_full_download(server, client, states):
+    fleet = fleet_of(states, 450)
+    chunked = fetch_fleet_states(fleet, mode='icao24', base_url=server.base_url)
+    chunked_bytes = server.bytes_served
+    assert server.requests_served == 3  # 452 icao24s in chunks of 200
+
+    server.reset_stats()
+    full = fetch_fleet_states(fleet, mode='all', base_url=server.base_url)
+    assert server.requests_served == 1
+    assert sorted(chunked) == sorted(full)
+    assert {state[0] for state in full} == fleet & {state[0] for state in states}
+    assert chunked_bytes < server.bytes_served
+
+
+def test_retries_after_rate_limit_and_server_errors(server, client, states):
+    server.queued_errors = [429, 503, 500]
+    fetched = client.get_states(base_url=server.base_url)
+    assert len(fetched) == len(states)
+    assert server.queued_errors == []
+    assert client.rate_limit_waits == 1
+    assert client.retry_after is not None
+    assert client.credits_remaining == server.credits
+
+
+def test_gives_up_after_max_retries(server, client):
+    server.queued_errors = [502] * (opensky_api.MAX_RETRIES + 1)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.get_states(base_url=server.base_url)
+    assert server.queued_errors == []
+    assert server.requests_served == 0
+
+
+def test_rate_limited_poll_holds_back_the_next_request(server, client, states):
+    server.queued_errors = [429] * (opensky_api.MAX_RETRIES + 1)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.get_states(base_url=server.base_url)
+    client.retry_after = time.monotonic() + 0.3
+    started = time.monotonic()
+    assert len(client.get_states(base_url=server.base_url)) == len(states)
+    assert time.monotonic() - started >= 0.25
+
+
+def test_unconditional_304_is_an_error(server, client):
+    server.queued_errors = [304]
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.get_states(base_url=server.base_url)
+
+
+def test_long_retry_after_is_honoured_without_retrying(server, client, states):
+    server.retry_after_seconds = 3600
+    server.queued_errors = [429, 429]
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.get_states(base_url=server.base_url)
+    assert server.queued_errors == [429]
+    assert client.retry_after - time.monotonic() > 3500
+
+    # Later polls don't reach the server until the wait is over
+    with pytest.raises(opensky_api.RateLimitedError):
+        client.get_states(base_url=server.base_url)
+    assert server.queued_errors == [429]
+    client.retry_after = None
+    server.queued_errors = []
+    assert len(client.get_states(base_url=server.base_url)) == len(states)
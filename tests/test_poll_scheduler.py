@@ -0,0 +1,62 @@
+import pytest
+import poll_scheduler
+from poll_scheduler import PollScheduler
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(poll_scheduler, 'time', clock)
+    return clock
+
+
+def test_interval_snaps_to_the_cadence():
+    assert PollScheduler(None, 12).interval == 15
+    assert PollScheduler(None, 1).interval == 5
+    with pytest.raises(ValueError):
+        PollScheduler(None, 60, overlap='queue')
+
+
+def test_deadlines_stay_on_the_grid(clock):
+    scheduler = PollScheduler(None, 60, offset=1.0)
+    deadline = scheduler._first_deadline()
+    assert deadline == 1021.0  # 1020 is the next multiple of 60, plus the offset
+    clock.now = deadline + 25  # a slow job
+    assert scheduler._next_deadline(deadline) == 1081.0
+    assert scheduler.skipped == 0
+
+
+def test_skip_waits_for_the_next_tick(clock):
+    scheduler = PollScheduler(None, 60, overlap='skip')
+    clock.now = 1000 + 150  # ran over the ticks at 1060 and 1120
+    assert scheduler._next_deadline(1000.0) == 1180.0
+    assert scheduler.skipped == 2
+
+
+def test_coalesce_runs_once_then_returns_to_the_grid(clock):
+    scheduler = PollScheduler(None, 60, overlap='coalesce')
+    clock.now = 1000 + 150
+    deadline = scheduler._next_deadline(1000.0)
+    assert deadline == 1120.0  # already due: runs straight away
+    assert scheduler.skipped == 1
+    clock.now = 1155  # the catch-up run took 5 seconds
+    assert scheduler._next_deadline(deadline) == 1180.0
+
+
+def test_run_stops_after_max_runs():
+    calls = []
+    scheduler = PollScheduler(lambda: calls.append(1), 0.01, cadence=0.01, offset=0)
+    scheduler.run(max_runs=3)
+    assert len(calls) == scheduler.runs == 3
@@ -0,0 +1,64 @@
+import time
+import pytest
+from post_queue import NetworkWorker, PostQueue
+from publishers import FakePublisher
+
+
+@pytest.fixture
+def post_queue(tmp_path):
+    post_queue = PostQueue(str(tmp_path / 'flights.db'))
+    yield post_queue
+    post_queue.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_duplicate_events_are_queued_once(post_queue):
+    assert post_queue.enqueue(['a', 'b'], 'takeoff:abc123:1', "posted") == ['a', 'b']
+    assert post_queue.enqueue(['a', 'b'], 'takeoff:abc123:1', "posted again") == []
+    assert post_queue.enqueue(['a'], 'takeoff:abc123:2', "second takeoff") == ['a']
+    assert post_queue.depth() == 3
+
+
+def test_slow_and_failing_networks_do_not_delay_the_others(post_queue):
+    fast = FakePublisher('fast')
+    slow = FakePublisher('slow', latency=1.0)
+    failing = FakePublisher('failing', failure_rate=1.0)
+    post_queue.start({'fast': fast, 'slow': slow, 'failing': failing})
+    started = time.monotonic()
+    for i in range(5):
+        post_queue.enqueue(['slow', 'failing', 'fast'], f'event-{i}', f"message {i}")
+
+    assert wait_for(lambda: len(fast.messages) == 5)
+    assert time.monotonic() - started < 1.0
+    assert post_queue.depth('fast') == 0
+    assert len(slow.messages) <= 1
+    assert wait_for(lambda: post_queue.metrics()['failing']['failures'] == 5)
+    assert post_queue.workers['failing'].breaker.opened_at is not None
+
+
+def test_open_breaker_holds_jobs_until_a_probe_is_allowed(post_queue):
+    publisher = FakePublisher('flaky')
+    worker = NetworkWorker(publisher)
+    worker.breaker.failure_threshold = 1
+    worker.breaker.reset_timeout = 0.1
+    worker.breaker.record_failure()
+    post_queue.enqueue(['flaky'], 'event', "held back")
+
+    wait = post_queue.run_once('flaky', worker)
+    assert publisher.messages == []
+    assert 0 < wait <= 0.1
+    assert post_queue.depth('flaky') == 1
+
+    time.sleep(wait)
+    post_queue.run_once('flaky', worker)
+    assert publisher.messages == ["held back"]
+    assert post_queue.depth('flaky') == 0
+    assert worker.breaker.opened_at is None
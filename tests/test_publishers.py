@@ -0,0 +1,51 @@
+import time
+import pytest
+from publishers import CircuitBreaker, FakePublisher, create_publisher
+
+
+def test_fake_publisher_keeps_delivered_messages():
+    publisher = create_publisher('dryrun', {'type': 'fake'})
+    assert isinstance(publisher, FakePublisher)
+    assert publisher.publish("one") == 'dryrun-1'
+    assert publisher.publish("two") == 'dryrun-2'
+    assert publisher.messages == ["one", "two"]
+
+
+def test_fake_publisher_failures():
+    publisher = FakePublisher('flaky', failure_rate=1.0)
+    with pytest.raises(ConnectionError):
+        publisher.publish("lost")
+    assert publisher.messages == []
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    assert not breaker.record_failure()
+    breaker.record_success()  # resets the count
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.record_failure()
+    assert not breaker.allow()
+    assert 59 < breaker.wait_time() <= 60
+
+
+def test_circuit_breaker_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.wait_time() == 0.0
+
+    # A failed probe opens the breaker again
+    assert breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+
+    # A successful probe closes it
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.failures == 0
+    assert breaker.wait_time() == 0.0
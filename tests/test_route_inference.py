@@ -0,0 +1,66 @@
+import pytest
+from route_inference import RouteInference
+
+AIRPORTS = {
+    'EGLL': {'lat': 51.4706, 'lon': -0.4619},
+    'KJFK': {'lat': 40.6398, 'lon': -73.7789},
+    'EDDF': {'lat': 50.0264, 'lon': 8.5431},
+    'RJAA': {'lat': 35.7647, 'lon': 140.3864},
+    'KORD': {'lat': 41.9786, 'lon': -87.9048},
+}
+
+
+@pytest.fixture
+def routes(flights_db):
+    flights_db.get_db_connection().executemany("""
+        INSERT INTO flights (id, callsign, takeoff_time, landing_time, status, origin_airport, arrival_airport)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [
+        ('abc123', 'BAW1  ', '2024-05-01 10:00:00', '2024-05-01 17:00:00', 'landed', 'EGLL', 'KJFK'),
+        ('abc124', 'BAW1', '2024-05-02 10:00:00', '2024-05-02 18:00:00', 'landed', 'EGLL', 'KJFK'),
+        ('abc125', 'BAW1', '2024-05-03 10:00:00', '2024-05-03 19:00:00', 'landed', 'EDDF', 'KJFK'),
+        ('abc126', 'BAW2', '2024-05-01 10:00:00', '2024-05-02 00:00:00', 'landed', 'EGLL', 'RJAA'),
+        # Too short to be a route, still flying, or not landed
+        ('abc127', 'BAW3', '2024-05-01 10:00:00', '2024-05-01 10:05:00', 'landed', 'EGLL', 'EDDF'),
+        ('abc128', 'BAW4', '2024-05-01 10:00:00', None, 'in_progress', 'EGLL', None),
+        ('abc129', 'BAW5', '2024-05-01 10:00:00', '2024-05-01 11:00:00', 'lost', 'EGLL', None),
+    ])
+    routes = RouteInference(lambda: AIRPORTS)
+    assert routes.refresh()
+    return routes
+
+
+def takeoff(callsign, origin, track):
+    latitude, longitude = AIRPORTS[origin]['lat'], AIRPORTS[origin]['lon']
+    return {'callsign': callsign, 'origin': origin, 'true_track': track, 'latitude': latitude, 'longitude': longitude}
+
+
+def test_route_table_from_landed_flights(routes):
+    assert len(routes.table) == 3
+    assert [(route.origin, route.destination, route.flights) for route in routes.table.routes_for('BAW1')] == [
+        ('EGLL', 'KJFK', 2), ('EDDF', 'KJFK', 1)]
+    assert routes.table.arrivals == {'KJFK': 3, 'RJAA': 1}
+    assert not routes.refresh()  # rebuilt at most every REFRESH_INTERVAL
+
+
+def test_known_route_gives_destination_and_duration(routes):
+    destination, duration = routes.infer(takeoff('BAW1', 'EGLL', 288))
+    assert destination == 'KJFK'
+    assert duration == pytest.approx(7.5 * 3600)
+    assert routes.infer(takeoff('BAW1', 'EDDF', 280)) == ('KJFK', pytest.approx(9 * 3600))
+    assert routes.infer(takeoff('BAW2', 'EGLL', 30)) == ('RJAA', pytest.approx(14 * 3600))
+
+
+def test_callsign_from_another_origin_must_head_that_way(routes):
+    # BAW1 out of Chicago flying east: the usual destination, duration unknown
+    assert routes.infer(takeoff('BAW1', 'KORD', 92)) == ('KJFK', None)
+    # Flying away from it: not trusted, and nothing else lines up
+    assert routes.infer(takeoff('BAW1', 'KORD', 270)) == (None, None)
+
+
+def test_unknown_callsign_falls_back_to_the_heading(routes):
+    assert routes.infer(takeoff('DLH400', 'EGLL', 288)) == ('KJFK', None)
+    assert routes.infer(takeoff('DLH400', 'KORD', 323)) == ('RJAA', None)
+    assert routes.infer(takeoff('DLH400', 'EGLL', 180)) == (None, None)
+    assert routes.infer({'callsign': None, 'origin': 'EGLL', 'true_track': None,
+                         'latitude': None, 'longitude': None}) == (None, None)
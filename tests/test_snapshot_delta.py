@@ -0,0 +1,53 @@
+from snapshot_delta import CHANGED, DISAPPEARED, NEW, SnapshotDiffer
+
+
+def flight(icao24, altitude=11000, on_ground=False, callsign='BAW1', latitude=51.0, velocity=250):
+    return {'icao24': icao24, 'callsign': callsign, 'altitude': altitude, 'on_ground': on_ground,
+            'latitude': latitude, 'longitude': 0.0, 'velocity': velocity, 'fleets': ()}
+
+
+def kinds(events):
+    return sorted((event.kind, event.icao24) for event in events)
+
+
+def test_new_changed_and_disappeared_events():
+    differ = SnapshotDiffer()
+    assert kinds(differ.diff([flight('abc123', 0, True), flight('def456'), flight('789abc')])) == [
+        (NEW, '789abc'), (NEW, 'abc123'), (NEW, 'def456')]
+
+    # Cruising on and small altitude changes within a band make no events
+    assert differ.diff([flight('abc123', 0, True), flight('def456', 11500, velocity=240),
+                        flight('789abc', 10500)]) == []
+
+    events = differ.diff([flight('abc123', 200), flight('def456', callsign='BAW2')])
+    assert kinds(events) == [(CHANGED, 'abc123'), (CHANGED, 'def456'), (DISAPPEARED, '789abc')]
+    takeoff = next(event for event in events if event.icao24 == 'abc123')
+    assert takeoff.previous['on_ground'] and not takeoff.state['on_ground']
+    gone = next(event for event in events if event.kind == DISAPPEARED)
+    assert gone.state is None and gone.previous['icao24'] == '789abc'
+    assert set(differ.previous) == {'abc123', 'def456', '789abc'}
+    assert set(differ.current) == {'abc123', 'def456'}
+
+    # Climbing through a band edge, losing the position, coming back
+    assert kinds(differ.diff([flight('abc123', 2000), flight('def456', callsign='BAW2', latitude=None)])) == [
+        (CHANGED, 'abc123'), (CHANGED, 'def456')]
+    assert kinds(differ.diff([flight('abc123', 2000), flight('def456', callsign='BAW2'),
+                              flight('789abc')])) == [(CHANGED, 'def456'), (NEW, '789abc')]
+
+
+def test_listeners_and_reset():
+    differ = SnapshotDiffer()
+    seen = []
+
+    def failing(events):
+        raise RuntimeError("listener bug")
+
+    differ.subscribe(failing)
+    differ.subscribe(lambda events: seen.append(kinds(events)))
+    differ.diff([flight('abc123')])
+    differ.diff([flight('abc123')])
+    assert seen == [[(NEW, 'abc123')], []]  # a failing listener does not stop the others
+
+    differ.unsubscribe(failing)
+    differ.reset()
+    assert kinds(differ.diff([flight('abc123')])) == [(NEW, 'abc123')]
@@ -0,0 +1,49 @@
+import json
+import pytest
+from fake_opensky_server import make_synthetic_states
+from states_stream import StatesStreamError, parse_states_stream
+
+
+def chunked(body, size):
+    return [body[start:start + size] for start in range(0, len(body), size)]
+
+
+def expected_states(document, fleet):
+    return [state for state in document['states'] or [] if state[0].lower() in fleet]
+
+
+@pytest.fixture
+def document():
+    states = make_synthetic_states(40, seed=3)
+    # Rows the fast path cannot take: escapes, a nested sensors array and
+    # brackets inside a string
+    states[5][1] = 'QU"OTE\\'
+    states[6][12] = [1, 2, 3]
+    states[7][2] = 'Kingdom [of] Brackets'
+    states[8][0] = states[8][0].upper()
+    return {'states': states, 'time': 1714564800}
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 16, 64, 1000, 100000])
+def test_chunk_boundaries_do_not_change_the_result(document, size):
+    fleet = {state[0].lower() for state in document['states'][::3]} | {document['states'][i][0].lower()
+                                                                       for i in (5, 6, 7, 8)}
+    body = json.dumps(document).encode()
+    snapshot_time, states = parse_states_stream(chunked(body, size), fleet)
+    assert snapshot_time == 1714564800
+    assert states == expected_states(document, fleet)
+
+
+@pytest.mark.parametrize('size', [1, 5, 100])
+def test_time_before_states_and_null_states(document, size):
+    fleet = {document['states'][0][0]}
+    body = json.dumps({'time': 1714564800, 'states': document['states']}, indent=1).encode()
+    assert parse_states_stream(chunked(body, size), fleet) == (1714564800, expected_states(document, fleet))
+    assert parse_states_stream(chunked(b'{"time": 1714564800, "states": null}', size), fleet) == (1714564800, [])
+
+
+@pytest.mark.parametrize('body', [b'{"time": 1}', b'{"time": 1, "states": [["abc123", "BAW1"',
+                                  b'{"time": 1, "states": 42}'])
+def test_malformed_bodies(body):
+    with pytest.raises(StatesStreamError):
+        parse_states_stream(chunked(body, 4), {'abc123'})
@@ -0,0 +1,116 @@
+import sqlite3
+from models import Flight
+
+
+def takeoff(icao24, **fields):
+    flight = {'icao24': icao24, 'callsign': 'BAW1', 'origin_country': 'United Kingdom', 'origin': 'EGLL'}
+    flight.update(fields)
+    return flight
+
+
+def test_takeoffs_and_their_posts_commit_together(flights_db):
+    posts = [(['twitter', 'mastodon'], 'takeoff:abc123:2024-05-01 12:00:00:747', "BAW1 took off")]
+    assert flights_db.record_takeoffs([takeoff('abc123', takeoff_time='2024-05-01 12:00:00')], posts)
+    conn = flights_db.get_db_connection()
+    assert conn.execute("SELECT id, takeoff_time, status FROM flights").fetchall() == [
+        ('abc123', '2024-05-01 12:00:00', 'in_progress')]
+    assert sorted(conn.execute("SELECT network, idempotency_key, status FROM post_queue").fetchall()) == [
+        ('mastodon', 'takeoff:abc123:2024-05-01 12:00:00:747', 'pending'),
+        ('twitter', 'takeoff:abc123:2024-05-01 12:00:00:747', 'pending')]
+    assert flights_db.get_in_progress_flight('abc123')['takeoff_time'] == '2024-05-01 12:00:00'
+
+
+def test_failed_post_insert_rolls_back_the_takeoff(flights_db):
+    conn = flights_db.get_db_connection()
+    conn.execute("CREATE TRIGGER reject_posts BEFORE INSERT ON post_queue BEGIN SELECT RAISE(ABORT, 'full'); END")
+    assert not flights_db.record_takeoffs([takeoff('abc123')], [(['twitter'], 'takeoff:abc123:x', "lost")])
+    assert conn.execute("SELECT COUNT(*) FROM flights").fetchone()[0] == 0
+    assert flights_db.check_duplicates(['abc123']) == set()
+
+
+def test_takeoff_time_comes_from_the_track(flights_db):
+    assert flights_db.takeoff_time({'takeoff_timestamp': 1714564800}) == '2024-05-01 12:00:00'
+    assert flights_db.takeoff_time({}, detected='2024-05-01 12:30:00') == '2024-05-01 12:30:00'
+    flights_db.record_takeoffs([takeoff('abc123', takeoff_timestamp=1714564800)])
+    assert flights_db.get_in_progress_flight('abc123')['takeoff_time'] == '2024-05-01 12:00:00'
+
+
+def test_writer_reports_failed_batches(flights_db):
+    # A shard's writes go through the sink and are applied by the writer
+    queued = []
+    flights_db.use_write_sink(queued.append, owns=lambda icao24: True)
+    flights_db.record_takeoffs([takeoff('abc123')])
+    flights_db.record_takeoffs([takeoff('def456')])
+    assert flights_db.in_progress_ids() == {'abc123', 'def456'}
+    flights_db.use_write_sink(None)
+
+    conn = flights_db.get_db_connection()
+    conn.execute("CREATE TRIGGER reject_def456 BEFORE INSERT ON flights WHEN NEW.id = 'def456' "
+                 "BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    assert flights_db.apply_writes(queued) == [1]
+    # The shard rolls its registry back to what was committed
+    flights_db.load_in_progress()
+    assert flights_db.in_progress_ids() == {'abc123'}
+
+
+def test_legacy_table_with_duplicate_open_rows_is_migrated(flights_db, tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    legacy = sqlite3.connect(path)
+    legacy.execute("""CREATE TABLE flights (id TEXT, callsign TEXT, takeoff_time TEXT, landing_time TEXT,
+                                            origin_country TEXT, estimated_landing_time TEXT, status TEXT)""")
+    legacy.executemany("INSERT INTO flights VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        ('abc123', 'BAW1', '2024-05-01 08:00:00', None, 'United Kingdom', None, 'in_progress'),
+        ('abc123', 'BAW1', '2024-05-01 12:00:00', None, 'United Kingdom', None, 'in_progress'),
+        ('def456', 'DLH400', '2024-05-01 09:00:00', '2024-05-01 17:00:00', 'Germany', None, 'landed'),
+        ('def456', 'DLH401', '2024-05-01 19:00:00', None, 'Germany', '2024-05-02 03:00:00', 'in_progress'),
+        (None, 'BROKEN', None, None, None, None, 'in_progress'),
+    ])
+    legacy.commit()
+    legacy.close()
+
+    flights_db.close_db_connection()
+    monkeypatch.setattr(flights_db, 'DB_FILENAME', path)
+    flights_db.init_db()
+    conn = flights_db.get_db_connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == flights_db.SCHEMA_VERSION
+    assert conn.execute("SELECT id, takeoff_time, status FROM flights ORDER BY flight_key").fetchall() == [
+        ('abc123', '2024-05-01 08:00:00', 'closed'),
+        ('abc123', '2024-05-01 12:00:00', 'in_progress'),
+        ('def456', '2024-05-01 09:00:00', 'landed'),
+        ('def456', '2024-05-01 19:00:00', 'in_progress'),
+    ]
+    assert flights_db.in_progress_ids() == {'abc123', 'def456'}
+    assert flights_db.get_in_progress_flight('abc123')['takeoff_time'] == '2024-05-01 12:00:00'
+    assert flights_db.get_in_progress_flight('def456')['estimated_landing_time'] == '2024-05-02 03:00:00'
+
+    # Migrating again is a no-op, and the unique open-row index holds
+    flights_db.init_db()
+    assert conn.execute("SELECT COUNT(*) FROM flights").fetchone()[0] == 4
+    assert flights_db.record_takeoffs([takeoff('abc123')])
+    assert conn.execute("SELECT COUNT(*) FROM flights WHERE status = 'in_progress'").fetchone()[0] == 2
+
+
+def test_registry_mirrors_the_database(flights_db):
+    def registry_matches():
+        rows = flights_db.get_db_connection().execute(flights_db.SELECT_ALL_IN_PROGRESS).fetchall()
+        return {row[0]: (row[1], row[2], row[4]) for row in rows} == {
+            flight_id: (entry['callsign'], entry['takeoff_time'], entry['estimated_landing_time'])
+            for flight_id, entry in flights_db._in_progress.items()}
+
+    flights_db.record_takeoffs([takeoff('abc123', takeoff_time='2024-05-01 12:00:00'), takeoff('def456')])
+    assert registry_matches()
+    # A refresh keeps the takeoff time and a known landing estimate
+    flights_db.record_takeoffs([takeoff('abc123', callsign='BAW2', takeoff_time='2024-05-01 12:05:00',
+                                        estimated_landing_time='2024-05-01 20:00:00')])
+    flights_db.record_takeoffs([takeoff('abc123', callsign='BAW3')])
+    assert registry_matches()
+    assert flights_db.get_in_progress_flight('abc123') == {
+        'callsign': 'BAW3', 'takeoff_time': '2024-05-01 12:00:00', 'origin_country': 'United Kingdom',
+        'estimated_landing_time': '2024-05-01 20:00:00'}
+
+    assert flights_db.finalize_flights([Flight('abc123', '2024-05-01 12:00:00', '2024-05-01 19:55:00', 'landed')])
+    assert registry_matches()
+    assert flights_db.check_duplicates(['abc123', 'def456', '000000']) == {'def456'}
+    # A registry reloaded from the database is the same
+    flights_db.load_in_progress()
+    assert flights_db.in_progress_ids() == {'def456'}
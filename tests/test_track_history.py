@@ -0,0 +1,78 @@
+import pytest
+from airport_index import distance
+from track_history import BACKFILL_MAX_SECONDS, CLIMB_SPEED_FACTOR, TrackHistory, destination_point
+
+NOW = 1714564800
+
+
+def state(icao24, timestamp, latitude, longitude, altitude, velocity=80, track=90, vertical_rate=10,
+          on_ground=False):
+    return {'icao24': icao24, 'last_contact': timestamp, 'latitude': latitude, 'longitude': longitude,
+            'altitude': altitude, 'velocity': velocity, 'true_track': track, 'vertical_rate': vertical_rate,
+            'on_ground': on_ground}
+
+
+def test_takeoff_point_is_the_last_ground_point():
+    history = TrackHistory(max_aircraft=4, points_per_aircraft=8)
+    history.record(state('abc123', NOW, 51.47, -0.49, 0, velocity=5, on_ground=True))
+    history.record(state('abc123', NOW + 60, 51.47, -0.46, 0, velocity=70, on_ground=True))
+    history.record(state('abc123', NOW + 120, 51.47, -0.40, 600))
+    history.record(state('abc123', NOW + 180, 51.48, -0.30, 1500))
+    assert history.takeoff_point('abc123') == (51.47, -0.46, NOW + 60)
+
+
+def test_first_sighting_in_the_climb_is_backfilled():
+    history = TrackHistory()
+    # 1200 m up, climbing at 10 m/s heading east at 100 m/s: two minutes after takeoff
+    history.record(state('abc123', NOW, 51.5, 0.0, 1200, velocity=100, track=90, vertical_rate=10))
+    latitude, longitude, timestamp = history.takeoff_point('abc123')
+    assert timestamp == NOW - 120
+    assert distance(51.5, 0.0, latitude, longitude) == pytest.approx(100 * CLIMB_SPEED_FACTOR * 120 / 1000, rel=1e-3)
+    assert longitude < 0.0 and latitude == pytest.approx(51.5, abs=0.01)
+
+    # A slow climb is capped at BACKFILL_MAX_SECONDS
+    history.record(state('def456', NOW, 51.5, 0.0, 2900, vertical_rate=1.5))
+    assert history.takeoff_point('def456')[2] == NOW - BACKFILL_MAX_SECONDS
+
+
+def test_no_backfill_without_a_climb():
+    history = TrackHistory()
+    # Cruising: no takeoff point at all
+    history.record(state('abc123', NOW, 51.5, 0.0, 11000, vertical_rate=0))
+    assert history.takeoff_point('abc123') is None
+    # Low but level: the sighting itself
+    history.record(state('def456', NOW, 51.5, 0.0, 800, vertical_rate=0))
+    assert history.takeoff_point('def456') == (51.5, 0.0, NOW)
+    assert history.takeoff_point('000000') is None
+
+
+def test_ring_buffer_keeps_the_newest_points_and_evicts_the_oldest_aircraft():
+    history = TrackHistory(max_aircraft=2, points_per_aircraft=3)
+    for index in range(5):
+        history.record(state('abc123', NOW + index, 51.0 + index, 0.0, 1000))
+    assert [point[0] for point in history.points_for('abc123')] == [NOW + 2, NOW + 3, NOW + 4]
+    # Out-of-order and position-less states are ignored
+    assert not history.record(state('abc123', NOW + 1, 50.0, 0.0, 1000))
+    assert not history.record(state('abc123', NOW + 9, None, None, 1000))
+
+    history.record(state('def456', NOW, 10.0, 10.0, 1000))
+    history.record(state('abc123', NOW + 5, 56.0, 0.0, 1000))
+    history.record(state('789abc', NOW, 20.0, 20.0, 1000))
+    assert 'def456' not in history
+    assert history.points_for('789abc')[0][:3] == (NOW, 20.0, 20.0)
+    assert len(history) == 2
+
+
+def test_smoothed_velocity_and_eta():
+    history = TrackHistory()
+    start = (51.0, 0.0)
+    for index in range(6):
+        latitude, longitude = destination_point(*start, 90, 15 * index)
+        history.record(state('abc123', NOW + 60 * index, latitude, longitude, 10000 + 100 * index))
+    speed, track, climb = history.smoothed_velocity('abc123')
+    assert speed == pytest.approx(250, rel=1e-3)
+    assert track == pytest.approx(90, abs=0.5)
+    assert climb == pytest.approx(100 / 60)
+
+    destination = destination_point(*start, 90, 75 + 300)
+    assert history.eta('abc123', *destination) == pytest.approx(NOW + 300 + 1200, abs=1)
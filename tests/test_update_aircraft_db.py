@@ -0,0 +1,96 @@
+import sqlite3
+from contextlib import closing
+import pytest
+from update_aircraft_db import (STAGING_TABLE_NAME, TABLE_NAME, apply_aircraft_diff, csv_to_sqlite,
+                                ensure_database_updated, fleet_filter_clause, prefix_range, query_fleet)
+
+HEADER = "'icao24','registration','manufacturername','model','typecode'"
+
+
+def write_csv(path, rows):
+    path.write_text('\n'.join([HEADER] + [','.join(f"'{value}'" for value in row) for row in rows]) + '\n')
+    return str(path)
+
+
+def aircraft(db_file):
+    with closing(sqlite3.connect(db_file)) as conn:
+        return sorted(conn.execute(f"SELECT icao24, registration, model, typecode_norm FROM {TABLE_NAME}").fetchall())
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'aircraftData.db')
+
+
+def test_refresh_applies_inserts_updates_and_deletes(tmp_path, db_file):
+    first = write_csv(tmp_path / 'v1.csv', [
+        ('4ca2d6', 'EI-XLD', 'Boeing', 'Boeing 747-4H6', 'b744'),
+        ('abc123', 'G-CIVA', 'Boeing', 'Boeing 747-436', 'B744'),
+        ('3c6444', 'D-ABYA', 'Boeing', 'Boeing 747-830', 'B748'),
+    ])
+    assert ensure_database_updated(first, db_file) == 3
+    assert aircraft(db_file)[0] == ('3c6444', 'D-ABYA', 'Boeing 747-830', 'B748')
+
+    second = write_csv(tmp_path / 'v2.csv', [
+        ('4ca2d6', 'EI-XLD', 'Boeing', 'Boeing 747-4H6', 'b744'),  # unchanged
+        ('abc123', 'G-CIVB', 'Boeing', 'Boeing 747-436', 'B744'),  # re-registered
+        ('a1b2c3', 'N747BA', 'Boeing', 'Boeing 747-400', 'B744'),  # new
+    ])
+    assert csv_to_sqlite(second, db_file, STAGING_TABLE_NAME)
+    assert apply_aircraft_diff(db_file) == (1, 1, 1)
+    assert aircraft(db_file) == [
+        ('4ca2d6', 'EI-XLD', 'Boeing 747-4H6', 'B744'),
+        ('a1b2c3', 'N747BA', 'Boeing 747-400', 'B744'),
+        ('abc123', 'G-CIVB', 'Boeing 747-436', 'B744'),
+    ]
+
+    # The same dataset again changes nothing and leaves no staging table behind
+    assert ensure_database_updated(second, db_file) == 0
+    with closing(sqlite3.connect(db_file)) as conn:
+        assert [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")] == [TABLE_NAME]
+
+
+def test_changed_columns_replace_the_table(tmp_path, db_file):
+    ensure_database_updated(write_csv(tmp_path / 'v1.csv', [('4ca2d6', 'EI-XLD', 'Boeing', '747-4H6', 'B744')]),
+                            db_file)
+    path = tmp_path / 'v2.csv'
+    path.write_text("'icao24','typecode'\n'abc123','B748'\n'def456','B744'\n")
+    assert ensure_database_updated(str(path), db_file) == 2
+    with closing(sqlite3.connect(db_file)) as conn:
+        assert sorted(conn.execute(f"SELECT icao24, typecode FROM {TABLE_NAME}")) == [('abc123', 'B748'),
+                                                                                      ('def456', 'B744')]
+
+
+def test_prefix_ranges_match_like(tmp_path, db_file):
+    ensure_database_updated(write_csv(tmp_path / 'fleet.csv', [
+        ('000001', 'A', 'Boeing', 'Boeing 747-4H6', 'b744'),
+        ('000002', 'B', 'The Boeing Company', 'Boeing 747-8F', 'B748'),
+        ('000003', 'C', 'Boeing', '747SP-27', 'B74S'),
+        ('000004', 'D', 'Boeing', '767-300', 'B763'),
+        ('000005', 'E', 'Airbus', 'A380-841', 'A388'),
+        ('000006', 'F', 'Boeing', '7470', 'B7Z'),
+        ('000007', 'G', 'Unknown', '', ''),
+    ]), db_file)
+    assert prefix_range(' b74 ') == ('B74', 'B75')
+
+    def icao24s(**prefixes):
+        return sorted(row[0] for row in query_fleet(db_file, **prefixes)[1])
+
+    assert icao24s(typecode_prefixes=['B74']) == ['000001', '000002', '000003']
+    assert icao24s(typecode_prefixes=['b7z']) == ['000006']
+    assert icao24s(model_prefixes=['747-']) == ['000001', '000002']
+    assert icao24s(typecode_prefixes=['A38'], model_prefixes=['747SP']) == ['000003', '000005']
+    assert icao24s(model_prefixes=['747']) == ['000001', '000002', '000003', '000006']
+
+    # Same answer as the LIKE scans the ranges replaced
+    with closing(sqlite3.connect(db_file)) as conn:
+        for prefix in ('B7', 'B74', 'B748', 'A', 'Z'):
+            where, params = fleet_filter_clause(typecode_prefixes=[prefix])
+            ranged = conn.execute(f"SELECT icao24 FROM {TABLE_NAME} WHERE {where} ORDER BY 1", params).fetchall()
+            like = conn.execute(f"SELECT icao24 FROM {TABLE_NAME} WHERE typecode_norm LIKE ? ORDER BY 1",
+                                (prefix + '%',)).fetchall()
+            assert ranged == like
+        plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT icao24 FROM {TABLE_NAME} WHERE {where}", params).fetchall()
+        assert all('USING INDEX' in row[-1] for row in plan)
+    with pytest.raises(ValueError):
+        fleet_filter_clause(typecode_prefixes=[' '])
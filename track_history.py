@@ -0,0 +1,203 @@
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from airport_index import distance, EARTH_RADIUS_KM
+
+# Recent positions of every tracked aircraft, kept in one preallocated
+# array('d'): a fixed number of slots (aircraft), each a ring buffer of
+# POINTS_PER_AIRCRAFT points of FIELD_COUNT doubles. Missing values are NaN.
+# When every slot is taken the least recently seen aircraft is evicted, so
+# memory is fixed no matter how long the bot runs.
+
+FIELDS = ('time', 'latitude', 'longitude', 'altitude', 'velocity', 'true_track', 'vertical_rate', 'on_ground')
+FIELD_COUNT = len(FIELDS)
+TIME, LATITUDE, LONGITUDE, ALTITUDE, VELOCITY, TRACK, VERTICAL_RATE, ON_GROUND = range(FIELD_COUNT)
+
+MAX_AIRCRAFT = 2048
+POINTS_PER_AIRCRAFT = 64
+SMOOTHING_WINDOW = 300  # seconds of track used for smoothed velocity
+MIN_ETA_SPEED_MS = 50  # below this the aircraft is not en route, no ETA
+# A first sighting below this altitude and climbing is extrapolated back to
+# where the climb started
+BACKFILL_MAX_ALTITUDE_M = 3000
+BACKFILL_MIN_CLIMB_MS = 1.0
+BACKFILL_MAX_SECONDS = 900
+CLIMB_SPEED_FACTOR = 0.75  # average ground speed over the climb vs the speed when first seen
+GROUND_ALTITUDE_M = 300
+GROUND_VELOCITY_MS = 60
+
+NAN = float('nan')
+
+
+def _value(value):
+    return NAN if value is None else float(value)
+
+
+def _optional(value):
+    return None if math.isnan(value) else value
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    # Initial great-circle bearing in degrees from point 1 to point 2
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    x = math.sin(lon2 - lon1) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
+    return math.degrees(math.atan2(x, y)) % 360
+
+
+def destination_point(lat, lon, bearing_deg, km):
+    lat, lon, theta = map(math.radians, (lat, lon, bearing_deg))
+    delta = km / EARTH_RADIUS_KM
+    lat2 = math.asin(math.sin(lat) * math.cos(delta) + math.cos(lat) * math.sin(delta) * math.cos(theta))
+    lon2 = lon + math.atan2(math.sin(theta) * math.sin(delta) * math.cos(lat),
+                            math.cos(delta) - math.sin(lat) * math.sin(lat2))
+    return math.degrees(lat2), (math.degrees(lon2) + 540) % 360 - 180
+
+
+class TrackHistory:
+
+    def __init__(self, max_aircraft=MAX_AIRCRAFT, points_per_aircraft=POINTS_PER_AIRCRAFT):
+        self.max_aircraft = max_aircraft
+        self.points = points_per_aircraft
+        self._data = array('d', [NAN]) * (max_aircraft * points_per_aircraft * FIELD_COUNT)
+        self._heads = array('l', [0]) * max_aircraft  # next write position per slot
+        self._counts = array('l', [0]) * max_aircraft
+        self._slots = OrderedDict()  # icao24 -> slot, least recently seen first
+        self._free = list(range(max_aircraft - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, icao24):
+        return icao24 in self._slots
+
+    @property
+    def nbytes(self):
+        return (self._data.itemsize * len(self._data)
+                + self._heads.itemsize * len(self._heads) + self._counts.itemsize * len(self._counts))
+
+    def _slot_for(self, icao24):
+        slot = self._slots.get(icao24)
+        if slot is not None:
+            self._slots.move_to_end(icao24)
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            _, slot = self._slots.popitem(last=False)
+        self._heads[slot] = 0
+        self._counts[slot] = 0
+        self._slots[icao24] = slot
+        return slot
+
+    def _offset(self, slot, index):
+        # index 0 is the oldest point held for the slot
+        position = (self._heads[slot] - self._counts[slot] + index) % self.points
+        return (slot * self.points + position) * FIELD_COUNT
+
+    def record(self, flight_data):
+        # Adds one state (a main.build_flight_data dict). States without a
+        # position, or not newer than the last point, are ignored.
+        if flight_data.get('latitude') is None or flight_data.get('longitude') is None:
+            return False
+        timestamp = flight_data.get('last_contact')
+        if timestamp is None:
+            return False
+        with self._lock:
+            slot = self._slot_for(flight_data['icao24'])
+            count = self._counts[slot]
+            if count and self._data[self._offset(slot, count - 1) + TIME] >= timestamp:
+                return False
+            offset = (slot * self.points + self._heads[slot]) * FIELD_COUNT
+            on_ground = flight_data.get('on_ground')
+            self._data[offset:offset + FIELD_COUNT] = array('d', (
+                float(timestamp), float(flight_data['latitude']), float(flight_data['longitude']),
+                _value(flight_data.get('altitude')), _value(flight_data.get('velocity')),
+                _value(flight_data.get('true_track')), _value(flight_data.get('vertical_rate')),
+                NAN if on_ground is None else float(bool(on_ground)),
+            ))
+            self._heads[slot] = (self._heads[slot] + 1) % self.points
+            self._counts[slot] = min(count + 1, self.points)
+            return True
+
+    def record_many(self, flights_data):
+        return sum(1 for flight_data in flights_data if self.record(flight_data))
+
+    def forget(self, icao24):
+        with self._lock:
+            slot = self._slots.pop(icao24, None)
+            if slot is not None:
+                self._counts[slot] = 0
+                self._free.append(slot)
+
+    def points_for(self, icao24):
+        # Oldest first; each point is a tuple in FIELDS order (None for missing values)
+        with self._lock:
+            slot = self._slots.get(icao24)
+            if slot is None:
+                return []
+            result = []
+            for index in range(self._counts[slot]):
+                offset = self._offset(slot, index)
+                result.append(tuple(_optional(value) for value in self._data[offset:offset + FIELD_COUNT]))
+            return result
+
+    def latest(self, icao24):
+        points = self.points_for(icao24)
+        return points[-1] if points else None
+
+    def takeoff_point(self, icao24):
+        # Where the current flight left the ground: (latitude, longitude, time).
+        # The last on-ground (or low and slow) point before the aircraft got
+        # airborne when the track has one, otherwise the first airborne
+        # sighting extrapolated back along its climb. None when neither is known.
+        points = self.points_for(icao24)
+        if not points:
+            return None
+        for point in reversed(points[:-1]):
+            low_and_slow = (point[ALTITUDE] is not None and point[ALTITUDE] < GROUND_ALTITUDE_M
+                            and point[VELOCITY] is not None and point[VELOCITY] < GROUND_VELOCITY_MS)
+            if point[ON_GROUND] or low_and_slow:
+                return point[LATITUDE], point[LONGITUDE], point[TIME]
+
+        first = points[0]
+        altitude, climb = first[ALTITUDE], first[VERTICAL_RATE]
+        if altitude is None or altitude > BACKFILL_MAX_ALTITUDE_M:
+            return None
+        if climb is None or climb < BACKFILL_MIN_CLIMB_MS or first[VELOCITY] is None or first[TRACK] is None:
+            return first[LATITUDE], first[LONGITUDE], first[TIME]
+        seconds = min(BACKFILL_MAX_SECONDS, altitude / climb)
+        km = first[VELOCITY] * CLIMB_SPEED_FACTOR * seconds / 1000
+        lat, lon = destination_point(first[LATITUDE], first[LONGITUDE], (first[TRACK] + 180) % 360, km)
+        return lat, lon, first[TIME] - seconds
+
+    def smoothed_velocity(self, icao24, window=SMOOTHING_WINDOW):
+        # (ground speed m/s, track degrees, climb rate m/s) from positions over
+        # the last window seconds; falls back to the reported values when the
+        # track is too short. None for an unknown aircraft.
+        points = self.points_for(icao24)
+        if not points:
+            return None
+        newest = points[-1]
+        oldest = next((point for point in points if newest[TIME] - point[TIME] <= window), newest)
+        elapsed = newest[TIME] - oldest[TIME]
+        if elapsed <= 0:
+            return newest[VELOCITY], newest[TRACK], newest[VERTICAL_RATE]
+        km = distance(oldest[LATITUDE], oldest[LONGITUDE], newest[LATITUDE], newest[LONGITUDE])
+        track = bearing(oldest[LATITUDE], oldest[LONGITUDE], newest[LATITUDE], newest[LONGITUDE]) if km > 0 else newest[TRACK]
+        climb = None
+        if oldest[ALTITUDE] is not None and newest[ALTITUDE] is not None:
+            climb = (newest[ALTITUDE] - oldest[ALTITUDE]) / elapsed
+        return km * 1000 / elapsed, track, climb
+
+    def eta(self, icao24, latitude, longitude):
+        # Unix time the aircraft reaches (latitude, longitude) at its smoothed
+        # ground speed, or None when it is unknown or not moving
+        newest = self.latest(icao24)
+        velocity = self.smoothed_velocity(icao24)
+        if newest is None or velocity is None or velocity[0] is None or velocity[0] < MIN_ETA_SPEED_MS:
+            return None
+        km = distance(newest[LATITUDE], newest[LONGITUDE], latitude, longitude)
+        return newest[TIME] + km * 1000 / velocity[0]
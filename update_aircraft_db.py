@@ -6,6 +6,8 @@ from bs4 import BeautifulSoup
 from contextlib import closing
 import csv
 import logging
+from itertools import islice
+from fleets import load_fleets
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,8 +17,18 @@ logger = logging.getLogger(__name__)
 BASE_URL = "https://opensky-network.org/datasets/metadata/"
 DB_FILENAME = "aircraftData.db"
 TABLE_NAME = "aircraft_type"
+STAGING_TABLE_NAME = "aircraft_type_staging"
 LOG_FILENAME = "download_log.txt"
-BOEING_747_CSV = "boeing_747_icao.csv"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes written to disk per read
+IMPORT_BATCH_SIZE = 10000  # rows per executemany call
+DOWNLOAD_TIMEOUT = (10, 120)  # connect, read seconds
+# Columns indexed after the import, matched by substring
+INDEXED_COLUMNS = ('icao24', 'manufacturer', 'model', 'typecode')
+# Uppercased, trimmed copies of typecode and model (model without the
+# manufacturer's name) added during import, so fleet filters are index range
+# scans on prefixes instead of LIKE '%...%' full scans
+TYPECODE_NORM_COLUMN = 'typecode_norm'
+MODEL_NORM_COLUMN = 'model_norm'
 
 def get_latest_csv_version(base_url):
     logger.info("Fetching the latest dataset version...")
@@ -40,40 +52,120 @@ def get_latest_csv_version(base_url):
         return None
 
 def download_csv(url, filename):
+    # Streams to a .part file so memory stays flat and an interrupted
+    # download never leaves a truncated CSV behind
     logger.info(f"Downloading {url}...")
+    partial = filename + '.part'
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-        logger.info("Download completed.")
+        with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            size = 0
+            with open(partial, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(partial, filename)
+        logger.info(f"Download completed ({size / 1024 / 1024:.1f} MiB).")
         return True
     except Exception as e:
         logger.error(f"Failed to download the file: {e}")
+        if os.path.exists(partial):
+            os.remove(partial)
         return False
 
-def csv_to_sqlite(csv_file, db_file):
-    logger.info(f"Converting the entire CSV {csv_file} to SQLite with table {TABLE_NAME}...")
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def find_column(columns, key):
+    return next((col for col in columns if key in col.lower()), None)
+
+def normalize_typecode(typecode):
+    return typecode.strip().upper() or None if typecode else None
+
+def normalize_model(model, manufacturer=None):
+    # "Boeing 747-4R7F" made by "The Boeing Company" -> "747-4R7F"
+    if not model:
+        return None
+    words = model.strip().upper().split()
+    maker_words = set(manufacturer.upper().split()) if manufacturer else set()
+    while len(words) > 1 and words[0] in maker_words:
+        words.pop(0)
+    return ' '.join(words) or None
+
+def read_aircraft_csv(csv_file):
+    # Yields the header, then one row per record, with the normalized typecode
+    # and model columns appended. Rows with the wrong number of fields are
+    # skipped and empty fields become NULL, as pandas did.
+    with open(csv_file, newline='', encoding='utf-8', errors='replace') as f:
+        reader = csv.reader(f, quotechar="'", escapechar='\\')
+        header = [name.replace("'", "").strip() for name in next(reader)]
+        typecode_at = header.index(find_column(header, 'typecode')) if find_column(header, 'typecode') else None
+        model_at = header.index(find_column(header, 'model')) if find_column(header, 'model') else None
+        manufacturer_at = header.index(find_column(header, 'manufacturername')) if find_column(header, 'manufacturername') else None
+        yield header + [TYPECODE_NORM_COLUMN, MODEL_NORM_COLUMN]
+        skipped = 0
+        for row in reader:
+            if len(row) != len(header):
+                skipped += 1
+                continue
+            row = [value if value != '' else None for value in row]
+            row.append(normalize_typecode(row[typecode_at]) if typecode_at is not None else None)
+            row.append(normalize_model(row[model_at], row[manufacturer_at] if manufacturer_at is not None else None)
+                       if model_at is not None else None)
+            yield row
+        if skipped:
+            logger.warning(f"Skipped {skipped} malformed lines in {csv_file}")
+
+def create_indexes(conn, table_name, columns):
+    for name in columns:
+        if any(key in name.lower() for key in INDEXED_COLUMNS):
+            index_name = quote_identifier(f"idx_{table_name}_{name.lower()}")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({quote_identifier(name)})")
+
+def csv_to_sqlite(csv_file, db_file, table_name=TABLE_NAME):
+    # Batched import in a single transaction; memory use is one batch of rows
+    logger.info(f"Converting the entire CSV {csv_file} to SQLite with table {table_name}...")
     try:
-        df = pd.read_csv(csv_file, low_memory=False, on_bad_lines='skip', quotechar="'", escapechar='\\')
-        
-        # Remove quotes from column names
-        df.columns = df.columns.str.replace("'", "")
-        
-        with closing(sqlite3.connect(db_file)) as conn:
-            df.to_sql(TABLE_NAME, conn, if_exists='replace', index=False)
-        logger.info(f"SQLite database updated with {TABLE_NAME} data.")
+        rows = read_aircraft_csv(csv_file)
+        columns = next(rows)
+        column_list = ', '.join(quote_identifier(name) for name in columns)
+        insert = f"INSERT INTO {table_name} ({column_list}) VALUES ({', '.join('?' * len(columns))})"
+
+        with closing(sqlite3.connect(db_file, isolation_level=None)) as conn:
+            # The file also holds the live aircraft table, so the import keeps the
+            # default rollback journal: a crash mid-import rolls the staging table
+            # back instead of risking the whole database. One transaction keeps it fast.
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("BEGIN")
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+                conn.execute(f"CREATE TABLE {table_name} ({', '.join(quote_identifier(name) + ' TEXT' for name in columns)})")
+                count = 0
+                while True:
+                    batch = list(islice(rows, IMPORT_BATCH_SIZE))
+                    if not batch:
+                        break
+                    conn.executemany(insert, batch)
+                    count += len(batch)
+                # Indexes are built once after the load, which is much faster than maintaining them per row
+                create_indexes(conn, table_name, columns)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        logger.info(f"SQLite database updated with {count} rows of {table_name} data.")
         return True
     except Exception as e:
         logger.error(f"An error occurred while converting CSV to SQLite: {e}")
         return False
 
-def get_column_names(db_file):
+def get_column_names(db_file, table_name=TABLE_NAME):
     logger.info("Getting column names from the database...")
     try:
         with closing(sqlite3.connect(db_file)) as conn:
             cursor = conn.cursor()
-            cursor.execute(f"PRAGMA table_info({TABLE_NAME})")
+            cursor.execute(f"PRAGMA table_info({table_name})")
             columns = [row[1] for row in cursor.fetchall()]
             logger.info(f"Column names: {columns}")
             return columns
@@ -96,70 +188,70 @@ def print_sample(db_file, columns):
     except Exception as e:
         logger.error(f"An error occurred while printing sample data: {e}")
 
-def filter_boeing_747(db_file, columns):
-    logger.info("Filtering for Boeing 747 aircraft...")
-    try:
-        with closing(sqlite3.connect(db_file)) as conn:
-            # Check total number of records
-            total_count = pd.read_sql_query(f"SELECT COUNT(*) FROM {TABLE_NAME}", conn).iloc[0, 0]
-            logger.info(f"Total records in database: {total_count}")
-
-            # Determine which columns to use for filtering
-            manufacturer_col = next((col for col in columns if 'manufacturer' in col.lower()), None)
-            model_col = next((col for col in columns if 'model' in col.lower()), None)
-            type_col = next((col for col in columns if 'type' in col.lower()), None)
-
-            if not all([manufacturer_col, model_col, type_col]):
-                logger.error("Could not find necessary columns for filtering")
-                return False
-
-            # Check for any Boeing aircraft
-            boeing_query = f"""
-            SELECT COUNT(*) FROM {TABLE_NAME} 
-            WHERE LOWER({manufacturer_col}) LIKE '%boeing%' 
-               OR LOWER({model_col}) LIKE '%boeing%'
-               OR LOWER({type_col}) LIKE 'b7%'
-            """
-            boeing_count = pd.read_sql_query(boeing_query, conn).iloc[0, 0]
-            logger.info(f"Total Boeing aircraft: {boeing_count}")
-
-            # Check for 747 in any field
-            query_747 = f"""
-            SELECT COUNT(*) FROM {TABLE_NAME} 
-            WHERE LOWER({model_col}) LIKE '%747%' 
-               OR LOWER({type_col}) LIKE '%747%' 
-               OR LOWER({type_col}) LIKE 'b74%'
-            """
-            count_747 = pd.read_sql_query(query_747, conn).iloc[0, 0]
-            logger.info(f"Total aircraft with '747' in any field: {count_747}")
+def prefix_range(prefix):
+    # Bounds such that lower <= value < upper holds for every value starting with prefix
+    prefix = prefix.strip().upper()
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
-            # Updated query to be more inclusive
-            icao24_col = next((col for col in columns if 'icao24' in col.lower()), None)
-            registration_col = next((col for col in columns if 'registration' in col.lower()), None)
+def fleet_filter_clause(typecode_prefixes=(), model_prefixes=()):
+    # One WHERE clause for any aircraft type; each term is a range on an
+    # indexed normalized column, so SQLite answers it with index lookups
+    terms = []
+    params = []
+    for column, prefixes in ((TYPECODE_NORM_COLUMN, typecode_prefixes), (MODEL_NORM_COLUMN, model_prefixes)):
+        for prefix in prefixes:
+            if prefix.strip():
+                terms.append(f"({column} >= ? AND {column} < ?)")
+                params.extend(prefix_range(prefix))
+    if not terms:
+        raise ValueError("A fleet filter needs at least one typecode or model prefix")
+    return ' OR '.join(terms), params
 
-            query = f"""
-            SELECT {icao24_col}, {registration_col}, {manufacturer_col}, {model_col}, {type_col}
-            FROM {TABLE_NAME} 
-            WHERE LOWER({model_col}) LIKE '%747%' 
-               OR LOWER({type_col}) LIKE '%747%' 
-               OR LOWER({type_col}) LIKE 'b74%'
-               OR (LOWER({manufacturer_col}) LIKE '%boeing%' AND LOWER({model_col}) LIKE '%747%')
-            """
-            df = pd.read_sql_query(query, conn)
-        
-        if df.empty:
-            logger.warning("No Boeing 747 aircraft found in the database.")
-            return False
+def query_fleet(db_file, typecode_prefixes=(), model_prefixes=()):
+    # Returns (columns, rows) of the aircraft matching the filter
+    columns = get_column_names(db_file)
+    selected = [col for col in (find_column(columns, key) for key in ('icao24', 'registration', 'manufacturername', 'model', 'typecode')) if col]
+    where, params = fleet_filter_clause(typecode_prefixes, model_prefixes)
+    with closing(sqlite3.connect(db_file)) as conn:
+        rows = conn.execute(f"SELECT {', '.join(quote_identifier(col) for col in selected)} FROM {TABLE_NAME} WHERE {where}", params).fetchall()
+    return selected, rows
 
-        df.to_csv(BOEING_747_CSV, index=False)
-        logger.info(f"Boeing 747 aircraft data saved to {BOEING_747_CSV}")
-        logger.info(f"Number of Boeing 747 aircraft: {len(df)}")
-        logger.info("Sample of found aircraft:")
-        logger.info(df.head().to_string())
-        return True
-    except Exception as e:
-        logger.error(f"An error occurred while filtering Boeing 747 data: {e}")
+def export_fleet(db_file, csv_file, typecode_prefixes=(), model_prefixes=()):
+    # Writes the fleet CSV read by the bot; returns the number of aircraft
+    columns, rows = query_fleet(db_file, typecode_prefixes, model_prefixes)
+    if not rows:
+        return 0
+    # Written next to the target and renamed, so a running bot never reads a partial file
+    with open(csv_file + '.tmp', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    os.replace(csv_file + '.tmp', csv_file)
+    return len(rows)
+
+def export_fleets(db_file, columns):
+    # Exports every configured fleet that has a filter; the 747 fleet is the default
+    if MODEL_NORM_COLUMN not in columns:
+        logger.error("Database has no normalized columns; re-import the aircraft CSV")
         return False
+    exported = False
+    for fleet in load_fleets():
+        if not fleet.filter or not fleet.csv_path:
+            continue
+        try:
+            count = export_fleet(db_file, fleet.csv_path, **fleet.filter)
+        except Exception as e:
+            logger.error(f"An error occurred while exporting fleet {fleet.name}: {e}")
+            return False
+        if not count:
+            logger.warning(f"No aircraft found for fleet {fleet.name}.")
+            return False
+        logger.info(f"Fleet {fleet.name}: {count} aircraft saved to {fleet.csv_path}")
+        exported = True
+    return exported
+
+def fleet_csvs_exist():
+    return all(os.path.exists(fleet.csv_path) for fleet in load_fleets() if fleet.filter and fleet.csv_path)
 
 def check_csv_structure(csv_file):
     logger.info(f"Checking structure of CSV file: {csv_file}")
@@ -172,9 +264,94 @@ def check_csv_structure(csv_file):
         logger.error(f"An error occurred while checking CSV structure: {e}")
         return False
 
+def get_recorded_version():
+    # The dataset filename the database was last built from, if any
+    try:
+        with open(LOG_FILENAME) as log_file:
+            return log_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def record_version(version):
+    # Written only after a successful update, atomically, so a failed run is retried next time
+    with open(LOG_FILENAME + '.tmp', 'w') as log_file:
+        log_file.write(version)
+    os.replace(LOG_FILENAME + '.tmp', LOG_FILENAME)
+
+def apply_aircraft_diff(db_file):
+    # Applies the staged import to the live table as a diff keyed on icao24.
+    # Every aircraft whose rows differ is deleted and re-inserted from the
+    # staging table, in one transaction. Returns (inserted, updated, deleted).
+    columns = get_column_names(db_file)
+    staged_columns = get_column_names(db_file, STAGING_TABLE_NAME)
+    icao24_col = next((col for col in staged_columns if 'icao24' in col.lower()), None)
+    if icao24_col is None:
+        raise ValueError("Staged aircraft data has no icao24 column")
+    key = quote_identifier(icao24_col)
+
+    with closing(sqlite3.connect(db_file, isolation_level=None)) as conn:
+        if columns != staged_columns:
+            # First import, or the dataset's columns changed: the staged table becomes the live one
+            logger.info("Aircraft table is new or its columns changed; replacing it.")
+            conn.execute("BEGIN")
+            try:
+                conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
+                conn.execute(f"ALTER TABLE {STAGING_TABLE_NAME} RENAME TO {TABLE_NAME}")
+                # Indexes keep their staging names across the rename
+                for (index_name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (TABLE_NAME,)).fetchall():
+                    conn.execute(f"DROP INDEX {quote_identifier(index_name)}")
+                create_indexes(conn, TABLE_NAME, staged_columns)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            total = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}").fetchone()[0]
+            return total, 0, 0
+
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DROP TABLE IF EXISTS temp.changed_aircraft")
+            conn.execute(f"""
+                CREATE TEMP TABLE changed_aircraft AS
+                SELECT {key} AS icao24 FROM (SELECT * FROM {STAGING_TABLE_NAME} EXCEPT SELECT * FROM {TABLE_NAME})
+                UNION
+                SELECT {key} FROM (SELECT * FROM {TABLE_NAME} EXCEPT SELECT * FROM {STAGING_TABLE_NAME})
+            """)
+            inserted = conn.execute(f"""
+                SELECT COUNT(*) FROM changed_aircraft
+                WHERE icao24 NOT IN (SELECT {key} FROM {TABLE_NAME} WHERE {key} IS NOT NULL)
+            """).fetchone()[0]
+            deleted = conn.execute(f"""
+                SELECT COUNT(*) FROM changed_aircraft
+                WHERE icao24 NOT IN (SELECT {key} FROM {STAGING_TABLE_NAME} WHERE {key} IS NOT NULL)
+            """).fetchone()[0]
+            changed = conn.execute("SELECT COUNT(*) FROM changed_aircraft").fetchone()[0]
+            conn.execute(f"DELETE FROM {TABLE_NAME} WHERE {key} IN (SELECT icao24 FROM changed_aircraft)")
+            conn.execute(f"""
+                INSERT INTO {TABLE_NAME} SELECT * FROM {STAGING_TABLE_NAME}
+                WHERE {key} IN (SELECT icao24 FROM changed_aircraft)
+            """)
+            conn.execute(f"DROP TABLE {STAGING_TABLE_NAME}")
+            conn.execute("DROP TABLE changed_aircraft")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return inserted, changed - inserted - deleted, deleted
+
 def ensure_database_updated(csv_file, db_file):
+    # Returns the number of aircraft that changed, or None on failure
     logger.info(f"Ensuring database {db_file} is up to date...")
-    return csv_to_sqlite(csv_file, db_file)
+    if not csv_to_sqlite(csv_file, db_file, STAGING_TABLE_NAME):
+        return None
+    try:
+        inserted, updated, deleted = apply_aircraft_diff(db_file)
+    except Exception as e:
+        logger.error(f"An error occurred while applying the aircraft diff: {e}")
+        return None
+    logger.info(f"Aircraft table updated: {inserted} inserted, {updated} updated, {deleted} deleted.")
+    return inserted + updated + deleted
 
 def main():
     latest_version = get_latest_csv_version(BASE_URL)
@@ -182,20 +359,38 @@ def main():
         latest_csv_url = BASE_URL + latest_version
         latest_csv_filename = latest_version.split('/')[-1]
 
+        columns = get_column_names(DB_FILENAME)
+        if latest_csv_filename == get_recorded_version() and columns:
+            if fleet_csvs_exist():
+                logger.info(f"Aircraft database is already at {latest_csv_filename}. Nothing to do.")
+            elif export_fleets(DB_FILENAME, columns):
+                # A fleet was added to config.FLEETS since the last update
+                logger.info(f"Aircraft database is already at {latest_csv_filename}; missing fleet CSV files created.")
+            else:
+                logger.error("Failed to create the missing fleet CSV files.")
+            return
+
         if not os.path.exists(latest_csv_filename):
             if not download_csv(latest_csv_url, latest_csv_filename):
                 logger.error("Failed to download the latest version.")
                 return
 
+        updated = False
         if check_csv_structure(latest_csv_filename):
-            if ensure_database_updated(latest_csv_filename, DB_FILENAME):
+            changes = ensure_database_updated(latest_csv_filename, DB_FILENAME)
+            if changes is not None:
                 columns = get_column_names(DB_FILENAME)
                 if columns:
                     print_sample(DB_FILENAME, columns)
-                    if filter_boeing_747(DB_FILENAME, columns):
-                        logger.info("Boeing 747 CSV file created/updated.")
+                    if not changes and fleet_csvs_exist():
+                        # A running bot reloads fleet CSVs on change, so leave them untouched
+                        logger.info("No aircraft changed; fleet CSV files left as is.")
+                        updated = True
+                    elif export_fleets(DB_FILENAME, columns):
+                        logger.info("Fleet CSV files created/updated.")
+                        updated = True
                     else:
-                        logger.error("Failed to create/update Boeing 747 CSV file.")
+                        logger.error("Failed to create/update the fleet CSV files.")
                 else:
                     logger.error("Failed to get column names from the database.")
             else:
@@ -208,9 +403,9 @@ def main():
             os.remove(latest_csv_filename)
             logger.info("Cleanup complete.")
 
-        # Update log file
-        with open(LOG_FILENAME, 'w') as log_file:
-            log_file.write(latest_csv_filename)
+        # Only a completed update is recorded, so a failed one is retried next run
+        if updated:
+            record_version(latest_csv_filename)
     else:
         logger.error("Failed to identify latest version.")
 
@@ -4,6 +4,7 @@ import schedule
 import time
 import logging
 from datetime import datetime
+from airport_data import write_compact_airport_db
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,6 +13,7 @@ logger = logging.getLogger(__name__)
 # Constants
 AIRPORT_DB_URL = "https://raw.githubusercontent.com/mwgg/Airports/master/airports.json"
 LOCAL_DB_FILENAME = "airport_db.json"
+COMPACT_DB_FILENAME = "airport_db.bin"
 LOG_FILENAME = "airport_db_update_log.txt"
 
 def fetch_airport_data():
@@ -37,11 +39,13 @@ def process_airport_data(data):
         }
     return processed_data
 
-def save_airport_data(data):
-    logger.info(f"Saving airport data to {LOCAL_DB_FILENAME}...")
+def save_airport_data(data, include_index=True):
+    logger.info(f"Saving airport data to {LOCAL_DB_FILENAME} and {COMPACT_DB_FILENAME}...")
     try:
         with open(LOCAL_DB_FILENAME, 'w') as f:
             json.dump(data, f)
+        # Columnar copy that main.py memory-maps instead of parsing the JSON
+        write_compact_airport_db(data, COMPACT_DB_FILENAME, include_index=include_index)
         logger.info("Airport data saved successfully.")
         return True
     except IOError as e: